@@ -1,13 +1,13 @@
-/////////////downloaded image script with .csv file////////////////////
+# /////////////downloaded image script with .csv file////////////////////
 import os
-import csv
-import requests
-import chardet
-import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.images import download_images, read_csv
+from recipe_common.renditions import DEFAULT_RENDITIONS, render_store
  
 # Define the folder to save images
 save_folder = "jamieoliver_recipe_images"
-os.makedirs(save_folder, exist_ok=True)
  
 # Path to the CSV file
 csv_file_path = "/content/jamieoliver_recipes.csv"  # Updated to use the uploaded file
@@ -15,59 +15,18 @@ csv_file_path = "/content/jamieoliver_recipes.csv"  # Updated to use the uploade
 # Log file for errors
 log_file_path = "download_errors_jamieoliver_recipes.log"
  
-# Detect encoding of the CSV file
-def detect_encoding(file_path):
-    with open(file_path, "rb") as f:
-        raw_data = f.read(10000)  # Read a sample of the file
-        result = chardet.detect(raw_data)
-        return result["encoding"]
+# Set to True to also make the thumbnail, medium and WebP renditions for the PIM (needs pillow)
+make_renditions = False
  
-# Function to check if a URL is valid and points to an image
-def is_valid_image_url(url):
-    if not re.match(r'https?://\S+', url):
-        return False
-    return url.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'))
+if __name__ == "__main__":
+    # Rows are read one at a time; images already in the folder are skipped and
+    # half-downloaded ones are resumed, so rerunning after an interruption is cheap
+    rows = read_csv(csv_file_path, "product_number", "image_url")
+    stats = download_images(rows, save_folder, log_file_path, max_concurrency=32, per_host_concurrency=8)
  
-# Function to download and save images
-def download_image(recipe_name, image_url):
-    headers = {"User-Agent": "Mozilla/5.0"}  # Mimic a browser request
-    try:
-        response = requests.get(image_url, headers=headers, stream=True, timeout=10)
-        if response.status_code == 200:
-            # Create a valid filename
-            filename = f"{recipe_name}.jpg".replace("/", "_").replace(" ", "_")
-            image_path = os.path.join(save_folder, filename)
+    print(f"Download complete! {stats}")
+    print(f"Errors are logged in '{log_file_path}'.")
  
-            with open(image_path, "wb") as file:
-                for chunk in response.iter_content(1024):
-                    file.write(chunk)
-            print(f"Downloaded: {recipe_name}")
-        else:
-            log_error(recipe_name, image_url, f"HTTP {response.status_code}")
-    except Exception as e:
-        log_error(recipe_name, image_url, str(e))
- 
-# Function to log errors
-def log_error(recipe_name, image_url, error_message):
-    with open(log_file_path, "a", encoding="utf-8") as log_file:
-        log_file.write(f"{recipe_name} -> {image_url} : {error_message}\n")
-    print(f"Failed to download: {recipe_name} - {error_message}")
- 
-# Detect encoding
-detected_encoding = detect_encoding(csv_file_path)
-print(f"Detected Encoding: {detected_encoding}")
- 
-# Read CSV and process each row
-with open(csv_file_path, newline="", encoding=detected_encoding, errors="replace") as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        recipe_name = row["product_number"].strip()
-        image_url = row["image_url"].strip()
- 
-        if is_valid_image_url(image_url):
-            download_image(recipe_name, image_url)
-        else:
-            log_error(recipe_name, image_url, "Invalid image URL")
- 
-print("Download complete! Errors are logged in 'download_errors_jamieoliver_recipes.log'.")
- 
\ No newline at end of file
+    # Only images that are new or changed since the last run are rendered again
+    if make_renditions:
+        print(f"Renditions: {render_store(save_folder, DEFAULT_RENDITIONS)}")
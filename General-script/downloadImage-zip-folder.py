@@ -1,4 +1,14 @@
-//////download zip image folder//////////////
-import shutil
+# //////download zip image folder//////////////
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.images import download_images, read_rows
  
-shutil.make_archive("/content/addapinch_recipe_images", "zip", "/content/addapinch_recipe_images")
\ No newline at end of file
+# The images are written into the zip as they are downloaded (stored, since JPEGs do not
+# compress), so nothing is read back from disk afterwards. Each part is capped at 2 GB
+# and the manifest next to it lists the entry of every recipe.
+rows = read_rows("/content/addapinch_recipes.csv", "product_number", "image_url")
+stats = download_images(rows, "/content/addapinch_recipe_images.zip", "download_errors_addapinch_recipes.log",
+                        max_part_bytes=2 * 1024 ** 3)
+print(f"Download complete! {stats}")
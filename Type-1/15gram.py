@@ -1,162 +1,208 @@
-import requests
-import time
-import pandas as pd
-from bs4 import BeautifulSoup
-
-def get_all_recipe_links(base_url):
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.archive import WarcArchive
+from recipe_common.cache import ResponseCache
+from recipe_common.fetch import FetchEngine, run_sync
+from recipe_common.frontier import Frontier
+from recipe_common.jsonld import fill_missing, find_recipe, recipe_fields
+from recipe_common.pagination import paginate
+from recipe_common.parsing import make_soup
+from recipe_common.pipeline import drain_site
+from recipe_common.plan import Field, SelectorPlan
+from recipe_common.registry import register_site
+from recipe_common.sink import open_sink
+
+# Recipe links on one listing page
+def recipe_links_on_page(soup):
+    return [link["href"] for link in soup.find_all("a", href=True)
+            if "https://15gram.be/recepten/" in link["href"] and "page" not in link["href"]]
+
+# The listing pages after the first are fetched concurrently once its pagination shows how many there are
+async def get_all_recipe_links(engine, base_url):
     recipe_links = set()  # Store unique recipe links
-    page = 1
-
-    while True:
-        url = f"{base_url}?page={page}" if page > 1 else base_url
-        print(f"Fetching recipes from: {url}")
-
-        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        if response.status_code != 200:
-            print(f"Failed to fetch {url}. Stopping pagination.")
-            break
-
-        soup = BeautifulSoup(response.text, "html.parser")
-        found_links = set()
-
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
-            if "https://15gram.be/recepten/" in href and "page" not in href and href not in recipe_links:
-                recipe_links.add(href)
-                found_links.add(href)
-
-        if not found_links:
-            print(f"No more recipes found on page {page}. Stopping pagination.")
-            break
-
-        page += 1
-        time.sleep(1)
-
+    async for page, links in paginate(engine, base_url, f"{base_url}?page={{page}}", recipe_links_on_page):
+        recipe_links.update(links)
     return list(recipe_links)
 
-# Function to scrape recipe details
-def scrape_recipe(url):
-    try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code != 200:
-            print(f"Failed to fetch {url}")
-            return None
-
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # 1. Product name (title)
-        title = soup.find("h1", class_="text-center")
-        title = title.get_text(strip=True) if title else "No title found"
-
-        # 2. Short description
-        short_description = soup.find("div", class_="large-push-2")
-        short_description = short_description.get_text(strip=True) if short_description else "No short description found"
-
-        # 3. Cook time
-        cook_time = soup.find("span", class_="duration right")
-        cook_time = cook_time.get_text(strip=True) if cook_time else "No cook time found"
-
-        # 4. Servings
-        servings = soup.find("span", class_="yield left")
-        servings = servings.get_text(strip=True) if servings else "No servings found"
-
-        # 5. Ingredients
-        ingredient_items = soup.select("div.detail-ingr-block ul li")
-        ingredients_list = []
-
-        for li in ingredient_items:
-            text = li.get_text(separator=" ", strip=True)
-            if text:
-                 ingredients_list.append(text)
-
-        # Step 2: Combine into a single string (line by line)
-        combined_ingredients = "\n".join(ingredients_list)
-
-        # Step 2: Combine into a single string (line by line)
-        combined_ingredients = "\n".join(ingredients_list)
-
-       # 6. Instructions
-        instruction_items = soup.find_all("li", attrs={"itemprop": "recipeInstructions"})
-        instructions = []
-
-        if instruction_items:
-            for idx, item in enumerate(instruction_items, start=1):
-                instruction_text = item.get_text(strip=True)
-                instructions.append(f"{idx}. {instruction_text}")
-        else:
-            instructions.append("No instructions found")
-
-        # Join all instructions into one string
-        combined_instructions = "\n".join(instructions)
-
-
-        # 7. Image URL - Extract the src from the img tag inside wprm-recipe-image div
-        image_div = soup.find("div", class_="recipe-image-container")
-        if image_div:
-            # Look for the 'img' tag and try to extract the image URL
-            img_tag = image_div.find("img")
-            if img_tag:
-                # First, try to get the image URL from 'data-lazy-src', then 'src' if necessary
-                image_url = img_tag.get("data-lazy-src") or img_tag.get("src")
-
-                if image_url:
-                    # Check if the image URL is a data URI (placeholder), skip if true
-                    if image_url.startswith("data:image"):
-                        image_url = "No valid image found (data URI)"
-                    # If the image URL is relative, prepend the base URL
-                    elif not image_url.startswith("http"):
-                        image_url = "https://15gram.be" + image_url
-                else:
-                    image_url = "No image URL found"
+# Every element the selector-based extractor reads, matched in one walk over the page instead of one find() each
+RECIPE_PLAN = SelectorPlan({
+    "title": Field("h1", {"class": "text-center"}),
+    "short_description": Field("div", {"class": "large-push-2"}),
+    "cook_time": Field("span", {"class": "duration right"}),
+    "servings": Field("span", {"class": "yield left"}),
+    # div.detail-ingr-block ul li
+    "ingredient_blocks": Field("div", {"class": "detail-ingr-block"}, many=True),
+    "ingredient_lists": Field("ul", many=True, inside="ingredient_blocks"),
+    "ingredients": Field("li", many=True, inside="ingredient_lists"),
+    "instructions": Field("li", {"itemprop": "recipeInstructions"}, many=True),
+    "image_div": Field("div", {"class": "recipe-image-container"}),
+    "image_img": Field("img", inside="image_div"),
+})
+
+def text_or(found, field, missing):
+    element = found[field]
+    return element.get_text(strip=True) if element else missing
+
+# Selector-based extractor, used when the page has no schema.org recipe (or for the fields it lacks)
+def scrape_recipe_html(url, html):
+    found = RECIPE_PLAN.match(make_soup(html))
+
+    # 1. Product name (title)
+    title = text_or(found, "title", "No title found")
+
+    # 2. Short description
+    short_description = text_or(found, "short_description", "No short description found")
+
+    # 3. Cook time
+    cook_time = text_or(found, "cook_time", "No cook time found")
+
+    # 4. Servings
+    servings = text_or(found, "servings", "No servings found")
+
+    # 5. Ingredients
+    ingredient_items = found["ingredients"]
+    ingredients_list = []
+
+    for li in ingredient_items:
+        text = li.get_text(separator=" ", strip=True)
+        if text:
+             ingredients_list.append(text)
+
+    # Step 2: Combine into a single string (line by line)
+    combined_ingredients = "\n".join(ingredients_list)
+
+    # Step 2: Combine into a single string (line by line)
+    combined_ingredients = "\n".join(ingredients_list)
+
+    # 6. Instructions
+    instruction_items = found["instructions"]
+    instructions = []
+
+    if instruction_items:
+        for idx, item in enumerate(instruction_items, start=1):
+            instruction_text = item.get_text(strip=True)
+            instructions.append(f"{idx}. {instruction_text}")
+    else:
+        instructions.append("No instructions found")
+
+    # Join all instructions into one string
+    combined_instructions = "\n".join(instructions)
+
+
+    # 7. Image URL - Extract the src from the img tag inside wprm-recipe-image div
+    image_div = found["image_div"]
+    if image_div:
+        # Look for the 'img' tag and try to extract the image URL
+        img_tag = found.first_inside(image_div, "image_img")
+        if img_tag:
+            # First, try to get the image URL from 'data-lazy-src', then 'src' if necessary
+            image_url = img_tag.get("data-lazy-src") or img_tag.get("src")
+
+            if image_url:
+                # Check if the image URL is a data URI (placeholder), skip if true
+                if image_url.startswith("data:image"):
+                    image_url = "No valid image found (data URI)"
+                # If the image URL is relative, prepend the base URL
+                elif not image_url.startswith("http"):
+                    image_url = "https://15gram.be" + image_url
             else:
-                image_url = "No img tag found"
+                image_url = "No image URL found"
         else:
-            image_url = "No image div found"
-
-        # 8. Product URL
-        product_url = url  # The product URL is simply the current URL
-
-        return {
-            "ProductName": title,
-            "Data_Source_URL": product_url,
-            "ProductShortDescription (Summary)": short_description,
-            "cook_time": cook_time,
-            "image": image_url,
-            "servings": servings,
-            "Ingredients": combined_ingredients,
-            "instructions": combined_instructions
-        }
-
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
-        return None
+            image_url = "No img tag found"
+    else:
+        image_url = "No image div found"
+
+    # 8. Product URL
+    product_url = url  # The product URL is simply the current URL
+
+    return {
+        "ProductName": title,
+        "Data_Source_URL": product_url,
+        "ProductShortDescription (Summary)": short_description,
+        "cook_time": cook_time,
+        "image": image_url,
+        "servings": servings,
+        "Ingredients": combined_ingredients,
+        "instructions": combined_instructions
+    }
+
+
+# Maps the page's schema.org Recipe (microdata or JSON-LD) onto our columns, with the cook time
+# in minutes as the page shows it ("90 min"); None marks what it lacks
+def schema_record(url, recipe):
+    fields = recipe_fields(recipe, format_time=lambda minutes: f"{round(minutes)} min")
+    image_url = fields["image"]
+    if image_url and not image_url.startswith("http"):
+        image_url = "https://15gram.be" + image_url
+    return {
+        "ProductName": fields["name"],
+        "Data_Source_URL": url,
+        "ProductShortDescription (Summary)": fields["description"],
+        "cook_time": fields["cook_time"] or fields["total_time"],
+        "image": image_url,
+        "servings": fields["yields"],
+        "Ingredients": "\n".join(fields["ingredients"]) if fields["ingredients"] else None,
+        "instructions": "\n".join(f"{idx}. {step}" for idx, step in enumerate(fields["instructions"], start=1))
+                        if fields["instructions"] else None
+    }
+
+# Function to scrape recipe details from an already fetched page: the schema.org Recipe first,
+# the selectors only for the fields it lacks
+def scrape_recipe(url, html):
+    recipe = find_recipe(html)
+    if recipe is None:
+        return scrape_recipe_html(url, html)
+    return fill_missing(schema_record(url, recipe), lambda missing: scrape_recipe_html(url, html))
+
+BASE_URL = "https://15gram.be/recepten"
+
+# The listing is only walked once; a resumed run goes straight to the pending recipes
+async def discover_15gram(engine, frontier, base_url=BASE_URL):
+    if not frontier.is_discovered(base_url):
+        recipe_links = await get_all_recipe_links(engine, base_url)
+        print(f"Found {len(recipe_links)} recipes in {base_url}")
+        frontier.add(recipe_links)
+        frontier.mark_discovered(base_url)
+
+def extract(url, html, category):
+    return scrape_recipe(url, html)
+
+async def crawl_15gram(base_url, frontier, sink=None, workers=None, processes=True, **engine_options):
+    async with FetchEngine(**engine_options) as engine:
+        await discover_15gram(engine, frontier, base_url)
+        await drain_site(engine, frontier, extract, sink, site="15gram", workers=workers, processes=processes)
 
 # Main function to scrape recipes from multiple categories
-def scrape_all_recipes(output_file="15gram_recipes.csv"):
-    base_url = "https://15gram.be/recepten"
-    all_recipes = []
-    seen_titles = set()  # Set to store unique titles
-
-    recipe_links = get_all_recipe_links(base_url)
-    print(f"Found {len(recipe_links)} recipes in {base_url}")
-
-    for idx, link in enumerate(recipe_links):
-        print(f"Scraping {idx+1}/{len(recipe_links)}: {link}")
-        recipe = scrape_recipe(link)
-        if recipe:
-            all_recipes.append(recipe)
-        time.sleep(1)
-
-    # Convert to DataFrame
-    df = pd.DataFrame(all_recipes)
-
-    # **Remove exact duplicate rows**
-    df.drop_duplicates(subset=["ProductName", "Data_Source_URL"], keep="first", inplace=True)
-
-    # Save to CSV
-    df.to_csv(output_file, index=False)
-    print(f"\n✅ Saved {len(df)} unique recipes to {output_file}")
-
-# Run the scraper
-scrape_all_recipes()
+# Progress is kept in `frontier_path`; rerunning after a crash or Ctrl-C resumes where it stopped.
+# Recipes are written to `output_file` (.csv, .jsonl or .parquet) as they are scraped.
+# Pages are extracted in a pool of worker processes, one per core (`workers`); processes=False uses threads.
+def scrape_all_recipes(output_file="15gram_recipes.csv", frontier_path="15gram_frontier.sqlite", workers=None,
+                       processes=True, **engine_options):
+    frontier = Frontier(frontier_path)
+    # Duplicate rows (same name and URL) are dropped as they arrive
+    with open_sink(output_file, key_fields=("ProductName", "Data_Source_URL")) as sink:
+        # Recipes scraped by an interrupted run go out first
+        sink.write_all(frontier.records())
+        run_sync(crawl_15gram(BASE_URL, frontier, sink, workers=workers, processes=processes, **engine_options))
+    print(f"Frontier: {frontier.counts()}")
+    print(f"\n✅ Saved {sink.count} unique recipes to {output_file}")
+    frontier.finish()
+    frontier.close()
+
+# Lets recipe_common.orchestrator run this site alongside the others
+register_site("15gram", "15gram.be", discover_15gram, extract, key_fields=("ProductName", "Data_Source_URL"),
+              per_host_concurrency=4, per_host_rate=2.0)
+
+if __name__ == "__main__":
+    # Reruns revalidate pages cached by earlier runs instead of downloading them again
+    cache = ResponseCache("http_cache/15gram")
+    # Every page downloaded is also archived, so extractors can be rerun on it without crawling again
+    archive = WarcArchive("warc/15gram")
+    # Run the scraper (up to 4 requests in flight to 15gram.be, at most 2 requests/second)
+    scrape_all_recipes(per_host_concurrency=4, per_host_rate=2.0, cache=cache, archive=archive)
+    print(f"HTTP cache: {cache.stats()}")
+    print(f"Raw page archive: {archive.stats()}")
+    cache.close()
+    archive.close()
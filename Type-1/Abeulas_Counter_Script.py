@@ -1,48 +1,38 @@
-import requests
-import time
-import pandas as pd
-from bs4 import BeautifulSoup
-from recipe_scrapers import scrape_me
+import asyncio
+import os
+import sys
+from recipe_scrapers import scrape_html
 
-# Function to get all recipe links from a category (Handles Pagination)
-def get_category_recipe_links(category_url):
-    recipe_links = set()
-    page = 1  
- 
-    while True:
-        url = f"{category_url}/page/{page}/" if page > 1 else category_url
-        print(f"Fetching recipes from: {url}")
- 
-        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        if response.status_code != 200:
-            print(f"Failed to fetch {url}. Stopping pagination.")
-            break  
- 
-        soup = BeautifulSoup(response.text, "html.parser")
-        found_links = set()
- 
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
-            if "https://abuelascounter.com/" in href and "category" not in href and href not in recipe_links:
-                recipe_links.add(href)
-                found_links.add(href)
- 
-        if not found_links:
-            print(f"No more recipes found on page {page}. Stopping pagination.")
-            break  
- 
-        page += 1  
-        time.sleep(1)  
- 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.archive import WarcArchive
+from recipe_common.cache import ResponseCache
+from recipe_common.fetch import FetchEngine, run_sync
+from recipe_common.frontier import Frontier
+from recipe_common.pagination import paginate
+from recipe_common.parsing import make_soup
+from recipe_common.pipeline import drain_site
+from recipe_common.registry import register_site
+from recipe_common.sink import open_sink
+from recipe_common.sitemap import discover_sitemap_urls
+
+BASE_URL = "https://abuelascounter.com/category/"
+
+# Recipe links on one listing page (category pages also link to other categories)
+def recipe_links_on_page(soup):
+    return [link["href"] for link in soup.find_all("a", href=True)
+            if "https://abuelascounter.com/" in link["href"] and "category" not in link["href"]]
+ 
+# Function to get all recipe links from a category (Handles Pagination): once the first page's
+# pagination shows how many pages there are, the rest are fetched concurrently
+async def get_category_recipe_links(engine, category_url):
+    recipe_links = set()  # Store unique recipe links
+    async for page, links in paginate(engine, category_url, f"{category_url}/page/{{page}}/", recipe_links_on_page):
+        recipe_links.update(links)
     return list(recipe_links)
- # Function to extract description if `recipe_scrapers` fails
-def get_recipe_description(url):
+ # Function to extract description if `recipe_scrapers` fails (reuses the already downloaded page)
+def get_recipe_description(html):
     try:
-        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        if response.status_code != 200:
-            return "N/A"
- 
-        soup = BeautifulSoup(response.text, "html.parser")
+        soup = make_soup(html)
         description_meta = soup.find("meta", attrs={"name": "description"})
         if description_meta and "content" in description_meta.attrs:
             return description_meta["content"]
@@ -51,54 +41,88 @@ def get_recipe_description(url):
     except:
         return "N/A"
  
-# Function to scrape recipe details with better error handling
-def scrape_recipe(url):
-    try:
-        scraper = scrape_me(url)
+# Function to scrape recipe details with better error handling (one download shared by both extractors)
+def scrape_recipe(url, html):
+    scraper = scrape_html(html, org_url=url)
 
-        description = scraper.description() if hasattr(scraper, 'description') and scraper.description() else get_recipe_description(url)
- 
-        return {
-            "title": scraper.title(),
-            "description": description if description else "N/A",
-            "ingredients": "\n".join(scraper.ingredients()),
-            "instructions": scraper.instructions(),
-            "prep_time": scraper.prep_time() if scraper.prep_time() else "N/A",
-            "cook_time": scraper.cook_time() if scraper.cook_time() else "N/A",
-            "total_time": scraper.total_time() if scraper.total_time() else "N/A",
-            "yields": scraper.yields() if scraper.yields() else "N/A",
-            "image": scraper.image() if scraper.image() else "N/A",
-            "host": scraper.host(),
-            "url": url
-        }
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
-        return None
+    description = scraper.description() if hasattr(scraper, 'description') and scraper.description() else get_recipe_description(html)
+ 
+    return {
+        "title": scraper.title(),
+        "description": description if description else "N/A",
+        "ingredients": "\n".join(scraper.ingredients()),
+        "instructions": scraper.instructions(),
+        "prep_time": scraper.prep_time() if scraper.prep_time() else "N/A",
+        "cook_time": scraper.cook_time() if scraper.cook_time() else "N/A",
+        "total_time": scraper.total_time() if scraper.total_time() else "N/A",
+        "yields": scraper.yields() if scraper.yields() else "N/A",
+        "image": scraper.image() if scraper.image() else "N/A",
+        "host": scraper.host(),
+        "url": url
+    }
+ 
+# Sitemap discovery: stream the WordPress post sitemaps instead of walking category pages
+async def get_sitemap_recipe_links(engine, since=None):
+    entries, complete = await discover_sitemap_urls(engine, "https://abuelascounter.com/", since=since)
+    recipe_links = [url for url, lastmod in entries]
+    print(f"Found {len(recipe_links)} recipes in the sitemap")
+    return recipe_links, complete
+ 
+# Discover one category's links into the frontier (skipped if an interrupted run already listed it)
+async def discover_category(engine, frontier, base_url, category):
+    if frontier.is_discovered(category):
+        return
+    category_url = f"{base_url}{category}"
+    print(f"\nScraping category: {category} ({category_url})")
+ 
+    recipe_links = await get_category_recipe_links(engine, category_url)
+    print(f"Found {len(recipe_links)} recipes in {category}")
+    frontier.add(recipe_links, category)
+    frontier.mark_discovered(category)
+ 
+def extract(url, html, category):
+    recipe_data = scrape_recipe(url, html)
+    if recipe_data:
+        recipe_data["category"] = category  
+    return recipe_data
+ 
+async def discover_abuelas_counter(engine, frontier, categories, base_url, discovery="category", since=None):
+    if discovery == "sitemap":
+        if not frontier.is_discovered("sitemap"):
+            # The sitemap does not say which category a post is in
+            links, complete = await get_sitemap_recipe_links(engine, since=since)
+            frontier.add(links)
+            if complete:
+                frontier.mark_discovered("sitemap")
+            else:
+                print("The sitemap was not read in full; the next run reads it again")
+    else:
+        await asyncio.gather(*(discover_category(engine, frontier, base_url, category) for category in categories))
+ 
+async def crawl_abuelas_counter(categories, base_url, frontier, sink=None, discovery="category", since=None,
+                                workers=None, processes=True, **engine_options):
+    async with FetchEngine(**engine_options) as engine:
+        await discover_abuelas_counter(engine, frontier, categories, base_url, discovery=discovery, since=since)
+        await drain_site(engine, frontier, extract, sink, site="abuelas", workers=workers, processes=processes)
  
 # Main function to scrape recipes from multiple categories
-def scrape_abuelas_counter_by_category(categories, output_file="abuelas_recipes.csv"):
-    base_url = "https://abuelascounter.com/category/"
-    all_recipes = []
- 
-    for category in categories:
-        category_url = f"{base_url}{category}"
-        print(f"\nScraping category: {category} ({category_url})")
- 
-        recipe_links = get_category_recipe_links(category_url)
-        print(f"Found {len(recipe_links)} recipes in {category}")
- 
-        for idx, recipe_url in enumerate(recipe_links):
-            print(f"Scraping {idx+1}/{len(recipe_links)}: {recipe_url}")
-            recipe_data = scrape_recipe(recipe_url)
-            if recipe_data:
-                recipe_data["category"] = category  
-                all_recipes.append(recipe_data)
-            time.sleep(1)  
- 
-    # Save data to CSV
-    df = pd.DataFrame(all_recipes)
-    df.to_csv(output_file, index=False)
-    print(f"\n✅ Saved {len(all_recipes)} recipes to {output_file}")
+# discovery="sitemap" reads post URLs from the sitemap instead (pass `since` to skip unchanged posts).
+# Progress is kept in `frontier_path`; rerunning after a crash or Ctrl-C resumes where it stopped.
+# Recipes are written to `output_file` (.csv, .jsonl or .parquet) as they are scraped.
+# Pages are extracted in a pool of worker processes, one per core (`workers`); processes=False uses threads.
+def scrape_abuelas_counter_by_category(categories, output_file="abuelas_recipes.csv", discovery="category", since=None,
+                                       frontier_path="abuelas_frontier.sqlite", workers=None, processes=True,
+                                       **engine_options):
+    frontier = Frontier(frontier_path)
+    with open_sink(output_file, key_fields=("title", "url")) as sink:
+        # Recipes scraped by an interrupted run go out first
+        sink.write_all(frontier.records())
+        run_sync(crawl_abuelas_counter(categories, BASE_URL, frontier, sink, discovery=discovery, since=since,
+                                       workers=workers, processes=processes, **engine_options))
+    print(f"Frontier: {frontier.counts()}")
+    print(f"\n✅ Saved {sink.count} recipes to {output_file}")
+    frontier.finish()
+    frontier.close()
  
 # Updated categories to scrape
 categories_to_scrape = [
@@ -106,5 +130,21 @@ categories_to_scrape = [
     "sauces", "sides", "soups"
 ]  
  
-# Run the scraper for the specified categories
-scrape_abuelas_counter_by_category(categories_to_scrape, output_file="abuelas_recipes.csv")
+# Lets recipe_common.orchestrator run this site alongside the others
+register_site("abuelas", "abuelascounter.com",
+              lambda engine, frontier, **options: discover_abuelas_counter(engine, frontier, categories_to_scrape,
+                                                                           BASE_URL, **options),
+              extract, key_fields=("title", "url"), sitemap=True, per_host_concurrency=4, per_host_rate=2.0)
+ 
+if __name__ == "__main__":
+    # Reruns revalidate pages cached by earlier runs instead of downloading them again
+    cache = ResponseCache("http_cache/abuelas")
+    # Every page downloaded is also archived, so extractors can be rerun on it without crawling again
+    archive = WarcArchive("warc/abuelas")
+    # Run the scraper for the specified categories (up to 4 requests in flight, at most 2 requests/second)
+    scrape_abuelas_counter_by_category(categories_to_scrape, output_file="abuelas_recipes.csv",
+                                       per_host_concurrency=4, per_host_rate=2.0, cache=cache, archive=archive)
+    print(f"HTTP cache: {cache.stats()}")
+    print(f"Raw page archive: {archive.stats()}")
+    cache.close()
+    archive.close()
@@ -1,151 +1,224 @@
-import requests
-import time
-import pandas as pd
-from bs4 import BeautifulSoup
-from recipe_scrapers import scrape_me
- 
-# Function to get all recipe links from a category (Handles Pagination)
-def get_category_recipe_links(category_url):
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.archive import WarcArchive
+from recipe_common.cache import ResponseCache
+from recipe_common.fetch import FetchEngine, run_sync
+from recipe_common.frontier import Frontier
+from recipe_common.jsonld import fill_missing, find_recipe, format_minutes, recipe_fields
+from recipe_common.pagination import paginate
+from recipe_common.parsing import make_card_soup, make_fragment_soup
+from recipe_common.pipeline import drain_site
+from recipe_common.plan import Field, SelectorPlan
+from recipe_common.registry import register_site
+from recipe_common.sink import open_sink
+from recipe_common.sitemap import discover_sitemap_urls
+ 
+BASE_URL = "https://addapinch.com/category/all-recipes/"
+ 
+# Recipe links on one listing page (category pages also link to other categories)
+def recipe_links_on_page(soup):
+    return [link["href"] for link in soup.find_all("a", href=True)
+            if "https://addapinch.com/" in link["href"] and "category" not in link["href"]]
+ 
+# Function to get all recipe links from a category (Handles Pagination): once the first page's
+# pagination shows how many pages there are, the rest are fetched concurrently
+async def get_category_recipe_links(engine, category_url):
     recipe_links = set()  # Store unique recipe links
-    page = 1  
- 
-    while True:
-        url = f"{category_url}/page/{page}/" if page > 1 else category_url
-        print(f"Fetching recipes from: {url}")
- 
-        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        if response.status_code != 200:
-            print(f"Failed to fetch {url}. Stopping pagination.")
-            break  
- 
-        soup = BeautifulSoup(response.text, "html.parser")
-        found_links = set()
- 
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
-            if "https://addapinch.com/" in href and "category" not in href and href not in recipe_links:
-                recipe_links.add(href)
-                found_links.add(href)
- 
-        if not found_links:
-            print(f"No more recipes found on page {page}. Stopping pagination.")
-            break  
- 
-        page += 1  
-        time.sleep(1)  
- 
+    async for page, links in paginate(engine, category_url, f"{category_url}/page/{{page}}/", recipe_links_on_page):
+        recipe_links.update(links)
     return list(recipe_links)
  
-# Function to scrape recipe details
-def scrape_recipe(url, seen_titles):
-    try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code != 200:
-            print(f"Failed to fetch {url}")
-            return None
- 
-        soup = BeautifulSoup(response.text, "html.parser")
- 
-        # Extract recipe details
-        title = soup.find("h1")
-        title = title.get_text(strip=True) if title else "No title found"
- 
-        # **Duplicate Check**: If title is already scraped, skip it
-        if title in seen_titles:
-            print(f"Skipping duplicate recipe: {title}")
-            return None
-        seen_titles.add(title)  # Add to seen titles set
- 
-        short_description = soup.find("div", class_="wprm-recipe-summary wprm-block-text-normal")
-        short_description = short_description.get_text(strip=True) if short_description else "No short description found"
- 
-        prep_time = soup.find("span", class_="wprm-recipe-prep_time")
-        prep_time = prep_time.get_text(strip=True) if prep_time else "No prep time found"
- 
-        cook_time = soup.find("span", class_="wprm-recipe-cook_time")
-        cook_time = cook_time.get_text(strip=True) if cook_time else "No cook time found"
- 
-        total_time = soup.find("span", class_="wprm-recipe-total_time")
-        total_time = total_time.get_text(strip=True) if total_time else "No total time found"
- 
-        servings = soup.find("span", class_="wprm-recipe-servings")
-        servings = servings.get_text(strip=True) if servings else "No servings found"
- 
-        ingredients = soup.find_all("li", class_="wprm-recipe-ingredient")
-        ingredients = [ingredient.get_text(strip=True) for ingredient in ingredients] if ingredients else ["No ingredients found"]
- 
-        instructions = soup.find_all("li", class_="wprm-recipe-instruction")
-        instructions = [step.find("div", class_="wprm-recipe-instruction-text").get_text(strip=True) for step in instructions] if instructions else ["No instructions found"]
- 
-        notes = soup.find("div", class_="wprm-recipe-notes")
-        notes = notes.get_text(strip=True) if notes else "No notes found"
- 
-        nutrition = soup.find("div", class_="wprm-nutrition-label-container-simple")
-        nutrition = nutrition.get_text(strip=True) if nutrition else "No nutrition information found"
- 
-        # Image URL
-        image_div = soup.find("div", class_="wprm-recipe-image")
-        if image_div:
-            img_tag = image_div.find("img")
-            if img_tag:
-                image_url = img_tag.get("data-lazy-src") or img_tag.get("src")
-                if image_url and not image_url.startswith("http"):
-                    image_url = "https://addapinch.com" + image_url
-            else:
-                image_url = "No img tag found"
+# Only the WPRM recipe card, the post title and <head> are parsed, not the whole page
+RECIPE_CARD = ("div", {"class": "wprm-recipe-container"})
+ 
+# Every element the selector-based extractor reads, matched in one walk over the card instead of one find() each
+RECIPE_PLAN = SelectorPlan({
+    "title": Field("h1"),
+    "short_description": Field("div", {"class": "wprm-recipe-summary wprm-block-text-normal"}),
+    "prep_time": Field("span", {"class": "wprm-recipe-prep_time"}),
+    "cook_time": Field("span", {"class": "wprm-recipe-cook_time"}),
+    "total_time": Field("span", {"class": "wprm-recipe-total_time"}),
+    "servings": Field("span", {"class": "wprm-recipe-servings"}),
+    "ingredients": Field("li", {"class": "wprm-recipe-ingredient"}, many=True),
+    "instructions": Field("li", {"class": "wprm-recipe-instruction"}, many=True),
+    "instruction_texts": Field("div", {"class": "wprm-recipe-instruction-text"}, many=True, inside="instructions"),
+    "notes": Field("div", {"class": "wprm-recipe-notes"}),
+    "nutrition": Field("div", {"class": "wprm-nutrition-label-container-simple"}),
+    "image_div": Field("div", {"class": "wprm-recipe-image"}),
+    "image_img": Field("img", inside="image_div"),
+})
+ 
+def text_or(found, field, missing):
+    element = found[field]
+    return element.get_text(strip=True) if element else missing
+ 
+# Selector-based extractor, used when the page has no JSON-LD recipe (or for the fields it lacks)
+def scrape_recipe_html(url, html):
+    found = RECIPE_PLAN.match(make_card_soup(html, RECIPE_CARD, keep=[("h1", {})]))
+ 
+    # Extract recipe details
+    title = text_or(found, "title", "No title found")
+    short_description = text_or(found, "short_description", "No short description found")
+    prep_time = text_or(found, "prep_time", "No prep time found")
+    cook_time = text_or(found, "cook_time", "No cook time found")
+    total_time = text_or(found, "total_time", "No total time found")
+    servings = text_or(found, "servings", "No servings found")
+ 
+    ingredients = found["ingredients"]
+    ingredients = [ingredient.get_text(strip=True) for ingredient in ingredients] if ingredients else ["No ingredients found"]
+ 
+    instructions = found["instructions"]
+    instructions = [found.first_inside(step, "instruction_texts").get_text(strip=True) for step in instructions] if instructions else ["No instructions found"]
+ 
+    notes = text_or(found, "notes", "No notes found")
+    nutrition = text_or(found, "nutrition", "No nutrition information found")
+ 
+    # Image URL
+    image_div = found["image_div"]
+    if image_div:
+        img_tag = found.first_inside(image_div, "image_img")
+        if img_tag:
+            image_url = img_tag.get("data-lazy-src") or img_tag.get("src")
+            if image_url and not image_url.startswith("http"):
+                image_url = "https://addapinch.com" + image_url
         else:
-            image_url = "No image div found"
- 
-        return {
-            "product_name": title,
-            "short_description": short_description,
-            "prep_time": prep_time,
-            "cook_time": cook_time,
-            "total_time": total_time,
-            "servings": servings,
-            "ingredients": ingredients,
-            "instructions": instructions,
-            "notes": notes,
-            "nutrition": nutrition,
-            "image_url": image_url,
-            "product_url": url
-        }
- 
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
+            image_url = "No img tag found"
+    else:
+        image_url = "No image div found"
+ 
+    return {
+        "product_name": title,
+        "short_description": short_description,
+        "prep_time": prep_time,
+        "cook_time": cook_time,
+        "total_time": total_time,
+        "servings": servings,
+        "ingredients": ingredients,
+        "instructions": instructions,
+        "notes": notes,
+        "nutrition": nutrition,
+        "image_url": image_url,
+        "product_url": url
+    }
+ 
+ 
+# Maps the page's schema.org Recipe onto our columns, written as the card selectors read them
+# ("1hr5mins", "12", "Calories: 250kcal|Fat: 10g"); None marks what the JSON-LD lacks
+def jsonld_record(url, recipe):
+    fields = recipe_fields(recipe, format_time=lambda minutes: format_minutes(minutes, separator=""))
+    nutrition = fields["nutrition"]
+    return {
+        "product_name": fields["name"],
+        "short_description": fields["description"],
+        "prep_time": fields["prep_time"],
+        "cook_time": fields["cook_time"],
+        "total_time": fields["total_time"],
+        "servings": fields["servings"],
+        "ingredients": fields["ingredients"],
+        "instructions": fields["instructions"],
+        "notes": None,  # WPRM leaves the notes out of its JSON-LD
+        "nutrition": "|".join(f"{name}: {''.join(value.split())}" for name, value in nutrition.items()) if nutrition else None,
+        "image_url": fields["image"],
+        "product_url": url
+    }
+ 
+def fallback_fields(url, html, missing):
+    # Usually only the notes are missing; parse just that block instead of the whole card
+    if missing == ["notes"]:
+        notes = make_fragment_soup(html, [("div", {"class": "wprm-recipe-notes"})]).find("div", class_="wprm-recipe-notes")
+        return {"notes": notes.get_text(strip=True) if notes else "No notes found"}
+    return scrape_recipe_html(url, html)
+ 
+# Function to scrape recipe details from an already fetched page: the JSON-LD Recipe first,
+# the card selectors only for the fields it lacks
+def scrape_recipe(url, html, seen_titles):
+    recipe = find_recipe(html)
+    if recipe is None:
+        recipe_data = scrape_recipe_html(url, html)
+    else:
+        recipe_data = fill_missing(jsonld_record(url, recipe),
+                                   lambda missing: fallback_fields(url, html, missing))
+    if recipe_data is None:
         return None
  
-# Main function to scrape recipes from multiple categories
-def scrape_addapinch_by_category(categories, output_file="addapinch_recipes.csv"):
-    base_url = "https://addapinch.com/category/all-recipes/"
-    all_recipes = []
-    seen_titles = set()  # Set to store unique titles
- 
-    for category in categories:
-        category_url = f"{base_url}{category}"
-        print(f"\nScraping category: {category} ({category_url})")
- 
-        recipe_links = get_category_recipe_links(category_url)
-        print(f"Found {len(recipe_links)} recipes in {category}")
- 
-        for idx, recipe_url in enumerate(recipe_links):
-            print(f"Scraping {idx+1}/{len(recipe_links)}: {recipe_url}")
-            recipe_data = scrape_recipe(recipe_url, seen_titles)
-            if recipe_data:
-                recipe_data["category"] = category  
-                all_recipes.append(recipe_data)
-            time.sleep(1)  
- 
-    # Convert to DataFrame
-    df = pd.DataFrame(all_recipes)
- 
-    # **Remove exact duplicate rows**
-    df.drop_duplicates(subset=["product_name", "product_url"], keep="first", inplace=True)
+    # **Duplicate Check**: If title is already scraped, skip it
+    title = recipe_data["product_name"]
+    if title in seen_titles:
+        logging.debug("Skipping duplicate recipe: %s", title)
+        return None
+    seen_titles.add(title)  # Add to seen titles set
+    return recipe_data
+ 
+# Sitemap discovery: stream the WordPress post sitemaps instead of walking category pages
+async def get_sitemap_recipe_links(engine, since=None):
+    entries, complete = await discover_sitemap_urls(engine, "https://addapinch.com/", since=since)
+    recipe_links = [url for url, lastmod in entries]
+    print(f"Found {len(recipe_links)} recipes in the sitemap")
+    return recipe_links, complete
+ 
+# Discover one category's links into the frontier (skipped if an interrupted run already listed it)
+async def discover_category(engine, frontier, base_url, category):
+    if frontier.is_discovered(category):
+        return
+    category_url = f"{base_url}{category}"
+    print(f"\nScraping category: {category} ({category_url})")
+ 
+    recipe_links = await get_category_recipe_links(engine, category_url)
+    print(f"Found {len(recipe_links)} recipes in {category}")
+    frontier.add(recipe_links, category)
+    frontier.mark_discovered(category)
+ 
+async def discover_addapinch(engine, frontier, categories, base_url, discovery="category", since=None):
+    if discovery == "sitemap":
+        if not frontier.is_discovered("sitemap"):
+            # The sitemap does not say which category a post is in
+            links, complete = await get_sitemap_recipe_links(engine, since=since)
+            frontier.add(links)
+            if complete:
+                frontier.mark_discovered("sitemap")
+            else:
+                print("The sitemap was not read in full; the next run reads it again")
+    else:
+        await asyncio.gather(*(discover_category(engine, frontier, base_url, category) for category in categories))
+ 
+# Without the duplicate check, so it can run in a worker process; drain_site() and the
+# orchestrator drop repeated titles themselves (unique_field="product_name")
+def extract(url, html, category):
+    recipe_data = scrape_recipe(url, html, set())
+    if recipe_data:
+        recipe_data["category"] = category
+    return recipe_data
+ 
+async def crawl_addapinch(categories, base_url, frontier, sink=None, discovery="category", since=None, workers=None,
+                          processes=True, **engine_options):
+    async with FetchEngine(**engine_options) as engine:
+        await discover_addapinch(engine, frontier, categories, base_url, discovery=discovery, since=since)
+        await drain_site(engine, frontier, extract, sink, site="addapinch", unique_field="product_name",
+                         workers=workers, processes=processes)
  
-    # Save to CSV
-    df.to_csv(output_file, index=False)
-    print(f"\n✅ Saved {len(df)} unique recipes to {output_file}")
+# Main function to scrape recipes from multiple categories
+# discovery="sitemap" reads post URLs from the sitemap instead (pass `since` to skip unchanged posts).
+# Progress is kept in `frontier_path`; rerunning after a crash or Ctrl-C resumes where it stopped.
+# Recipes are written to `output_file` (.csv, .jsonl or .parquet) as they are scraped.
+# Pages are extracted in a pool of worker processes, one per core (`workers`); processes=False uses threads.
+def scrape_addapinch_by_category(categories, output_file="addapinch_recipes.csv", discovery="category", since=None,
+                                 frontier_path="addapinch_frontier.sqlite", workers=None, processes=True,
+                                 **engine_options):
+    frontier = Frontier(frontier_path)
+    # Duplicate rows (same name and URL) are dropped as they arrive
+    with open_sink(output_file, key_fields=("product_name", "product_url")) as sink:
+        # Recipes scraped by an interrupted run go out first
+        sink.write_all(frontier.records())
+        run_sync(crawl_addapinch(categories, BASE_URL, frontier, sink, discovery=discovery, since=since,
+                                 workers=workers, processes=processes, **engine_options))
+    print(f"Frontier: {frontier.counts()}")
+    print(f"\n✅ Saved {sink.count} unique recipes to {output_file}")
+    frontier.finish()
+    frontier.close()
  
 
 
@@ -156,5 +229,22 @@ categories_to_scrape = [
     "lunch", "salad-soup-and-salad", "bread", "snacks", "soups-and-stews"
 ]  
  
-# Run the scraper
-scrape_addapinch_by_category(categories_to_scrape, output_file="addapinch_recipes.csv")
+# Lets recipe_common.orchestrator run this site alongside the others
+register_site("addapinch", "addapinch.com",
+              lambda engine, frontier, **options: discover_addapinch(engine, frontier, categories_to_scrape, BASE_URL,
+                                                                     **options),
+              extract, key_fields=("product_name", "product_url"), unique_field="product_name", sitemap=True,
+              per_host_concurrency=4, per_host_rate=2.0)
+ 
+if __name__ == "__main__":
+    # Reruns revalidate pages cached by earlier runs instead of downloading them again
+    cache = ResponseCache("http_cache/addapinch")
+    # Every page downloaded is also archived, so extractors can be rerun on it without crawling again
+    archive = WarcArchive("warc/addapinch")
+    # Run the scraper (up to 4 requests in flight to addapinch.com, at most 2 requests/second)
+    scrape_addapinch_by_category(categories_to_scrape, output_file="addapinch_recipes.csv",
+                                 per_host_concurrency=4, per_host_rate=2.0, cache=cache, archive=archive)
+    print(f"HTTP cache: {cache.stats()}")
+    print(f"Raw page archive: {archive.stats()}")
+    cache.close()
+    archive.close()
@@ -1,9 +1,22 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
+import asyncio
+import logging
+import os
+import sys
 from urllib.parse import urljoin
-import time
-from recipe_scrapers import scrape_me
+from recipe_scrapers import scrape_html
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.archive import WarcArchive
+from recipe_common.cache import ResponseCache
+from recipe_common.fetch import FetchEngine, run_sync
+from recipe_common.frontier import Frontier
+from recipe_common.pagination import paginate
+from recipe_common.parsing import make_card_soup
+from recipe_common.pipeline import drain_site
+from recipe_common.plan import Field, SelectorPlan
+from recipe_common.registry import register_site
+from recipe_common.sink import open_sink
+from recipe_common.sitemap import discover_sitemap_urls
  
 BASE_URL = "https://barefeetinthekitchen.com/"
 HEADERS = {"User-Agent": "Mozilla/5.0"}
@@ -13,51 +26,65 @@ CATEGORIES = [
     "snacks", "desserts", "drinks"
 ]
  
-def get_category_links(category):
+# The first link of every article on a listing page
+def article_links(soup):
+    links = []
+    for a in soup.find_all("article"):
+        link_tag = a.find("a", href=True)
+        if link_tag:
+            links.append(urljoin(BASE_URL, link_tag["href"]))
+    return links
+ 
+async def get_category_links(engine, category):
     print(f"\n📦 Collecting recipe links for category: {category}")
     links = set()
-    page = 1
-    while True:
-        url = f"{BASE_URL}category/{category}/page/{page}/"
-        try:
-            res = requests.get(url, headers=HEADERS, timeout=10)
-            if res.status_code != 200:
-                print(f"❌ Failed to access page {page}. Stopping.")
-                break
-            soup = BeautifulSoup(res.text, "html.parser")
-            articles = soup.find_all("article")
-            if not articles:
-                break
-            print(f"✅ Page {page}: {len(articles)} articles scanned", end=", ")
-            count_before = len(links)
-            for a in articles:
-                link_tag = a.find("a", href=True)
-                if link_tag:
-                    full_url = urljoin(BASE_URL, link_tag["href"])
-                    links.add(full_url)
-            print(f"{len(links)} total links.")
-            page += 1
-            time.sleep(1)
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            break
+    # Every listing page after the first is fetched at once, as the first page's pagination lists them
+    category_url = f"{BASE_URL}category/{category}/"
+    async for page, page_links in paginate(engine, category_url, category_url + "page/{page}/", article_links):
+        links.update(page_links)
+        logging.debug("Page %d: %d articles scanned, %d total links", page, len(page_links), len(links))
     print(f"🔗 Total links found for {category}: {len(links)}")
     return list(links)
  
-def fallback_scraper(url):
+# Sitemap discovery: stream the WordPress post sitemaps instead of walking category pages
+async def get_sitemap_links(engine, since=None):
+    entries, complete = await discover_sitemap_urls(engine, BASE_URL, since=since)
+    links = [url for url, lastmod in entries]
+    print(f"🔗 Total links found in the sitemap: {len(links)}")
+    return links, complete
+ 
+# The fallback only reads the WPRM recipe card, the post title and the featured image
+RECIPE_CARD = ("div", {"class": "wprm-recipe-container"})
+PAGE_PARTS = [("h1", {"class": "entry-title"}), ("img", {"class": "attachment-ao-standard"})]
+ 
+# Every element the fallback reads, matched in one walk over those parts instead of one find() or select() each
+RECIPE_PLAN = SelectorPlan({
+    "title": Field("h1", {"class": "entry-title"}),
+    "description": Field("div", {"class": "wprm-recipe-summary"}),
+    "ingredients": Field(None, {"class": "wprm-recipe-ingredient"}, many=True),
+    "instructions": Field(None, {"class": "wprm-recipe-instruction-text"}, many=True),
+    "image": Field("img", {"class": "attachment-ao-standard"}),
+    "total_time": Field("span", {"class": "wprm-recipe-total_time"}),
+    "yields": Field("span", {"class": "wprm-recipe-servings"}),
+})
+ 
+def text_or_empty(found, field):
+    element = found[field]
+    return element.text.strip() if element else ""
+ 
+def fallback_scraper(url, html):
     try:
-        res = requests.get(url, headers=HEADERS, timeout=10)
-        soup = BeautifulSoup(res.text, "html.parser")
- 
-        title = soup.find("h1", class_="entry-title").text.strip() if soup.find("h1", class_="entry-title") else ""
-        description = soup.find("div", class_="wprm-recipe-summary").text.strip() if soup.find("div", class_="wprm-recipe-summary") else ""
-        ingredients = "\n".join([li.text.strip() for li in soup.select(".wprm-recipe-ingredient")])
-        instructions = "\n".join([step.text.strip() for step in soup.select(".wprm-recipe-instruction-text")])
-        image_tag = soup.find("img", class_="attachment-ao-standard")
+        found = RECIPE_PLAN.match(make_card_soup(html, RECIPE_CARD, keep=PAGE_PARTS))
+ 
+        title = text_or_empty(found, "title")
+        description = text_or_empty(found, "description")
+        ingredients = "\n".join([li.text.strip() for li in found["ingredients"]])
+        instructions = "\n".join([step.text.strip() for step in found["instructions"]])
+        image_tag = found["image"]
         image_url = image_tag["src"] if image_tag else ""
  
-        total_time = soup.find("span", class_="wprm-recipe-total_time").text.strip() if soup.find("span", class_="wprm-recipe-total_time") else ""
-        yields = soup.find("span", class_="wprm-recipe-servings").text.strip() if soup.find("span", class_="wprm-recipe-servings") else ""
+        total_time = text_or_empty(found, "total_time")
+        yields = text_or_empty(found, "yields")
  
         return {
             "title": title,
@@ -69,13 +96,12 @@ def fallback_scraper(url):
             "yields": yields
         }
     except Exception as e:
-        print(f"❌ Fallback failed for {url}: {e}")
+        logging.debug("Fallback failed for %s: %s", url, e)
         return None
  
-def extract_recipe_data(url, category):
-    print(f"🔍 Scraping: {url}")
+def extract_recipe_data(url, category, html):
     try:
-        scraper = scrape_me(url)
+        scraper = scrape_html(html, org_url=url)
         return {
             "title": scraper.title(),
             "description": scraper.description() if hasattr(scraper, "description") else "",
@@ -88,31 +114,77 @@ def extract_recipe_data(url, category):
             "url": url
         }
     except Exception as e:
-        print(f"⚠️ Failed to scrape {url} with recipe_scrapers: {e}")
-        fallback = fallback_scraper(url)
+        logging.debug("Failed to scrape %s with recipe_scrapers: %s", url, e)
+        fallback = fallback_scraper(url, html)
         if fallback:
-            print(f"🔁 Fallback succeeded for {url}")
+            logging.debug("Fallback succeeded for %s", url)
             fallback.update({
                 "category": category,
                 "url": url
             })
             return fallback
-        else:
-            print(f"❌ Fallback also failed for {url}")
-            return None
- 
-def main():
-    all_recipes = []
-    for category in CATEGORIES:
-        links = get_category_links(category)
-        for link in links:
-            recipe = extract_recipe_data(link, category)
-            if recipe:
-                all_recipes.append(recipe)
-            time.sleep(0.5)
- 
-    df = pd.DataFrame(all_recipes)
-    df.to_csv("barefeet_in_the_kitchen_recipes.csv", index=False)
-    print(f"\n✅ Done! Total recipes saved: {len(df)}")
- 
-main()
+        # Recorded as a failure in the frontier, so the page is retried and then dead-lettered
+        raise ValueError(f"recipe_scrapers and the fallback scraper both failed: {e}")
+ 
+# Discovery is recorded in the frontier, so a resumed run skips categories it already listed
+async def discover_category(engine, frontier, category):
+    if frontier.is_discovered(category):
+        return
+    frontier.add(await get_category_links(engine, category), category)
+    frontier.mark_discovered(category)
+ 
+async def discover(engine, frontier, discovery="category", since=None):
+    if discovery == "sitemap":
+        if not frontier.is_discovered("sitemap"):
+            # The sitemap does not say which category a post is in
+            links, complete = await get_sitemap_links(engine, since=since)
+            frontier.add(links)
+            if complete:
+                frontier.mark_discovered("sitemap")
+            else:
+                print("The sitemap was not read in full; the next run reads it again")
+    else:
+        await asyncio.gather(*(discover_category(engine, frontier, category) for category in CATEGORIES))
+ 
+# Each page is downloaded once and shared by recipe_scrapers and the fallback scraper
+def extract(url, html, category):
+    return extract_recipe_data(url, category, html)
+ 
+async def crawl(frontier, sink=None, discovery="category", since=None, workers=None, processes=True, **engine_options):
+    async with FetchEngine(headers=HEADERS, **engine_options) as engine:
+        await discover(engine, frontier, discovery=discovery, since=since)
+        await drain_site(engine, frontier, extract, sink, site="barefeet", workers=workers, processes=processes)
+ 
+# discovery="sitemap" reads post URLs from the sitemap instead of the category pages
+# (pass `since` to skip posts unchanged since then).
+# Progress is kept in `frontier_path`; rerunning after a crash or Ctrl-C resumes where it stopped.
+# Recipes are written to `output_file` (.csv, .jsonl or .parquet) as they are scraped.
+# Pages are extracted in a pool of worker processes, one per core (`workers`); processes=False uses threads.
+def main(output_file="barefeet_in_the_kitchen_recipes.csv", discovery="category", since=None,
+         frontier_path="barefeet_frontier.sqlite", workers=None, processes=True, **engine_options):
+    frontier = Frontier(frontier_path)
+    with open_sink(output_file, key_fields=("title", "url")) as sink:
+        # Recipes scraped by an interrupted run go out first
+        sink.write_all(frontier.records())
+        run_sync(crawl(frontier, sink, discovery=discovery, since=since, workers=workers, processes=processes,
+                       **engine_options))
+    print(f"Frontier: {frontier.counts()}")
+    print(f"\n✅ Done! Total recipes saved: {sink.count}")
+    frontier.finish()
+    frontier.close()
+ 
+# Lets recipe_common.orchestrator run this site alongside the others
+register_site("barefeet", "barefeetinthekitchen.com", discover, extract, key_fields=("title", "url"),
+              sitemap=True, per_host_concurrency=4, per_host_rate=2.0, headers=HEADERS)
+ 
+if __name__ == "__main__":
+    # Reruns revalidate pages cached by earlier runs instead of downloading them again
+    cache = ResponseCache("http_cache/barefeet")
+    # Every page downloaded is also archived, so extractors can be rerun on it without crawling again
+    archive = WarcArchive("warc/barefeet")
+    # Up to 4 requests in flight to barefeetinthekitchen.com, at most 2 requests/second
+    main(per_host_concurrency=4, per_host_rate=2.0, cache=cache, archive=archive)
+    print(f"HTTP cache: {cache.stats()}")
+    print(f"Raw page archive: {archive.stats()}")
+    cache.close()
+    archive.close()
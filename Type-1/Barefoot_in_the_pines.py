@@ -1,8 +1,22 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
-import time
+import asyncio
+import logging
+import os
+import re
+import sys
 import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.archive import WarcArchive
+from recipe_common.cache import ResponseCache
+from recipe_common.fetch import FetchEngine, run_sync
+from recipe_common.frontier import Frontier
+from recipe_common.pagination import paginate
+from recipe_common.parsing import make_card_soup
+from recipe_common.pipeline import drain_site
+from recipe_common.plan import Field, SelectorPlan
+from recipe_common.registry import register_site
+from recipe_common.sink import open_sink
+from recipe_common.sitemap import discover_sitemap_urls
  
 # Rotating User-Agent List to Avoid Blocking
 USER_AGENTS = [
@@ -11,116 +25,174 @@ USER_AGENTS = [
     "Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) AppleWebKit/537.36 (KHTML, like Gecko) Version/14.0 Mobile/15E148 Safari/537.36"
 ]
  
+BASE_URL = "https://barefootinthepines.com"
+ 
 # Recipe Categories to Scrape
 CATEGORIES = [
     "breakfast", "dinner", "desserts", "snacks", "side-dishes", "spring"
 ]
  
-def extract_recipe_details(recipe_url, category):
-    """Extracts recipe details from a valid recipe page."""
+# Besides the WPRM recipe card, only the title, featured image and category links are parsed
+RECIPE_CARD = ("div", {"class": "wprm-recipe-container"})
+PAGE_PARTS = [("h1", {"class": "post-title"}), ("img", {"class": "wp-post-image"}), ("a", {"rel": "category tag"})]
+
+# Every element the extractor reads, matched in one walk over those parts instead of one find() or select() each
+RECIPE_PLAN = SelectorPlan({
+    "title": Field("h1", {"class": "post-title"}),
+    "description": Field("div", {"class": "wprm-recipe-summary"}),
+    "image": Field("img", {"class": "wp-post-image"}),
+    # .wprm-recipe-time, .wprm-recipe-servings, in document order
+    "meta_items": Field(None, {"class": re.compile(r"^wprm-recipe-(?:time|servings)$")}, many=True),
+    "ingredients": Field(None, {"class": "wprm-recipe-ingredient"}, many=True),
+    "instructions": Field(None, {"class": "wprm-recipe-instruction-text"}, many=True),
+    "tags": Field("a", {"rel": "category tag"}, many=True),
+})
+
+def extract_recipe_details(recipe_url, category, html):
+    """Extracts recipe details from an already fetched recipe page."""
     recipe_data = {
         "title": "", "description": "", "prep_time": "", "cook_time": "", "total_time": "",
         "servings": "", "ingredients": "", "instructions": "", "cuisine": "",
         "meal_type": category, "image_url": "", "url": recipe_url
     }
 
-    try:
-        headers = {"User-Agent": random.choice(USER_AGENTS)}
-        response = requests.get(recipe_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # Extract Title
-        title_tag = soup.find("h1", class_="post-title")
-        if title_tag:
-            recipe_data["title"] = title_tag.text.strip()
-
-        # Extract Description
-        description_tag = soup.find("div", class_="wprm-recipe-summary")
-        if description_tag:
-            recipe_data["description"] = description_tag.text.strip()
-
-        # Extract Image URL
-        image_tag = soup.find("img", class_="wp-post-image")
-        if image_tag:
-            recipe_data["image_url"] = image_tag.get("src", "")
-
-        # Extract Times & Servings
-        meta_items = soup.select(".wprm-recipe-time, .wprm-recipe-servings")
-        for item in meta_items:
-            text = item.text.strip()
-            if "Prep Time" in text:
-                recipe_data["prep_time"] = text.replace("Prep Time:", "").strip()
-            elif "Cook Time" in text:
-                recipe_data["cook_time"] = text.replace("Cook Time:", "").strip()
-            elif "Total Time" in text:
-                recipe_data["total_time"] = text.replace("Total Time:", "").strip()
-            elif "Servings" in text:
-                recipe_data["servings"] = text.replace("Servings:", "").strip()
-
-        # Extract Ingredients
-        ingredients_tag = soup.select(".wprm-recipe-ingredient")
-        recipe_data["ingredients"] = "\n".join([li.text.strip() for li in ingredients_tag])
-
-        # Extract Instructions
-        instructions_tag = soup.select(".wprm-recipe-instruction-text")
-        recipe_data["instructions"] = "\n".join([li.text.strip() for li in instructions_tag])
-
-        # Extract Cuisine (Tags)
-        tags = soup.find_all("a", rel="category tag")
-        if tags:
-            recipe_data["cuisine"] = ", ".join([tag.text.strip() for tag in tags])
-
-    except Exception as e:
-        print(f"❌ Error scraping {recipe_url}: {e}")
+    found = RECIPE_PLAN.match(make_card_soup(html, RECIPE_CARD, keep=PAGE_PARTS))
+
+    # Extract Title
+    title_tag = found["title"]
+    if title_tag:
+        recipe_data["title"] = title_tag.text.strip()
+
+    # Extract Description
+    description_tag = found["description"]
+    if description_tag:
+        recipe_data["description"] = description_tag.text.strip()
+
+    # Extract Image URL
+    image_tag = found["image"]
+    if image_tag:
+        recipe_data["image_url"] = image_tag.get("src", "")
+
+    # Extract Times & Servings
+    for item in found["meta_items"]:
+        text = item.text.strip()
+        if "Prep Time" in text:
+            recipe_data["prep_time"] = text.replace("Prep Time:", "").strip()
+        elif "Cook Time" in text:
+            recipe_data["cook_time"] = text.replace("Cook Time:", "").strip()
+        elif "Total Time" in text:
+            recipe_data["total_time"] = text.replace("Total Time:", "").strip()
+        elif "Servings" in text:
+            recipe_data["servings"] = text.replace("Servings:", "").strip()
+
+    # Extract Ingredients
+    ingredients_tag = found["ingredients"]
+    recipe_data["ingredients"] = "\n".join([li.text.strip() for li in ingredients_tag])
+
+    # Extract Instructions
+    instructions_tag = found["instructions"]
+    recipe_data["instructions"] = "\n".join([li.text.strip() for li in instructions_tag])
+
+    # Extract Cuisine (Tags)
+    tags = found["tags"]
+    if tags:
+        recipe_data["cuisine"] = ", ".join([tag.text.strip() for tag in tags])
 
     return recipe_data
  
-def scrape_recipe_links(base_url, category):
-    """Extracts all recipe links for a specific category from the main site."""
+def article_links(soup):
+    """Links inside the articles of one listing page."""
+    return [a["href"] for a in soup.select("article a") if a.has_attr("href") and "/" in a["href"]]
+
+async def scrape_recipe_links(engine, base_url, category):
+    """Extracts all recipe links for a specific category from the main site.
+
+    The listing pages after the first are fetched concurrently once its pagination shows how many there are.
+    """
     print(f"🚀 Fetching recipe links for {category}...")
-    headers = {"User-Agent": random.choice(USER_AGENTS)}
     recipe_links = set()
-    page = 1
-
-    while True:
-        try:
-            url = f"{base_url}/category/{category}/page/{page}/" if page > 1 else f"{base_url}/category/{category}/"
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code != 200:
-                print(f"❌ Failed to access page {page} of {category}. Stopping.")
-                break
-
-            soup = BeautifulSoup(response.content, "html.parser")
-            links = [a["href"] for a in soup.select("article a") if a.has_attr("href") and "/" in a["href"]]
-
-            if not links:
-                break  # Stop when no more links are found
-
-            recipe_links.update(links)
-            print(f"✅ Page {page}: {len(links)} recipes found.")
-            page += 1
-            time.sleep(random.uniform(1, 3))  # Avoid rapid requests
-        except Exception as e:
-            print(f"❌ Error accessing page {page} of {category}: {e}")
-            break
+    category_url = f"{base_url}/category/{category}/"
+    async for page, links in paginate(engine, category_url, category_url + "page/{page}/", article_links):
+        recipe_links.update(links)
+        logging.debug("Page %d: %d recipes found", page, len(links))
 
     print(f"✅ Total {len(recipe_links)} recipe links found for {category}.")
     return list(recipe_links)
- 
-# Run the scraper
-base_url = "https://barefootinthepines.com"
-all_recipes = []
- 
-for category in CATEGORIES:
-    recipe_urls = scrape_recipe_links(base_url, category)
 
-    for url in recipe_urls:
-        recipe_data = extract_recipe_details(url, category)
-        all_recipes.append(recipe_data)
+async def scrape_sitemap_links(engine, base_url, since=None):
+    """Returns (post links from the WordPress sitemaps, whether they were read in full); used instead of walking category pages."""
+    entries, complete = await discover_sitemap_urls(engine, base_url, since=since)
+    recipe_links = [url for url, lastmod in entries]
+    print(f"✅ Total {len(recipe_links)} recipe links found in the sitemap.")
+    return recipe_links, complete
  
-df = pd.DataFrame(all_recipes)
- 
-# Save to CSV
-df.to_csv("barefoot_in_the_pines_recipes_by_category.csv", index=False)
-print("✅ Done! Data saved to barefoot_in_the_pines_recipes_by_category.csv")
+async def discover_category(engine, frontier, base_url, category):
+    """Adds a category's links to the frontier unless an interrupted run already listed it."""
+    if frontier.is_discovered(category):
+        return
+    frontier.add(await scrape_recipe_links(engine, base_url, category), category)
+    frontier.mark_discovered(category)
+
+async def discover_barefoot(engine, frontier, base_url, categories, discovery="category", since=None):
+    """Adds the recipe links of every category (or of the sitemap) to the frontier."""
+    if discovery == "sitemap":
+        if not frontier.is_discovered("sitemap"):
+            # The sitemap does not say which category a post is in
+            links, complete = await scrape_sitemap_links(engine, base_url, since=since)
+            frontier.add(links)
+            if complete:
+                frontier.mark_discovered("sitemap")
+            else:
+                print("The sitemap was not read in full; the next run reads it again")
+    else:
+        await asyncio.gather(*(discover_category(engine, frontier, base_url, category) for category in categories))
+
+def extract(url, html, category):
+    """extract_recipe_details with the argument order drain_site() uses."""
+    return extract_recipe_details(url, category, html)
+
+async def crawl_barefoot(base_url, categories, frontier, sink=None, discovery="category", since=None, workers=None,
+                         processes=True, **engine_options):
+    # One User-Agent per run; the engine's per-host rate replaces the random sleeps
+    headers = {"User-Agent": random.choice(USER_AGENTS)}
+    async with FetchEngine(headers=headers, **engine_options) as engine:
+        await discover_barefoot(engine, frontier, base_url, categories, discovery=discovery, since=since)
+        await drain_site(engine, frontier, extract, sink, site="barefoot", workers=workers, processes=processes)
+
+def scrape_barefoot_by_category(categories, output_file="barefoot_in_the_pines_recipes_by_category.csv",
+                                discovery="category", since=None, frontier_path="barefoot_frontier.sqlite",
+                                workers=None, processes=True, **engine_options):
+    """Scrapes every category (or, with discovery="sitemap", every post in the sitemap) and saves the recipes.
+
+    Recipes are written to `output_file` (.csv, .jsonl or .parquet) as they are scraped. Progress
+    is kept in `frontier_path`; rerunning after a crash or Ctrl-C resumes where it stopped. Pages
+    are extracted in a pool of worker processes, one per core (`workers`); processes=False uses threads.
+    """
+    frontier = Frontier(frontier_path)
+    with open_sink(output_file, key_fields=("title", "url")) as sink:
+        # Recipes scraped by an interrupted run go out first
+        sink.write_all(frontier.records())
+        run_sync(crawl_barefoot(BASE_URL, categories, frontier, sink, discovery=discovery,
+                                since=since, workers=workers, processes=processes, **engine_options))
+    print(f"Frontier: {frontier.counts()}")
+    print(f"✅ Done! Data saved to {output_file}")
+    frontier.finish()
+    frontier.close()
+
+# Lets recipe_common.orchestrator run this site alongside the others (with one User-Agent per run)
+register_site("barefoot", "barefootinthepines.com",
+              lambda engine, frontier, **options: discover_barefoot(engine, frontier, BASE_URL, CATEGORIES, **options),
+              extract, key_fields=("title", "url"), sitemap=True, per_host_concurrency=2, per_host_rate=1.0,
+              headers={"User-Agent": random.choice(USER_AGENTS)})
+
+if __name__ == "__main__":
+    # Reruns revalidate pages cached by earlier runs instead of downloading them again
+    cache = ResponseCache("http_cache/barefoot")
+    # Every page downloaded is also archived, so extractors can be rerun on it without crawling again
+    archive = WarcArchive("warc/barefoot")
+    # Run the scraper (small WordPress host: 2 requests in flight, at most 1 request/second)
+    scrape_barefoot_by_category(CATEGORIES, per_host_concurrency=2, per_host_rate=1.0, cache=cache, archive=archive)
+    print(f"HTTP cache: {cache.stats()}")
+    print(f"Raw page archive: {archive.stats()}")
+    cache.close()
+    archive.close()
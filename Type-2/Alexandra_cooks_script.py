@@ -1,214 +1,266 @@
-import requests
-import time
-import pandas as pd
-from bs4 import BeautifulSoup
-from recipe_scrapers import scrape_me
-
-# Function to get all recipe links from a category (Handles Pagination)
-def get_category_recipe_links(category_url):
+import asyncio
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.archive import WarcArchive
+from recipe_common.cache import ResponseCache
+from recipe_common.fetch import FetchEngine, run_sync
+from recipe_common.frontier import Frontier
+from recipe_common.pagination import paginate
+from recipe_common.parsing import make_card_soup
+from recipe_common.pipeline import drain_site
+from recipe_common.plan import Field, SelectorPlan
+from recipe_common.registry import register_site
+from recipe_common.sink import open_sink
+from recipe_common.sitemap import discover_sitemap_urls
+
+BASE_URL = "https://alexandracooks.com/category/recipe/"
+
+# Recipe links on one listing page (category pages also link to other categories)
+def recipe_links_on_page(soup):
+    return [link["href"] for link in soup.find_all("a", href=True)
+            if "https://alexandracooks.com/" in link["href"] and "category" not in link["href"]]
+
+# Function to get all recipe links from a category (Handles Pagination): once the first page's
+# pagination shows how many pages there are, the rest are fetched concurrently
+async def get_category_recipe_links(engine, category_url):
     recipe_links = set()  # Store unique recipe links
-    page = 1
-
-    while True:
-        url = f"{category_url}/page/{page}/" if page > 1 else category_url
-        print(f"Fetching recipes from: {url}")
-
-        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        if response.status_code != 200:
-            print(f"Failed to fetch {url}. Stopping pagination.")
-            break
-
-        soup = BeautifulSoup(response.text, "html.parser")
-        found_links = set()
-
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
-            if "https://alexandracooks.com/" in href and "category" not in href and href not in recipe_links:
-                recipe_links.add(href)
-                found_links.add(href)
-
-        if not found_links:
-            print(f"No more recipes found on page {page}. Stopping pagination.")
-            break
-
-        page += 1
-        time.sleep(1)
-
+    async for page, links in paginate(engine, category_url, f"{category_url}/page/{{page}}/", recipe_links_on_page):
+        recipe_links.update(links)
     return list(recipe_links)
 
-# Function to scrape recipe details
-def scrape_recipe(url, seen_titles):
-    try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code != 200:
-            print(f"Failed to fetch {url}")
-            return None
-
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # 1. Product name (title)
-        title = soup.find("h2", class_="tasty-recipes-title")
-        title = title.get_text(strip=True) if title else "No title found"
-
-        # 2. Short description
-        short_description = soup.find("div", class_="tasty-recipes-description-body")
-        short_description = short_description.get_text(strip=True) if short_description else "No short description found"
-
-        # 3. Prep time
-        prep_time = soup.find("span", class_="tasty-recipes-prep-time")
-        prep_time = prep_time.get_text(strip=True) if prep_time else "No prep time found"
-        # 4. Cook time
-        cook_time = soup.find("span", class_="tasty-recipes-cook-time")
-        cook_time = cook_time.get_text(strip=True) if cook_time else "No cook time found"
-
-        # 5. Total time
-        total_time = soup.find("span", class_="tasty-recipes-total-time")
-        total_time = total_time.get_text(strip=True) if total_time else "No total time found"
-
-        # 6. Servings
-        servings = soup.find("span", class_="tasty-recipes-yield")
-        servings = servings.get_text(strip=True) if servings else "No servings found"
-
-        # 7. Diet
-        diet = soup.find("span", class_="tasty-recipes-diet")
-        diet = diet.get_text(strip=True) if diet else "No diet found"
-
-        # 8. category
-        category = soup.find("span", class_="tasty-recipes-category")
-        category = category.get_text(strip=True) if category else "No category found"
-
-        # 6. method
-        method = soup.find("span", class_="tasty-recipes-method")
-        method = method.get_text(strip=True) if method else "No method found"
-
-        # 9. cuisine
-        cuisine = soup.find("span", class_="tasty-recipes-cuisine")
-        cuisine = cuisine.get_text(strip=True) if cuisine else "No cuisine found"
-
-        # 10. Ingredients
-        ingredient_items = soup.select("div.tasty-recipes-ingredients ul li")
-        ingredients_list = []
-        for li in ingredient_items:
-            text = li.get_text(separator=" ", strip=True)
-            if text:
-                ingredients_list.append(text)
-
-        # Step 2: Combine into a single string (line by line)
-        combined_ingredients = "\n".join(ingredients_list)
+# Everything the extractor reads is inside the Tasty Recipes card, so only that block is parsed
+RECIPE_CARD = ("div", {"class": "tasty-recipes"})
+
+# Every field the extractor reads, matched in one walk over the card instead of one find() each
+RECIPE_PLAN = SelectorPlan({
+    "title": Field("h2", {"class": "tasty-recipes-title"}),
+    "short_description": Field("div", {"class": "tasty-recipes-description-body"}),
+    "prep_time": Field("span", {"class": "tasty-recipes-prep-time"}),
+    "cook_time": Field("span", {"class": "tasty-recipes-cook-time"}),
+    "total_time": Field("span", {"class": "tasty-recipes-total-time"}),
+    "servings": Field("span", {"class": "tasty-recipes-yield"}),
+    "diet": Field("span", {"class": "tasty-recipes-diet"}),
+    "category": Field("span", {"class": "tasty-recipes-category"}),
+    "method": Field("span", {"class": "tasty-recipes-method"}),
+    "cuisine": Field("span", {"class": "tasty-recipes-cuisine"}),
+    # div.tasty-recipes-ingredients ul li
+    "ingredient_sections": Field("div", {"class": "tasty-recipes-ingredients"}, many=True),
+    "ingredient_lists": Field("ul", many=True, inside="ingredient_sections"),
+    "ingredients": Field("li", many=True, inside="ingredient_lists"),
+    "instructions": Field("li", {"id": re.compile(r"instruction-step-\d+")}, many=True),
+    "video_div": Field("div", {"class": "tasty-recipe-video-embed"}),
+    "video_iframe": Field("iframe", inside="video_div"),
+    "image_div": Field("div", {"class": "tasty-recipes-image"}),
+    "image_img": Field("img", inside="image_div"),
+})
+
+def text_or(found, field, missing):
+    element = found[field]
+    return element.get_text(strip=True) if element else missing
+
+# Function to scrape recipe details from an already fetched page
+def scrape_recipe(url, html, seen_titles):
+    found = RECIPE_PLAN.match(make_card_soup(html, RECIPE_CARD))
+
+    # 1. Product name (title)
+    title = text_or(found, "title", "No title found")
+
+    # 2. Short description
+    short_description = text_or(found, "short_description", "No short description found")
+
+    # 3. Prep time
+    prep_time = text_or(found, "prep_time", "No prep time found")
+    # 4. Cook time
+    cook_time = text_or(found, "cook_time", "No cook time found")
+
+    # 5. Total time
+    total_time = text_or(found, "total_time", "No total time found")
+
+    # 6. Servings
+    servings = text_or(found, "servings", "No servings found")
+
+    # 7. Diet
+    diet = text_or(found, "diet", "No diet found")
+
+    # 8. category
+    category = text_or(found, "category", "No category found")
+
+    # 6. method
+    method = text_or(found, "method", "No method found")
+
+    # 9. cuisine
+    cuisine = text_or(found, "cuisine", "No cuisine found")
+
+    # 10. Ingredients
+    ingredients_list = []
+    for li in found["ingredients"]:
+        text = li.get_text(separator=" ", strip=True)
+        if text:
+            ingredients_list.append(text)
+
+    # Step 2: Combine into a single string (line by line)
+    combined_ingredients = "\n".join(ingredients_list)
 
        # 11. Instructions
-        instruction_items = soup.find_all("li", id=re.compile(r"instruction-step-\d+"))
+    instruction_items = found["instructions"]
 
-        instructions = []
+    instructions = []
 
-        if instruction_items:
-            for item in instruction_items:
-                match = re.search(r"instruction-step-(\d+)", item.get("id"))
-                step_number = match.group(1) if match else "?"
-                instruction_text = item.get_text(strip=True)
-                instructions.append(f"{step_number}. {instruction_text}")
-        else:
-            instructions.append("No instructions found")
+    if instruction_items:
+        for item in instruction_items:
+            match = re.search(r"instruction-step-(\d+)", item.get("id"))
+            step_number = match.group(1) if match else "?"
+            instruction_text = item.get_text(strip=True)
+            instructions.append(f"{step_number}. {instruction_text}")
+    else:
+        instructions.append("No instructions found")
 
-        # Join all instructions into one string, separated by newlines or spaces
-        combined_instructions = "\n".join(instructions)  # or use " " if you prefer one-line
+    # Join all instructions into one string, separated by newlines or spaces
+    combined_instructions = "\n".join(instructions)  # or use " " if you prefer one-line
 
-        # 12. Instruction Video
-        video_div = soup.find("div", class_="tasty-recipe-video-embed")
-        video_url = None
+    # 12. Instruction Video
+    video_url = None
 
-        if video_div:
-            iframe = video_div.find("iframe")
-            if iframe and iframe.has_attr("src"):
-                video_url = iframe["src"]
-            else:
-                video_url = "No video URL found"
+    if found["video_div"]:
+        iframe = found["video_iframe"]
+        if iframe and iframe.has_attr("src"):
+            video_url = iframe["src"]
         else:
-            video_url = "No video section found"
-
-        # 13. Image URL - Extract the src from the img tag inside wprm-recipe-image div
-        image_div = soup.find("div", class_="tasty-recipes-image")
-        if image_div:
-            # Look for the 'img' tag and try to extract the image URL
-            img_tag = image_div.find("img")
-            if img_tag:
-                # First, try to get the image URL from 'data-lazy-src', then 'src' if necessary
-                image_url = img_tag.get("data-lazy-src") or img_tag.get("src")
-
-                if image_url:
-                    # Check if the image URL is a data URI (placeholder), skip if true
-                    if image_url.startswith("data:image"):
-                        image_url = "No valid image found (data URI)"
-                    # If the image URL is relative, prepend the base URL
-                    elif not image_url.startswith("http"):
-                        image_url = "https://alexandracooks.com" + image_url
-                else:
-                    image_url = "No image URL found"
+            video_url = "No video URL found"
+    else:
+        video_url = "No video section found"
+
+    # 13. Image URL - Extract the src from the img tag inside wprm-recipe-image div
+    if found["image_div"]:
+        # Look for the 'img' tag and try to extract the image URL
+        img_tag = found["image_img"]
+        if img_tag:
+            # First, try to get the image URL from 'data-lazy-src', then 'src' if necessary
+            image_url = img_tag.get("data-lazy-src") or img_tag.get("src")
+
+            if image_url:
+                # Check if the image URL is a data URI (placeholder), skip if true
+                if image_url.startswith("data:image"):
+                    image_url = "No valid image found (data URI)"
+                # If the image URL is relative, prepend the base URL
+                elif not image_url.startswith("http"):
+                    image_url = "https://alexandracooks.com" + image_url
             else:
-                image_url = "No img tag found"
+                image_url = "No image URL found"
         else:
-            image_url = "No image div found"
-
-        # 12. Product URL
-        product_url = url  # The product URL is simply the current URL
-
-        return {
-            "ProductName": title,
-            "Data_Source_URL": product_url,
-            "ProductShortDescription (Summary)": short_description,
-            "Cuisine_Type": cuisine,
-            "Meal_Type": method,
-            "Type_of_Diet": diet,
-            "cook_time": cook_time,
-            "prep_time": prep_time,
-            "image_url": image_url,
-            "servings": servings,
-            "total_time": total_time,
-            "Ingredients": combined_ingredients,
-            "instructions": combined_instructions,
-            "Video": video_url
-        }
-
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
-        return None
+            image_url = "No img tag found"
+    else:
+        image_url = "No image div found"
+
+    # 12. Product URL
+    product_url = url  # The product URL is simply the current URL
+
+    return {
+        "ProductName": title,
+        "Data_Source_URL": product_url,
+        "ProductShortDescription (Summary)": short_description,
+        "Cuisine_Type": cuisine,
+        "Meal_Type": method,
+        "Type_of_Diet": diet,
+        "cook_time": cook_time,
+        "prep_time": prep_time,
+        "image_url": image_url,
+        "servings": servings,
+        "total_time": total_time,
+        "Ingredients": combined_ingredients,
+        "instructions": combined_instructions,
+        "Video": video_url
+    }
+
+
+# Sitemap discovery: stream the WordPress post sitemaps instead of walking category pages
+async def get_sitemap_recipe_links(engine, since=None):
+    entries, complete = await discover_sitemap_urls(engine, "https://alexandracooks.com/", since=since)
+    recipe_links = [url for url, lastmod in entries]
+    print(f"Found {len(recipe_links)} recipes in the sitemap")
+    return recipe_links, complete
+
+# Discover one category's links into the frontier (skipped if an interrupted run already listed it)
+async def discover_category(engine, frontier, base_url, category):
+    if frontier.is_discovered(category):
+        return
+    category_url = f"{base_url}{category}"
+    print(f"\nScraping category: {category} ({category_url})")
+
+    recipe_links = await get_category_recipe_links(engine, category_url)
+    print(f"Found {len(recipe_links)} recipes in {category}")
+    frontier.add(recipe_links, category)
+    frontier.mark_discovered(category)
+
+async def discover_alexandracooks(engine, frontier, categories, base_url, discovery="category", since=None):
+    if discovery == "sitemap":
+        if not frontier.is_discovered("sitemap"):
+            # The sitemap does not say which category a post is in
+            links, complete = await get_sitemap_recipe_links(engine, since=since)
+            frontier.add(links)
+            if complete:
+                frontier.mark_discovered("sitemap")
+            else:
+                print("The sitemap was not read in full; the next run reads it again")
+    else:
+        await asyncio.gather(*(discover_category(engine, frontier, base_url, category) for category in categories))
+
+# A plain module-level function, so it can run in a worker process
+def extract(url, html, category):
+    recipe_data = scrape_recipe(url, html, set())
+    if recipe_data:
+        recipe_data["category"] = category
+    return recipe_data
+
+async def crawl_alexandracooks(categories, base_url, frontier, sink=None, discovery="category", since=None,
+                               workers=None, processes=True, **engine_options):
+    async with FetchEngine(**engine_options) as engine:
+        await discover_alexandracooks(engine, frontier, categories, base_url, discovery=discovery, since=since)
+        await drain_site(engine, frontier, extract, sink, site="alexandracooks", workers=workers, processes=processes)
 
 # Main function to scrape recipes from multiple categories
-def scrape_by_category(categories, output_file="alexandracooks_recipes.csv"):
-    base_url = "https://alexandracooks.com/category/recipe/"
-    all_recipes = []
-    seen_titles = set()  # Set to store unique titles
-
-    for category in categories:
-        category_url = f"{base_url}{category}"
-        print(f"\nScraping category: {category} ({category_url})")
-
-        recipe_links = get_category_recipe_links(category_url)
-        print(f"Found {len(recipe_links)} recipes in {category}")
-
-        for idx, recipe_url in enumerate(recipe_links):
-            print(f"Scraping {idx+1}/{len(recipe_links)}: {recipe_url}")
-            recipe_data = scrape_recipe(recipe_url, seen_titles)
-            if recipe_data:
-                recipe_data["category"] = category
-                all_recipes.append(recipe_data)
-            time.sleep(1)
-
-    # Convert to DataFrame
-    df = pd.DataFrame(all_recipes)
-
-    # **Remove exact duplicate rows**
-    df.drop_duplicates(subset=["ProductName", "Data_Source_URL"], keep="first", inplace=True)
-
-    # Save to CSV
-    df.to_csv(output_file, index=False)
-    print(f"\n✅ Saved {len(df)} unique recipes to {output_file}")
+# discovery="sitemap" reads post URLs from the sitemap instead (pass `since` to skip unchanged posts).
+# Progress is kept in `frontier_path`; rerunning after a crash or Ctrl-C resumes where it stopped.
+# Recipes are written to `output_file` (.csv, .jsonl or .parquet) as they are scraped.
+# Pages are extracted in a pool of worker processes, one per core (`workers`); processes=False uses threads.
+def scrape_by_category(categories, output_file="alexandracooks_recipes.csv", discovery="category", since=None,
+                       frontier_path="alexandracooks_frontier.sqlite", workers=None, processes=True, **engine_options):
+    frontier = Frontier(frontier_path)
+    # Duplicate rows (same name and URL) are dropped as they arrive
+    with open_sink(output_file, key_fields=("ProductName", "Data_Source_URL")) as sink:
+        # Recipes scraped by an interrupted run go out first
+        sink.write_all(frontier.records())
+        run_sync(crawl_alexandracooks(categories, BASE_URL, frontier, sink, discovery=discovery, since=since,
+                                      workers=workers, processes=processes, **engine_options))
+    print(f"Frontier: {frontier.counts()}")
+    print(f"\n✅ Saved {sink.count} unique recipes to {output_file}")
+    frontier.finish()
+    frontier.close()
 
 # Updated categories to scrape
 categories_to_scrape = [
     "sauces", "salads", "jams-spreads", "breakfast", "side-dish", "dinner", "appetizers", "lunch", "soup", "desserts", "bread",
     "drinks" ]
 
-# Run the scraper
-scrape_by_category(categories_to_scrape, output_file="alexandracooks_recipes.csv")
+# Lets recipe_common.orchestrator run this site alongside the others
+register_site("alexandracooks", "alexandracooks.com",
+              lambda engine, frontier, **options: discover_alexandracooks(engine, frontier, categories_to_scrape,
+                                                                          BASE_URL, **options),
+              extract, key_fields=("ProductName", "Data_Source_URL"), sitemap=True,
+              per_host_concurrency=4, per_host_rate=2.0)
+
+if __name__ == "__main__":
+    # Reruns revalidate pages cached by earlier runs instead of downloading them again
+    cache = ResponseCache("http_cache/alexandracooks")
+    # Every page downloaded is also archived, so extractors can be rerun on it without crawling again
+    archive = WarcArchive("warc/alexandracooks")
+    # Run the scraper (up to 4 requests in flight to alexandracooks.com, at most 2 requests/second)
+    scrape_by_category(categories_to_scrape, output_file="alexandracooks_recipes.csv",
+                       per_host_concurrency=4, per_host_rate=2.0, cache=cache, archive=archive)
+    print(f"HTTP cache: {cache.stats()}")
+    print(f"Raw page archive: {archive.stats()}")
+    cache.close()
+    archive.close()
@@ -1,155 +1,245 @@
-import requests
-import time
-import pandas as pd
-from bs4 import BeautifulSoup
- 
-# Function to get all category links
-def get_category_links(base_url):
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.archive import WarcArchive
+from recipe_common.cache import ResponseCache
+from recipe_common.fetch import FetchEngine, run_sync
+from recipe_common.frontier import Frontier
+from recipe_common.jsonld import fill_missing, find_recipe, recipe_fields
+from recipe_common.parsing import make_fragment_soup, make_soup
+from recipe_common.pipeline import drain_site
+from recipe_common.plan import Field, SelectorPlan
+from recipe_common.registry import register_site
+from recipe_common.sink import open_sink
+ 
+# Category links on the recipes page (categories are under "/recipes/")
+def category_links_on_page(soup):
     category_links = set()
-    print(f"Fetching categories from: {base_url}")
-   
-    response = requests.get(base_url, headers={"User-Agent": "Mozilla/5.0"})
-    if response.status_code != 200:
-        print("Failed to fetch categories. Stopping.")
-        return list(category_links)
- 
-    soup = BeautifulSoup(response.text, "html.parser")
- 
-    # Find all category links (categories are under "/recipes/")
     for link in soup.find_all("a", href=True):
         href = link["href"]
         if "/recipes/" in href and not href.endswith("recipes/"):
             full_url = f"https://www.jamieoliver.com{href}" if not href.startswith("http") else href
             category_links.add(full_url)
- 
-    print(f"✅ Found {len(category_links)} category links.")
     return list(category_links)
  
-# Function to get all recipe links from a category page
-def get_recipe_links_from_category(category_url):
+# Recipe links on one category page
+def recipe_links_on_page(soup):
     recipe_links = set()
-    print(f"Fetching recipes from: {category_url}")
- 
-    response = requests.get(category_url, headers={"User-Agent": "Mozilla/5.0"})
-    if response.status_code != 200:
-        print(f"Failed to fetch {category_url}")
-        return list(recipe_links)
- 
-    soup = BeautifulSoup(response.text, "html.parser")
- 
-    # Look for recipe links
     for link in soup.find_all("a", href=True):
         href = link["href"]
         if "/recipes/" in href and "recipe" in href:
             full_url = f"https://www.jamieoliver.com{href}" if not href.startswith("http") else href
             recipe_links.add(full_url)
+    return list(recipe_links)
  
+# Function to get all category links
+async def get_category_links(engine, base_url):
+    print(f"Fetching categories from: {base_url}")
+   
+    response = await engine.fetch_or_error(base_url)
+    if response.status != 200:
+        print("Failed to fetch categories. Stopping.")
+        return []
+ 
+    category_links = category_links_on_page(make_soup(response.text))
+    print(f"✅ Found {len(category_links)} category links.")
+    return category_links
+ 
+# Function to get all recipe links from a category page
+async def get_recipe_links_from_category(engine, category_url):
+    print(f"Fetching recipes from: {category_url}")
+ 
+    response = await engine.fetch_or_error(category_url)
+    if response.status != 200:
+        print(f"Failed to fetch {category_url}")
+        return []
+ 
+    recipe_links = recipe_links_on_page(make_soup(response.text))
     print(f"✅ Found {len(recipe_links)} recipes in {category_url}.")
-    return list(recipe_links)
+    return recipe_links
+ 
+# Page elements holding the cooking time / difficulty / servings facts and the nutrition cards
+RECIPE_FACTS = ("h6", {"class": "type-subtitle-sm line-clamp-2"})
+NUTRITION_CARDS = ("div", {"class": "nutrition--card"})
+ 
+# Every element the selector-based extractor reads, matched in one walk over the page instead of one find() each
+RECIPE_PLAN = SelectorPlan({
+    "title": Field("h1", {"class": "detail-panel__page-title"}),
+    "facts": Field(*RECIPE_FACTS, many=True),
+    "ingredients_div": Field("div", {"class": "ingredients-rich-text"}),
+    "ingredients": Field("p", {"class": "type-body"}, many=True, inside="ingredients_div"),
+    "method_div": Field("div", {"class": "rich-text astro-erqtmm5j rich-text--justify-center rich-text--align-left"}),
+    "method_list": Field("ol", inside="method_div"),
+    "method_steps": Field("li", many=True, inside="method_list"),
+    "image": Field("meta", {"property": "og:image"}),
+    "nutrition_cards": Field(*NUTRITION_CARDS, many=True),
+    "nutrition_titles": Field("p", {"class": "type-body-sm pb-6 capitalize astro-oujdv6rb"}, many=True,
+                              inside="nutrition_cards"),
+    "nutrition_percentages": Field("p", {"class": "type-highlight-sm relative astro-oujdv6rb"}, many=True,
+                                   inside="nutrition_cards"),
+})
+ 
+# Extract cooking time, difficulty, and servings
+def scrape_facts(found):
+    facts_data = [fact.get_text(strip=True) for fact in found["facts"]]
+    return "\n".join(facts_data)
+ 
+# Extract all nutrition information
+def scrape_nutrition(found):
+    nutrition_data = []
+    for card in found["nutrition_cards"]:
+        nutrition_title = found.first_inside(card, "nutrition_titles")
+        percentage = found.first_inside(card, "nutrition_percentages")
+        nutrition_data.append({
+            'Nutrition': nutrition_title.get_text(strip=True) if nutrition_title else "",
+            'Percentage': percentage.get_text(strip=True) if percentage else ""
+        })
+    return nutrition_data
+ 
+# Selector-based extractor, used when the page has no JSON-LD recipe (or for the fields it lacks)
+def scrape_recipe_html(url, html):
+    found = RECIPE_PLAN.match(make_soup(html))
+ 
+    # Extract recipe title
+    title = found["title"]
+    title = title.get_text(strip=True) if title else "No title found"
+ 
+    facts_text = scrape_facts(found)
+ 
+    # Extract ingredients
+    ingredients = [p.get_text(strip=True) for p in found["ingredients"]]
+    ingredients_text = "\n".join(ingredients)
+ 
+    # Extract method steps
+    method_steps = [f"{index+1}. {li.get_text(strip=True)}" for index, li in enumerate(found["method_steps"])]
+    method_text = "\n".join(method_steps)
+ 
+    # Extract image URL from meta tag
+    image_url = found["image"]
+    image_url = image_url["content"] if image_url else "No image URL found"
+ 
+    # Product URL
+    product_url = url
+ 
+    nutrition_data = scrape_nutrition(found)
+ 
+    return {
+        "product_name": title,
+        "time_serves_data": facts_text,
+        "ingredients": ingredients_text,
+        "method": method_text,
+        "image_url": image_url,
+        "product_url": product_url,
+        "nutrition_data": nutrition_data
+    }
+ 
+ 
+# Maps the page's schema.org Recipe onto our columns; None marks what the JSON-LD lacks
+def jsonld_record(url, recipe):
+    fields = recipe_fields(recipe)
+    return {
+        "product_name": fields["name"],
+        "time_serves_data": None,  # the difficulty is not in the JSON-LD
+        "ingredients": "\n".join(fields["ingredients"]) if fields["ingredients"] else None,
+        "method": "\n".join(f"{index+1}. {step}" for index, step in enumerate(fields["instructions"]))
+                  if fields["instructions"] else None,
+        "image_url": fields["image"],
+        "product_url": url,
+        "nutrition_data": None  # nor are the RI percentages
+    }
+ 
+def fallback_fields(url, html, missing):
+    # Usually only the facts and nutrition cards are missing; parse just those elements
+    if set(missing) <= {"time_serves_data", "nutrition_data"}:
+        found = RECIPE_PLAN.match(make_fragment_soup(html, [RECIPE_FACTS, NUTRITION_CARDS]))
+        return {"time_serves_data": scrape_facts(found), "nutrition_data": scrape_nutrition(found)}
+    return scrape_recipe_html(url, html)
+ 
+# Function to scrape recipe details from an already fetched page: the JSON-LD Recipe first,
+# the selectors only for the fields it lacks
+def scrape_recipe(url, html, seen_titles):
+    recipe = find_recipe(html)
+    if recipe is None:
+        recipe_data = scrape_recipe_html(url, html)
+    else:
+        recipe_data = fill_missing(jsonld_record(url, recipe),
+                                   lambda missing: fallback_fields(url, html, missing))
+    if recipe_data is None:
+        return None
  
-# Function to scrape recipe details
-def scrape_recipe(url, seen_titles):
-    try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=10)
-        if response.status_code != 200:
-            print(f"Failed to fetch {url}")
-            return None
- 
-        soup = BeautifulSoup(response.text, "html.parser")
- 
-        # Extract recipe title
-        title = soup.find("h1", class_='detail-panel__page-title')
-        title = title.get_text(strip=True) if title else "No title found"
- 
-        # Duplicate Check
-        if title in seen_titles:
-            print(f"Skipping duplicate recipe: {title}")
-            return None
-        seen_titles.add(title)
- 
-        # Extract cooking time, difficulty, and servings
-        recipe_facts = soup.find_all("h6", class_="type-subtitle-sm line-clamp-2")
-        facts_data = [fact.get_text(strip=True) for fact in recipe_facts]
-        facts_text = "\n".join(facts_data)
- 
-        # Extract ingredients
-        ingredients_div = soup.find("div", class_="ingredients-rich-text")
-        ingredients = [p.get_text(strip=True) for p in ingredients_div.find_all("p", class_="type-body")] if ingredients_div else []
-        ingredients_text = "\n".join(ingredients)
- 
-        # Extract method steps
-        method_div = soup.find("div", class_="rich-text astro-erqtmm5j rich-text--justify-center rich-text--align-left")
-        method_steps = []
-        if method_div:
-            ol_tag = method_div.find("ol")
-            method_steps = [f"{index+1}. {li.get_text(strip=True)}" for index, li in enumerate(ol_tag.find_all("li"))] if ol_tag else []
- 
-        method_text = "\n".join(method_steps)
- 
-        # Extract image URL from meta tag
-        image_url = soup.find("meta", property="og:image")
-        image_url = image_url["content"] if image_url else "No image URL found"
- 
-        # Product URL
-        product_url = url
- 
-        # Extract all nutrition information
-        nutrition_cards = soup.find_all('div', class_='nutrition--card')
-        nutrition_data = []
-        for card in nutrition_cards:
-            nutrition_title = card.find('p', class_='type-body-sm pb-6 capitalize astro-oujdv6rb')
-            percentage = card.find('p', class_='type-highlight-sm relative astro-oujdv6rb')
-            nutrition_data.append({
-                'Nutrition': nutrition_title.get_text(strip=True) if nutrition_title else "",
-                'Percentage': percentage.get_text(strip=True) if percentage else ""
-            })
- 
-        return {
-            "product_name": title,
-            "time_serves_data": facts_text,
-            "ingredients": ingredients_text,
-            "method": method_text,
-            "image_url": image_url,
-            "product_url": product_url,
-            "nutrition_data": nutrition_data
-        }
- 
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
+    # Duplicate Check
+    title = recipe_data["product_name"]
+    if title in seen_titles:
+        logging.debug("Skipping duplicate recipe: %s", title)
         return None
+    seen_titles.add(title)
+    return recipe_data
  
-# Main function to scrape all recipes
-def scrape_jamieoliver(output_file="jamieoliver_recipes.csv"):
-    base_url = "https://www.jamieoliver.com/recipes/"
-    all_recipes = []
-    seen_titles = set()
+# Collect a category's recipe links into the frontier (skipped if an interrupted run already listed it)
+async def discover_category(engine, frontier, category_url):
+    if frontier.is_discovered(category_url):
+        return
+    frontier.add(await get_recipe_links_from_category(engine, category_url))
+    frontier.mark_discovered(category_url)
+ 
+BASE_URL = "https://www.jamieoliver.com/recipes/"
  
+async def discover_jamieoliver(engine, frontier, base_url=BASE_URL):
     # Get all category links
-    category_links = get_category_links(base_url)
+    category_links = await get_category_links(engine, base_url)
  
-    # Collect all recipe links from each category
-    recipe_links = set()
-    for category_url in category_links:
-        category_recipe_links = get_recipe_links_from_category(category_url)
-        recipe_links.update(category_recipe_links)
-        time.sleep(1)  # To avoid overwhelming the server
- 
-    print(f"\n✅ Total recipes found: {len(recipe_links)}")
- 
-    # Scrape recipe details
-    for idx, recipe_url in enumerate(recipe_links):
-        print(f"Scraping {idx+1}/{len(recipe_links)}: {recipe_url}")
-        recipe_data = scrape_recipe(recipe_url, seen_titles)
-        if recipe_data:
-            all_recipes.append(recipe_data)
-        time.sleep(1)
- 
-    # Save to CSV
-    df = pd.DataFrame(all_recipes)
-    df.drop_duplicates(subset=["product_name", "product_url"], keep="first", inplace=True)
-    df.to_csv(output_file, index=False)
-    print(f"\n✅ Saved {len(df)} unique recipes to {output_file}")
- 
-# Run the scraper
-scrape_jamieoliver(output_file="jamieoliver_recipes.csv")
+    # Collect all recipe links from each category (the engine keeps the request rate polite)
+    await asyncio.gather(*(discover_category(engine, frontier, category_url) for category_url in category_links))
+ 
+    print(f"\n✅ Recipes left to scrape: {frontier.pending_count()}")
+ 
+# Without the duplicate check, so it can run in a worker process; drain_site() and the
+# orchestrator drop repeated titles themselves (unique_field="product_name")
+def extract(url, html, category):
+    return scrape_recipe(url, html, set())
+ 
+async def crawl_jamieoliver(base_url, frontier, sink=None, workers=None, processes=True, **engine_options):
+    async with FetchEngine(**engine_options) as engine:
+        await discover_jamieoliver(engine, frontier, base_url)
+ 
+        # Scrape recipe details
+        await drain_site(engine, frontier, extract, sink, site="jamieoliver", unique_field="product_name",
+                         workers=workers, processes=processes)
+ 
+# Main function to scrape all recipes
+# Progress is kept in `frontier_path`; rerunning after a crash or Ctrl-C resumes where it stopped.
+# Recipes are written to `output_file` (.csv, .jsonl or .parquet) as they are scraped.
+# Pages are extracted in a pool of worker processes, one per core (`workers`); processes=False uses threads.
+def scrape_jamieoliver(output_file="jamieoliver_recipes.csv", frontier_path="jamieoliver_frontier.sqlite",
+                       workers=None, processes=True, **engine_options):
+    frontier = Frontier(frontier_path)
+    # Duplicate rows (same name and URL) are dropped as they arrive
+    with open_sink(output_file, key_fields=("product_name", "product_url")) as sink:
+        # Recipes scraped by an interrupted run go out first
+        sink.write_all(frontier.records())
+        run_sync(crawl_jamieoliver(BASE_URL, frontier, sink, workers=workers, processes=processes, **engine_options))
+    print(f"Frontier: {frontier.counts()}")
+    print(f"\n✅ Saved {sink.count} unique recipes to {output_file}")
+    frontier.finish()
+    frontier.close()
+ 
+# Lets recipe_common.orchestrator run this site alongside the others
+register_site("jamieoliver", "www.jamieoliver.com", discover_jamieoliver, extract,
+              key_fields=("product_name", "product_url"), unique_field="product_name",
+              per_host_concurrency=4, per_host_rate=2.0)
+ 
+if __name__ == "__main__":
+    # Reruns revalidate pages cached by earlier runs instead of downloading them again
+    cache = ResponseCache("http_cache/jamieoliver")
+    # Every page downloaded is also archived, so extractors can be rerun on it without crawling again
+    archive = WarcArchive("warc/jamieoliver")
+    # Run the scraper (up to 4 requests in flight to jamieoliver.com, at most 2 requests/second)
+    scrape_jamieoliver(output_file="jamieoliver_recipes.csv", per_host_concurrency=4, per_host_rate=2.0,
+                       cache=cache, archive=archive)
+    print(f"HTTP cache: {cache.stats()}")
+    print(f"Raw page archive: {archive.stats()}")
+    cache.close()
+    archive.close()
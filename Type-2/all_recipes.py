@@ -1,48 +1,55 @@
-import requests
-import csv
-import time
-import pandas as pd
-from bs4 import BeautifulSoup
-from recipe_scrapers import scrape_me
- 
-# Function to get all recipe category URLs from AllRecipes homepage
-def get_all_categories(base_url="https://www.allrecipes.com"):
+import asyncio
+import logging
+import os
+import sys
+from recipe_scrapers import scrape_html
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.archive import WarcArchive
+from recipe_common.cache import ResponseCache
+from recipe_common.fetch import FetchEngine, run_sync
+from recipe_common.frontier import Frontier
+from recipe_common.parsing import make_soup
+from recipe_common.pipeline import drain_site
+from recipe_common.plan import Field, SelectorPlan
+from recipe_common.registry import register_site
+from recipe_common.sink import open_sink
+ 
+# Links to recipe categories on the AllRecipes homepage
+def category_links_on_page(soup, base_url="https://www.allrecipes.com"):
     category_links = []
- 
-    print("Fetching all recipe categories...")
-    response = requests.get(base_url)
-    if response.status_code != 200:
-        print("Failed to fetch categories.")
-        return category_links
- 
-    soup = BeautifulSoup(response.text, "html.parser")
- 
-    # Find all links to categories
     for link in soup.find_all("a", href=True):
         href = link["href"]
         if "/recipes/" in href and base_url in href:
             category_links.append(href)
- 
     return list(set(category_links))  # Remove duplicates
  
-# Function to get all recipe links from a category page
-def get_recipe_links(category_url, num_pages=1):
-    recipe_links = []
+# Recipe links on one category page
+def recipe_links_on_page(soup):
+    return [link["href"] for link in soup.find_all("a", href=True)
+            if "/recipe/" in link["href"] and "allrecipes.com" in link["href"]]
  
-    for page in range(1, num_pages + 1):
-        url = f"{category_url}?page={page}"
-        print(f"Scraping category page: {url}")
+# Function to get all recipe category URLs from AllRecipes homepage
+async def get_all_categories(engine, base_url="https://www.allrecipes.com"):
+    print("Fetching all recipe categories...")
+    response = await engine.fetch_or_error(base_url)
+    if response.status != 200:
+        print("Failed to fetch categories.")
+        return []
+    return category_links_on_page(make_soup(response.text), base_url)
  
-        response = requests.get(url)
-        if response.status_code != 200:
-            print("Failed to fetch:", url)
+# Function to get all recipe links from a category page (all listing pages are fetched concurrently)
+async def get_recipe_links(engine, category_url, num_pages=1):
+    recipe_links = []
+ 
+    urls = [f"{category_url}?page={page}" for page in range(1, num_pages + 1)]
+    async for response in engine.fetch_all(urls):
+        logging.debug("Scraping category page: %s", response.url)
+        if response.status != 200:
+            logging.debug("Failed to fetch: %s", response.url)
             continue
  
-        soup = BeautifulSoup(response.text, "html.parser")
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
-            if "/recipe/" in href and "allrecipes.com" in href:
-                recipe_links.append(href)
+        recipe_links.extend(recipe_links_on_page(make_soup(response.text)))
  
     return list(set(recipe_links))  # Remove duplicates
  
@@ -60,140 +67,174 @@ def convert_minutes_to_time(minutes):
     else:
         return f"{mins} mins"
  
-# Function to scrape recipe details including multiple serving sizes
-def scrape_recipe(url):
-    try:
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"Failed to fetch {url}")
-            return None
- 
-        soup = BeautifulSoup(response.text, "html.parser")
- 
-        # Initialize scraper using recipe_scrapers
-        scraper = scrape_me(url)
- 
-        # Get the title
-        title = soup.find("h1").get_text(strip=True) if soup.find("h1") else "No title found"
- 
-        # Extract Prep Time, Cook Time, Additional Time, Total Time, and Servings
-        time_data = {}
-        time_labels = ["Prep Time", "Cook Time", "Additional Time", "Total Time", "Servings"]
- 
-        # Normalize labels to avoid spacing & casing issues
-        time_labels_normalized = {label.lower(): label for label in time_labels}
- 
-        time_items = soup.find_all("div", class_="mm-recipes-details__item")
- 
-        for item in time_items:
-            label = item.find("div", class_="mm-recipes-details__label")
-            value = item.find("div", class_="mm-recipes-details__value")
- 
-            if label and value:
-                label_text = " ".join(label.get_text(strip=True).split()).lower()  # Remove extra spaces, normalize case
-                value_text = value.get_text(strip=True)
- 
-                print(f"Found label: '{label_text}' with value: '{value_text}'")  # Debugging line
- 
-                if label_text in time_labels_normalized:
-                    original_label = time_labels_normalized[label_text]
-                    time_data[original_label] = value_text  # Store value with original label format
- 
-        # Check for missing prep time and use scraper's value if needed
-        prep_time_formatted = convert_minutes_to_time(scraper.prep_time()) if scraper.prep_time() else time_data.get("Prep Time", "Not available")
- 
-        # Extract servings and ingredients based on serving sizes
-        serving_sizes = {"1x": "1", "2x": "2", "4x": "4"}
-        ingredients_data = {}
- 
-        for label, value in serving_sizes.items():
-            serving_size_input = soup.find("input", {"value": value})
-            if serving_size_input:
-                serving_size_input["checked"] = "checked"  # Simulate selection
- 
-            # Extract ingredients for this serving size
-            ingredients_list = soup.find_all("li", class_="mm-recipes-structured-ingredients__list-item")
-            ingredients = [item.get_text(strip=True) for item in ingredients_list]
-            ingredients_data[label] = ingredients
- 
-        # Convert times to readable format
-        cook_time_formatted = convert_minutes_to_time(scraper.cook_time()) if scraper.cook_time() else time_data.get("Cook Time", "Not available")
-        additional_time_formatted = convert_minutes_to_time(scraper.total_time() - scraper.prep_time() - scraper.cook_time()) if scraper.total_time() else time_data.get("Additional Time", "Not available")
-        total_time_formatted = convert_minutes_to_time(scraper.total_time()) if scraper.total_time() else time_data.get("Total Time", "Not available")
- 
-        # Extract nutrition facts from the HTML
-        nutrition_facts = {}
-        nutrition_table = soup.find("table", class_="mm-recipes-nutrition-facts-summary__table")
-        if nutrition_table:
-            rows = nutrition_table.find_all("tr")
-            for row in rows:
-                columns = row.find_all("td")
-                if len(columns) == 2:
-                    nutrient_name = columns[1].get_text(strip=True)
-                    nutrient_value = columns[0].get_text(strip=True)
-                    nutrition_facts[nutrient_name] = nutrient_value
- 
-        # Extract daily value percentages for nutrition facts
-        daily_values = {}
-        nutrition_label_table = soup.find("table", class_="mm-recipes-nutrition-facts-label__table")
-        if nutrition_label_table:
-            rows = nutrition_label_table.find_all("tr")
-            for row in rows:
-                columns = row.find_all("td")
-                if len(columns) == 2:
-                    nutrient_name = columns[0].get_text(strip=True)
-                    daily_value = columns[1].get_text(strip=True)
-                    if "%" in daily_value:  # Ensure it's a daily value percentage
-                        daily_values[nutrient_name] = daily_value
- 
-        return {
-            "title": title,
-            "ingredients_1x": "\n".join(ingredients_data.get("1x", [])),
-            "ingredients_2x": "\n".join(ingredients_data.get("2x", [])),
-            "ingredients_4x": "\n".join(ingredients_data.get("4x", [])),
-            "instructions": "\n".join(scraper.instructions().split("\n")),
-            "prep_time": prep_time_formatted,
-            "cook_time": cook_time_formatted,
-            "additional_time": additional_time_formatted,
-            "total_time": total_time_formatted,
-            "yields": scraper.yields(),
-            "image": scraper.image(),
-            "host": scraper.host(),
-            "servings": time_data.get("Servings", "Not available"),
-            "nutrition_facts": nutrition_facts,  # Include nutrition facts
-            "daily_values": daily_values,  # Include daily values
-            "url": url
-        }
- 
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
-        return None
- 
-# Main function to scrape and save recipes
-def scrape_allrecipes(num_pages_per_category=1, output_file="newallrecipes.csv"):
+# Every element the extractor reads, matched in one walk over the page instead of one find() each
+RECIPE_PLAN = SelectorPlan({
+    "title": Field("h1"),
+    "time_items": Field("div", {"class": "mm-recipes-details__item"}, many=True),
+    "time_labels": Field("div", {"class": "mm-recipes-details__label"}, many=True, inside="time_items"),
+    "time_values": Field("div", {"class": "mm-recipes-details__value"}, many=True, inside="time_items"),
+    "serving_size_inputs": Field("input", {"value": True}, many=True),
+    "ingredients": Field("li", {"class": "mm-recipes-structured-ingredients__list-item"}, many=True),
+    "nutrition_table": Field("table", {"class": "mm-recipes-nutrition-facts-summary__table"}),
+    "nutrition_rows": Field("tr", many=True, inside="nutrition_table"),
+    "nutrition_columns": Field("td", many=True, inside="nutrition_rows"),
+    "nutrition_label_table": Field("table", {"class": "mm-recipes-nutrition-facts-label__table"}),
+    "nutrition_label_rows": Field("tr", many=True, inside="nutrition_label_table"),
+    "nutrition_label_columns": Field("td", many=True, inside="nutrition_label_rows"),
+})
+ 
+# Function to scrape recipe details including multiple serving sizes from an already fetched page
+def scrape_recipe(url, html):
+    found = RECIPE_PLAN.match(make_soup(html))
+ 
+    # Initialize scraper using recipe_scrapers on the same HTML (no second download)
+    scraper = scrape_html(html, org_url=url)
+ 
+    # Get the title
+    title = found["title"].get_text(strip=True) if found["title"] else "No title found"
+ 
+    # Extract Prep Time, Cook Time, Additional Time, Total Time, and Servings
+    time_data = {}
+    time_labels = ["Prep Time", "Cook Time", "Additional Time", "Total Time", "Servings"]
+ 
+    # Normalize labels to avoid spacing & casing issues
+    time_labels_normalized = {label.lower(): label for label in time_labels}
+ 
+    for item in found["time_items"]:
+        label = found.first_inside(item, "time_labels")
+        value = found.first_inside(item, "time_values")
+ 
+        if label and value:
+            label_text = " ".join(label.get_text(strip=True).split()).lower()  # Remove extra spaces, normalize case
+            value_text = value.get_text(strip=True)
+ 
+            if label_text in time_labels_normalized:
+                original_label = time_labels_normalized[label_text]
+                time_data[original_label] = value_text  # Store value with original label format
+ 
+    # Check for missing prep time and use scraper's value if needed
+    prep_time_formatted = convert_minutes_to_time(scraper.prep_time()) if scraper.prep_time() else time_data.get("Prep Time", "Not available")
+ 
+    # Extract servings and ingredients based on serving sizes
+    serving_sizes = {"1x": "1", "2x": "2", "4x": "4"}
+    ingredients_data = {}
+ 
+    for label, value in serving_sizes.items():
+        serving_size_input = next((item for item in found["serving_size_inputs"] if item.get("value") == value), None)
+        if serving_size_input:
+            serving_size_input["checked"] = "checked"  # Simulate selection
+ 
+        # Extract ingredients for this serving size
+        ingredients = [item.get_text(strip=True) for item in found["ingredients"]]
+        ingredients_data[label] = ingredients
+ 
+    # Convert times to readable format
+    cook_time_formatted = convert_minutes_to_time(scraper.cook_time()) if scraper.cook_time() else time_data.get("Cook Time", "Not available")
+    additional_time_formatted = convert_minutes_to_time(scraper.total_time() - scraper.prep_time() - scraper.cook_time()) if scraper.total_time() else time_data.get("Additional Time", "Not available")
+    total_time_formatted = convert_minutes_to_time(scraper.total_time()) if scraper.total_time() else time_data.get("Total Time", "Not available")
+ 
+    # Extract nutrition facts from the HTML
+    nutrition_facts = {}
+    nutrition_table = found["nutrition_table"]
+    if nutrition_table:
+        rows = found.inside(nutrition_table, "nutrition_rows")
+        for row in rows:
+            columns = found.inside(row, "nutrition_columns")
+            if len(columns) == 2:
+                nutrient_name = columns[1].get_text(strip=True)
+                nutrient_value = columns[0].get_text(strip=True)
+                nutrition_facts[nutrient_name] = nutrient_value
+ 
+    # Extract daily value percentages for nutrition facts
+    daily_values = {}
+    nutrition_label_table = found["nutrition_label_table"]
+    if nutrition_label_table:
+        rows = found.inside(nutrition_label_table, "nutrition_label_rows")
+        for row in rows:
+            columns = found.inside(row, "nutrition_label_columns")
+            if len(columns) == 2:
+                nutrient_name = columns[0].get_text(strip=True)
+                daily_value = columns[1].get_text(strip=True)
+                if "%" in daily_value:  # Ensure it's a daily value percentage
+                    daily_values[nutrient_name] = daily_value
+ 
+    return {
+        "title": title,
+        "ingredients_1x": "\n".join(ingredients_data.get("1x", [])),
+        "ingredients_2x": "\n".join(ingredients_data.get("2x", [])),
+        "ingredients_4x": "\n".join(ingredients_data.get("4x", [])),
+        "instructions": "\n".join(scraper.instructions().split("\n")),
+        "prep_time": prep_time_formatted,
+        "cook_time": cook_time_formatted,
+        "additional_time": additional_time_formatted,
+        "total_time": total_time_formatted,
+        "yields": scraper.yields(),
+        "image": scraper.image(),
+        "host": scraper.host(),
+        "servings": time_data.get("Servings", "Not available"),
+        "nutrition_facts": nutrition_facts,  # Include nutrition facts
+        "daily_values": daily_values,  # Include daily values
+        "url": url
+    }
+ 
+ 
+# Collect one category's recipe links into the frontier (skipped if an interrupted run already listed it)
+async def discover_category(engine, frontier, category_url, num_pages):
+    if frontier.is_discovered(category_url):
+        return
+    recipe_links = await get_recipe_links(engine, category_url, num_pages=num_pages)
+    print(f"Found {len(recipe_links)} recipes in {category_url}")
+    frontier.add(recipe_links, category_url)
+    frontier.mark_discovered(category_url)
+ 
+async def discover_allrecipes(engine, frontier, num_pages_per_category):
     print("Step 1: Getting all recipe categories...")
-    category_links = get_all_categories()
+    category_links = await get_all_categories(engine)
  
     print(f"Found {len(category_links)} categories. Scraping recipes from each category...")
  
-    all_recipes = []
- 
-    for idx, category_url in enumerate(category_links):
-        print(f"\nScraping category {idx+1}/{len(category_links)}: {category_url}")
+    await asyncio.gather(*(discover_category(engine, frontier, category_url, num_pages_per_category)
+                           for category_url in category_links))
  
-        recipe_links = get_recipe_links(category_url, num_pages=num_pages_per_category)
+def extract(url, html, category):
+    return scrape_recipe(url, html)
  
-        for recipe_idx, recipe_url in enumerate(recipe_links):
-            print(f"Scraping recipe {recipe_idx+1}/{len(recipe_links)}: {recipe_url}")
-            recipe_data = scrape_recipe(recipe_url)
-            if recipe_data:
-                all_recipes.append(recipe_data)
-            time.sleep(1)  # Avoid server overload
+async def crawl_allrecipes(num_pages_per_category, frontier, sink=None, workers=None, processes=True,
+                           **engine_options):
+    async with FetchEngine(**engine_options) as engine:
+        await discover_allrecipes(engine, frontier, num_pages_per_category)
+        await drain_site(engine, frontier, extract, sink, site="allrecipes", workers=workers, processes=processes)
  
-    # Save data to CSV
-    df = pd.DataFrame(all_recipes)
-    df.to_csv(output_file, index=False)
-    print(f"\n✅ Saved {len(all_recipes)} recipes to {output_file}")
- 
-# Run the scraper to capture all recipes
-scrape_allrecipes(num_pages_per_category=2, output_file="newallrecipes.csv")
\ No newline at end of file
+# Main function to scrape and save recipes
+# Progress is kept in `frontier_path`; rerunning after a crash or Ctrl-C resumes where it stopped.
+# Recipes are written to `output_file` (.csv, .jsonl or .parquet) as they are scraped.
+# Pages are extracted in a pool of worker processes, one per core (`workers`); processes=False uses threads.
+def scrape_allrecipes(num_pages_per_category=1, output_file="newallrecipes.csv",
+                      frontier_path="allrecipes_frontier.sqlite", workers=None, processes=True, **engine_options):
+    frontier = Frontier(frontier_path)
+    with open_sink(output_file, key_fields=("title", "url")) as sink:
+        # Recipes scraped by an interrupted run go out first
+        sink.write_all(frontier.records())
+        run_sync(crawl_allrecipes(num_pages_per_category, frontier, sink, workers=workers, processes=processes,
+                                  **engine_options))
+    print(f"Frontier: {frontier.counts()}")
+    print(f"\n✅ Saved {sink.count} recipes to {output_file}")
+    frontier.finish()
+    frontier.close()
+ 
+# Lets recipe_common.orchestrator run this site alongside the others (2 listing pages per category)
+register_site("allrecipes", "www.allrecipes.com", lambda engine, frontier: discover_allrecipes(engine, frontier, 2),
+              extract, key_fields=("title", "url"), per_host_concurrency=8, per_host_rate=4.0)
+ 
+if __name__ == "__main__":
+    # Reruns revalidate pages cached by earlier runs instead of downloading them again
+    cache = ResponseCache("http_cache/allrecipes")
+    # Every page downloaded is also archived, so extractors can be rerun on it without crawling again
+    archive = WarcArchive("warc/allrecipes")
+    # Run the scraper to capture all recipes (up to 8 requests in flight, at most 4 requests/second)
+    scrape_allrecipes(num_pages_per_category=2, output_file="newallrecipes.csv",
+                      per_host_concurrency=8, per_host_rate=4.0, cache=cache, archive=archive)
+    print(f"HTTP cache: {cache.stats()}")
+    print(f"Raw page archive: {archive.stats()}")
+    cache.close()
+    archive.close()
\ No newline at end of file
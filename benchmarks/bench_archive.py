@@ -0,0 +1,95 @@
+"""Size and speed of the raw-page archive: gzip and zstd per record, with and without a dictionary.
+
+Turns the pages a scraper saved in its response cache (http_cache/<site>) into WARC
+records and compresses each on its own, as the archive does (so any page can be read
+back alone), with gzip (.warc.gz), plain zstd and zstd with a dictionary trained on the
+site's first --train pages. Reports the ratio to the uncompressed records, MB/s written
+and the time to read one page back from a WarcArchive:
+
+    python benchmarks/bench_archive.py
+    python benchmarks/bench_archive.py --sites addapinch jamieoliver --level 19
+"""
+import argparse
+import gzip
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import zstandard
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from recipe_common.archive import WarcArchive, warc_record
+from recipe_common.cache import ResponseCache
+
+
+def load_pages(cache_dir, limit=None):
+    cache = ResponseCache(cache_dir)
+    pages = [page for page in cache.pages() if page.status == 200]
+    cache.close()
+    return pages[:limit] if limit else pages
+
+
+def measure(name, records, compress):
+    start = time.perf_counter()
+    stored = sum(len(compress(record)) for record in records)
+    seconds = time.perf_counter() - start
+    raw = sum(len(record) for record in records)
+    print(f"  {name:<22} {raw / stored:6.1f}x  {stored / len(records) / 1024:7.1f} KB/page  "
+          f"{raw / seconds / 2 ** 20:7.1f} MB/s")
+
+
+def bench_site(name, cache_root, level, train, limit):
+    pages = load_pages(os.path.join(cache_root, name), limit)
+    if len(pages) <= train:
+        print(f"{name}: {len(pages)} saved pages in {os.path.join(cache_root, name)}; more than {train} are needed")
+        return
+    records = [warc_record(page) for page in pages]
+    print(f"\n{name}: {len(records)} pages, {sum(map(len, records)) / len(records) / 1024:.1f} KB/record uncompressed")
+    measure("gzip -6", records, lambda record: gzip.compress(record, 6))
+    measure(f"zstd -{level}", records, zstandard.ZstdCompressor(level=level).compress)
+    dictionary = zstandard.train_dictionary(112 * 1024, records[:train], level=level)
+    # The records the dictionary was trained on would flatter it; only the rest are measured
+    measure(f"zstd -{level} + dictionary", records[train:],
+            zstandard.ZstdCompressor(level=level, dict_data=dictionary).compress)
+
+    directory = tempfile.mkdtemp()
+    try:
+        archive = WarcArchive(directory, level=level, train_records=train)
+        start = time.perf_counter()
+        for page in pages:
+            archive.write(page)
+        archive.flush()
+        written = time.perf_counter() - start
+        sample = random.Random(0).sample(pages, min(200, len(pages)))
+        start = time.perf_counter()
+        for page in sample:
+            assert archive.read(page.url).body == page.body
+        read = (time.perf_counter() - start) / len(sample)
+        stats = archive.stats()
+        archive.close()
+    finally:
+        shutil.rmtree(directory)
+    print(f"  WarcArchive: {stats['ratio']}x with the first {train} pages included, "
+          f"{len(pages) / written:.0f} pages/s written, {read * 1000:.2f} ms to read a page back")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cache-root", default=os.path.join(ROOT, "http_cache"))
+    parser.add_argument("--sites", nargs="+", help="cache directories under --cache-root (default: all)")
+    parser.add_argument("--level", type=int, default=9, help="zstd level")
+    parser.add_argument("--train", type=int, default=64, help="pages the dictionary is trained on")
+    parser.add_argument("--limit", type=int, help="pages per site")
+    args = parser.parse_args()
+    sites = args.sites or sorted(entry for entry in os.listdir(args.cache_root)
+                                 if os.path.isdir(os.path.join(args.cache_root, entry)))
+    for name in sites:
+        bench_site(name, args.cache_root, args.level, args.train, args.limit)
+
+
+if __name__ == "__main__":
+    main()
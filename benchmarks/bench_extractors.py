@@ -0,0 +1,245 @@
+"""Speed, memory and output of every site extractor on saved pages, without the network.
+
+benchmarks/fixtures/<site>/ holds a recipe page and a category listing page of each
+site (manifest.json says which URL each one stands for) and golden.json the output
+every extractor gave for them. Each case runs one extractor on one page, link
+discovery included, and fails if the output no longer matches the golden one:
+
+    python -m pytest benchmarks/bench_extractors.py
+    RECIPE_PARSER=lxml python -m pytest benchmarks/bench_extractors.py --benchmark-autosave
+    python -m pytest benchmarks/bench_extractors.py --benchmark-compare
+    python benchmarks/bench_extractors.py --parser lxml        # the same without pytest
+    python benchmarks/bench_extractors.py --parity             # every parser gives html.parser's output
+    python benchmarks/bench_extractors.py --update-golden      # after an intended output change
+    python benchmarks/bench_extractors.py --record addapinch   # replace a site's pages with live ones
+
+The pytest run needs pytest-benchmark (`pip install pytest-benchmark`); its ops/s
+column is pages per second, and each case's peak memory is in extra_info["peak_kb"].
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from recipe_common import parsing
+from recipe_common.parsing import make_soup
+from recipe_common.registry import load_script
+
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+
+SCRIPTS = {
+    "15gram": "Type-1/15gram.py",
+    "abuelas": "Type-1/Abeulas_Counter_Script.py",
+    "addapinch": "Type-1/Add_a_pinch.py",
+    "barefeet": "Type-1/Barefeet_in_the_kitchen.py",
+    "barefoot": "Type-1/Barefoot_in_the_pines.py",
+    "alexandracooks": "Type-2/Alexandra_cooks_script.py",
+    "jamieoliver": "Type-2/Jamie_Oliver_Script.py",
+    "allrecipes": "Type-2/all_recipes.py",
+}
+
+
+# How each kind of extractor is called on a page
+def recipe(function, url, html):
+    return function(url, html)
+
+
+def recipe_seen(function, url, html):
+    # Add a Pinch, Alexandra Cooks and Jamie Oliver also drop titles already seen
+    return function(url, html, set())
+
+
+def recipe_category(function, url, html):
+    return function(url, "dinner", html)
+
+
+def links(function, url, html):
+    return sorted(set(function(make_soup(html))))
+
+
+# (site, function, page, call)
+CASES = [
+    ("15gram", "scrape_recipe", "recipe", recipe),
+    ("15gram", "scrape_recipe_html", "recipe", recipe),
+    ("15gram", "recipe_links_on_page", "listing", links),
+    ("abuelas", "scrape_recipe", "recipe", recipe),
+    ("abuelas", "recipe_links_on_page", "listing", links),
+    ("addapinch", "scrape_recipe", "recipe", recipe_seen),
+    ("addapinch", "scrape_recipe_html", "recipe", recipe),
+    ("addapinch", "recipe_links_on_page", "listing", links),
+    ("barefeet", "extract_recipe_data", "recipe", recipe_category),
+    ("barefeet", "fallback_scraper", "recipe", recipe),
+    ("barefeet", "article_links", "listing", links),
+    ("barefoot", "extract_recipe_details", "recipe", recipe_category),
+    ("barefoot", "article_links", "listing", links),
+    ("alexandracooks", "scrape_recipe", "recipe", recipe_seen),
+    ("alexandracooks", "recipe_links_on_page", "listing", links),
+    ("jamieoliver", "scrape_recipe", "recipe", recipe_seen),
+    ("jamieoliver", "scrape_recipe_html", "recipe", recipe),
+    ("jamieoliver", "recipe_links_on_page", "listing", links),
+    ("jamieoliver", "category_links_on_page", "listing", links),
+    ("allrecipes", "scrape_recipe", "recipe", recipe),
+    ("allrecipes", "recipe_links_on_page", "listing", links),
+    ("allrecipes", "category_links_on_page", "listing", links),
+]
+
+_modules = {}
+
+
+def manifest():
+    with open(os.path.join(FIXTURES, "manifest.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def case_id(case):
+    site, function, page, call = case
+    return f"{site}-{function}"
+
+
+def prepare(case):
+    """The case as a no-argument callable, on its page already read from disk."""
+    site, function, page, call = case
+    if site not in _modules:
+        _modules[site] = load_script(os.path.join(ROOT, SCRIPTS[site]))
+    extractor = getattr(_modules[site], function)
+    url = manifest()[site][page]
+    with open(os.path.join(FIXTURES, site, f"{page}.html"), encoding="utf-8") as f:
+        html = f.read()
+    return lambda: call(extractor, url, html)
+
+
+def normalized(result):
+    # Tuples and lists, or int and float keys, compare as they are stored in golden.json
+    return json.loads(json.dumps(result, ensure_ascii=False))
+
+
+def golden(site):
+    path = os.path.join(FIXTURES, site, "golden.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def peak_kb(run):
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def with_parser(parser, run):
+    """run() with `parser` as the default backend."""
+    previous = parsing.DEFAULT_PARSER
+    parsing.set_default_parser(parser)
+    try:
+        return normalized(run())
+    finally:
+        parsing.set_default_parser(previous)
+
+
+def parity_failures(case):
+    """The installed parsers whose output for the case differs from html.parser's."""
+    run = prepare(case)
+    reference = with_parser("html.parser", run)
+    return [parser for parser in parsing.available_parsers()
+            if parser != "html.parser" and with_parser(parser, run) != reference]
+
+
+def update_golden():
+    outputs = {}
+    for case in CASES:
+        outputs.setdefault(case[0], {})[case[1]] = normalized(prepare(case)())
+    for site, output in outputs.items():
+        with open(os.path.join(FIXTURES, site, "golden.json"), "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=1, ensure_ascii=False)
+            f.write("\n")
+        print(f"{site}: {len(output)} golden outputs written")
+
+
+async def record(sites):
+    """Downloads the manifest's pages of `sites` over the fixtures (then run --update-golden)."""
+    from recipe_common.fetch import FetchEngine
+    pages = manifest()
+    async with FetchEngine(per_host_rate=1.0) as engine:
+        for site in sites:
+            for page, url in pages[site].items():
+                response = await engine.fetch_or_error(url)
+                if response.status != 200:
+                    print(f"{site} {page}: {url} answered {response.status or response.error}; kept the old page")
+                    continue
+                with open(os.path.join(FIXTURES, site, f"{page}.html"), "w", encoding="utf-8") as f:
+                    f.write(response.text)
+                print(f"{site} {page}: saved {len(response.body)} bytes from {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", nargs="+", choices=sorted(SCRIPTS), help="default: all")
+    parser.add_argument("--parser", choices=parsing.available_parsers(), help="parser backend (default: html.parser)")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent on each case")
+    parser.add_argument("--parity", action="store_true", help="compare every installed parser with html.parser")
+    parser.add_argument("--update-golden", action="store_true", help="rewrite golden.json from the current output")
+    parser.add_argument("--record", nargs="+", metavar="SITE", help="download live pages over these sites' fixtures")
+    args = parser.parse_args()
+    if args.parser:
+        parsing.set_default_parser(args.parser)
+    if args.record:
+        asyncio.run(record(args.record))
+        return
+    if args.update_golden:
+        update_golden()
+        return
+    if args.parity:
+        failures = {case_id(case): parity_failures(case) for case in CASES}
+        for name, parsers in failures.items():
+            print(f"  {name:<40} {'differs on ' + ', '.join(parsers) if parsers else 'same on every parser'}")
+        sys.exit(1 if any(failures.values()) else 0)
+
+    print(f"Parser: {parsing.DEFAULT_PARSER}")
+    failed = 0
+    for case in CASES:
+        if args.sites and case[0] not in args.sites:
+            continue
+        run = prepare(case)
+        result = normalized(run())
+        matches = result == golden(case[0]).get(case[1])
+        failed += not matches
+        count, start = 0, time.perf_counter()
+        while time.perf_counter() - start < args.seconds:
+            run()
+            count += 1
+        rate = count / (time.perf_counter() - start)
+        print(f"  {case_id(case):<40} {rate:8.1f} pages/s  {peak_kb(run):8.0f} KB peak  "
+              f"{'matches golden' if matches else 'DIFFERS FROM GOLDEN'}")
+    sys.exit(1 if failed else 0)
+
+
+try:
+    import pytest
+except ImportError:  # pytest-benchmark is only needed for the pytest run
+    pytest = None
+
+if pytest is not None:
+    @pytest.mark.parametrize("case", CASES, ids=case_id)
+    def test_extractor(benchmark, case):
+        run = prepare(case)
+        benchmark.extra_info["parser"] = parsing.DEFAULT_PARSER
+        benchmark.extra_info["peak_kb"] = round(peak_kb(run))
+        result = benchmark(run)
+        assert normalized(result) == golden(case[0]).get(case[1])
+
+    @pytest.mark.parametrize("case", CASES, ids=case_id)
+    def test_parser_parity(case):
+        assert parity_failures(case) == []
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Schema.org (JSON-LD / microdata) fast path against the selector-based extractors.
+
+For the sites whose scrape_recipe reads the page's schema.org Recipe first, runs both tiers
+over the pages saved in the response cache. Reports pages/second, how many pages were
+served without the selectors, and which columns the two tiers fill differently (the
+JSON-LD values are formatted by recipe_common.jsonld, not copied from the page text):
+
+    python benchmarks/bench_jsonld.py
+"""
+import argparse
+import os
+import time
+from collections import Counter
+
+from bench_parsers import ROOT, load_pages, load_script, run
+from recipe_common import jsonld
+
+# site -> (script, fast path, selector-based extractor)
+SITES = {
+    "15gram": ("Type-1/15gram.py", lambda module, url, html: module.scrape_recipe(url, html),
+               lambda module, url, html: module.scrape_recipe_html(url, html)),
+    "addapinch": ("Type-1/Add_a_pinch.py", lambda module, url, html: module.scrape_recipe(url, html, set()),
+                  lambda module, url, html: module.scrape_recipe_html(url, html)),
+    "jamieoliver": ("Type-2/Jamie_Oliver_Script.py", lambda module, url, html: module.scrape_recipe(url, html, set()),
+                    lambda module, url, html: module.scrape_recipe_html(url, html)),
+}
+
+
+def rate(extract, module, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = run(extract, module, pages)
+        best = min(best, time.perf_counter() - start)
+    return records, len(pages) / best
+
+
+def bench_site(site, cache_root, repeat, limit):
+    script, fast, selectors = SITES[site]
+    pages = load_pages(os.path.join(cache_root, site), limit)
+    if not pages:
+        print(f"{site}: no saved pages in {os.path.join(cache_root, site)}")
+        return
+    module = load_script(script)
+    fast_records, fast_rate = rate(fast, module, pages, repeat)
+    dom_records, dom_rate = rate(selectors, module, pages, repeat)
+
+    # Pages the fast path served entirely from the schema.org data
+    calls = Counter()
+    original = module.scrape_recipe_html
+    module.scrape_recipe_html = lambda url, html: calls.update([url]) or original(url, html)
+    run(fast, module, pages)
+    module.scrape_recipe_html = original
+
+    differing = Counter()
+    for ours, theirs in zip(fast_records, dom_records):
+        if ours and theirs:
+            differing.update(key for key in ours if ours[key] != theirs.get(key))
+    schema_pages = sum(1 for _, html in pages if jsonld.find_recipe(html) is not None)
+    print(f"\n{site}: {len(pages)} pages, {schema_pages} with a schema.org Recipe")
+    print(f"  selectors    {dom_rate:8.1f} pages/s")
+    print(f"  schema.org   {fast_rate:8.1f} pages/s  {fast_rate / dom_rate:5.2f}x  "
+          f"full selector fallback on {len(calls)} pages")
+    if differing:
+        print("  columns filled differently: " + ", ".join(f"{key} ({count})" for key, count in differing.most_common()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", nargs="+", choices=sorted(SITES), default=sorted(SITES))
+    parser.add_argument("--cache-root", default=os.path.join(ROOT, "http_cache"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--limit", type=int, help="pages per site")
+    args = parser.parse_args()
+    for site in args.sites:
+        bench_site(site, args.cache_root, args.repeat, args.limit)
+
+
+if __name__ == "__main__":
+    main()
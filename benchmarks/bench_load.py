@@ -0,0 +1,134 @@
+"""End-to-end crawl of every site against the local replay server, at any scale.
+
+Starts recipe_common.replay in a subprocess and runs the orchestrator against it: each
+site's own discovery (category listings, pagination) and extraction code, through
+the fetch engine, the frontier and the sink, as a real crawl would. Then reports
+pages/s, request latency percentiles per host, time per stage and peak RSS:
+
+    python benchmarks/bench_load.py --sites addapinch --per-listing 200
+    python benchmarks/bench_load.py --per-listing 2000 --max-recipes 100000 --latency 0.08 --jitter 0.05
+    python benchmarks/bench_load.py --throttle-rate 0.05 --error-rate 0.01 --concurrency 16 --rate 8
+    python benchmarks/bench_load.py --workers 4 --json run.json
+    python benchmarks/bench_load.py --threads --json threads.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import urlopen
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from recipe_common.metrics import METRICS
+from recipe_common.orchestrator import run_sites
+from recipe_common.registry import load_scripts
+
+
+def start_server(args):
+    """Runs the replay server in its own process, so it is not counted in the crawl's CPU and memory."""
+    command = [sys.executable, "-m", "recipe_common.replay", "--port", "0", "--per-listing", str(args.per_listing),
+               "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+               "--throttle-rate", str(args.throttle_rate), "--fixtures", args.fixtures]
+    if args.max_recipes:
+        command += ["--max-recipes", str(args.max_recipes)]
+    server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if not line.startswith("Replaying"):
+        server.kill()
+        raise RuntimeError(f"The replay server did not start: {line!r}")
+    print(line.strip())
+    return server, line.split()[-1]
+
+
+def totals(snapshot, name, by):
+    result = {}
+    for counter in snapshot["counters"]:
+        if counter["name"] == name:
+            key = counter["labels"].get(by, "")
+            result[key] = result.get(key, 0) + counter["value"]
+    return result
+
+
+def stages(snapshot, stage):
+    """host or site -> summary of the stage's histogram."""
+    return {histogram["labels"].get("host") or histogram["labels"].get("site"): histogram
+            for histogram in snapshot["histograms"]
+            if histogram["name"] == "stage_seconds" and histogram["labels"]["stage"] == stage}
+
+
+def main():
+    sites = load_scripts()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", nargs="+", choices=sorted(sites), default=sorted(sites))
+    parser.add_argument("--fixtures", default=os.path.join(ROOT, "benchmarks", "fixtures"))
+    parser.add_argument("--per-listing", type=int, default=200, help="recipes in each category listing")
+    parser.add_argument("--max-recipes", type=int, help="recipes per site at most")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the server adds to every response")
+    parser.add_argument("--jitter", type=float, default=0.01, help="mean of a further exponential delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--concurrency", type=int, help="requests in flight per host (default: each site's own)")
+    parser.add_argument("--rate", type=float, help="starting requests/second per host (default: each site's own)")
+    parser.add_argument("--max-rate", type=float, default=16.0, help="the adaptive rate's ceiling per host")
+    parser.add_argument("--workers", type=int, help="extraction processes or threads")
+    parser.add_argument("--threads", action="store_true", help="extract in threads instead of worker processes")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    for name in args.sites:
+        if args.concurrency:
+            sites[name].per_host_concurrency = args.concurrency
+        if args.rate:
+            sites[name].per_host_rate = args.rate
+
+    server, replay = start_server(args)
+    METRICS.reset()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "replayed.jsonl")
+            start = time.perf_counter()
+            failed = run_sites(args.sites, output_file=output, frontier_dir=directory, workers=args.workers,
+                               processes=not args.threads, replay=replay, max_host_rate=args.max_rate)
+            wall = time.perf_counter() - start
+            with open(output, encoding="utf-8") as f:
+                recipes = sum(1 for _ in f)
+        with urlopen(f"{replay}/__stats") as response:
+            served = json.load(response)
+    finally:
+        server.terminate()
+        server.wait()
+
+    snapshot = METRICS.snapshot()
+    pages = totals(snapshot, "pages", "outcome")
+    requests = sum(totals(snapshot, "requests", "host").values())
+    received = sum(totals(snapshot, "response_bytes", "host").values())
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+    print(f"\n{recipes} recipes from {len(args.sites) - len(failed)} of {len(args.sites)} sites in {wall:.1f} s")
+    print(f"Pages: {sum(pages.values())} ({', '.join(f'{count} {outcome}' for outcome, count in sorted(pages.items()))}), "
+          f"{sum(pages.values()) / wall:.1f}/s")
+    print(f"Requests: {requests}, {requests / wall:.1f}/s, {received / wall / 2 ** 20:.1f} MB/s; "
+          f"the server answered {served['throttled']} with 429 and {served['errors']} with 503")
+    print(f"Peak RSS: {peak_rss:.0f} MB" + (" (this process; the workers are not included)" if not args.threads else ""))
+    print("\nTime to first byte per host:")
+    for host, stats in sorted(stages(snapshot, "ttfb").items()):
+        print(f"  {host:<28} {stats['count']:7} requests  p50 {stats['p50'] * 1000:7.1f} ms  "
+              f"p90 {stats['p90'] * 1000:7.1f} ms  p99 {stats['p99'] * 1000:7.1f} ms")
+
+    if args.json:
+        report = {"options": vars(args), "wall_seconds": round(wall, 3), "recipes": recipes, "pages": pages,
+                  "requests": requests, "response_bytes": received, "peak_rss_mb": round(peak_rss, 1),
+                  "server": served, "failed": {name: repr(error) for name, error in failed.items()},
+                  "metrics": snapshot}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
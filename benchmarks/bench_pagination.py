@@ -0,0 +1,102 @@
+"""Listing a paginated category page by page against the pagination planner.
+
+Serves a synthetic WordPress category from memory with a fixed latency per request
+(no network) and times the old loop, which fetches page N+1 only after page N, against
+recipe_common.pagination.paginate with a full nav, a nav that only shows the nearby
+pages, and no nav at all:
+
+    python benchmarks/bench_pagination.py
+    python benchmarks/bench_pagination.py --pages 60 --latency 0.2 --per-host 4
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.fetch import FetchEngine, Page
+from recipe_common.pagination import paginate
+from recipe_common.parsing import make_soup
+
+CATEGORY = "https://example.com/category/desserts"
+
+
+def listing(page, pages, nav):
+    links = "".join(f'<article><a href="https://example.com/recipe-{page}-{i}/">r</a></article>' for i in range(12))
+    shown = {"full": range(1, pages + 1), "nearby": range(max(1, page - 2), min(pages, page + 2) + 1)}.get(nav, ())
+    numbers = "".join(f'<a class="page-numbers" href="{CATEGORY}/page/{n}/">{n}</a>' for n in shown)
+    return f'<html><body><a href="https://example.com/about/">About</a>{links}<nav>{numbers}</nav></body></html>'
+
+
+class ListingEngine(FetchEngine):
+    """A FetchEngine whose requests are answered from memory after `latency` seconds."""
+
+    def __init__(self, pages, nav, latency, **options):
+        super().__init__(**options)
+        self.pages, self.nav, self.latency = pages, nav, latency
+        self.requests = 0
+
+    async def _get(self, url, headers):
+        async with self.slot(url):
+            self.requests += 1
+            await asyncio.sleep(self.latency)
+        page = 1 if url == CATEGORY else int(url.rstrip("/").rsplit("/", 1)[1])
+        if page > self.pages:
+            return Page(url, 404, {}, b"")
+        return Page(url, 200, {"content-type": "text/html"}, listing(page, self.pages, self.nav).encode(), "utf-8")
+
+
+def recipe_links(soup):
+    return [a["href"] for a in soup.find_all("a", href=True) if "/recipe-" in a["href"]]
+
+
+async def serial(engine):
+    # The loop the scripts used: the next page is only requested once this one has links
+    links, page = set(), 1
+    while True:
+        response = await engine.fetch_or_error(CATEGORY if page == 1 else f"{CATEGORY}/page/{page}/")
+        found = recipe_links(make_soup(response.text)) if response.status == 200 else []
+        if not found:
+            return links
+        links.update(found)
+        page += 1
+
+
+async def planned(engine):
+    links = set()
+    async for page, found in paginate(engine, CATEGORY, f"{CATEGORY}/page/{{page}}/", recipe_links):
+        links.update(found)
+    return links
+
+
+def run(crawl, nav, args):
+    async def go():
+        async with ListingEngine(args.pages, nav, args.latency, per_host_concurrency=args.per_host,
+                                 per_host_rate=0) as engine:
+            start = time.perf_counter()
+            links = await crawl(engine)
+            return links, engine.requests, time.perf_counter() - start
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(go())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per request")
+    parser.add_argument("--per-host", type=int, default=4, help="requests in flight to the host")
+    args = parser.parse_args()
+    print(f"{args.pages} listing pages, {args.latency * 1000:.0f} ms per request, {args.per_host} in flight")
+    reference, requests, baseline = run(serial, "full", args)
+    print(f"  {'page by page':<26} {baseline:6.2f} s  {requests:4} requests")
+    for nav, label in (("full", "full nav"), ("nearby", "nearby pages nav"), ("none", "no nav")):
+        links, requests, elapsed = run(planned, nav, args)
+        print(f"  {f'planner, {label}':<26} {elapsed:6.2f} s  {requests:4} requests  {baseline / elapsed:5.1f}x  "
+              f"{'same links' if links == reference else f'{len(links ^ reference)} links differ'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Pages/second of the extraction stage in-process and in a ParsePool of worker processes.
+
+Feeds the pages a scraper saved in its response cache (http_cache/<site>) through the
+site's registered extract function, first one at a time in this process as drain() does,
+then through recipe_common.pipeline.ParsePool with each worker count, and checks the
+records match:
+
+    python benchmarks/bench_parse_pool.py
+    python benchmarks/bench_parse_pool.py --sites addapinch allrecipes --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from recipe_common.cache import ResponseCache
+from recipe_common.pipeline import ParsePool
+from recipe_common.registry import load_scripts
+
+
+def load_pages(cache_dir, limit=None):
+    cache = ResponseCache(cache_dir)
+    pages = [page for page in cache.pages()
+             if page.status == 200 and "html" in page.headers.get("content-type", "text/html")]
+    cache.close()
+    return pages[:limit] if limit else pages
+
+
+def run_inline(extract, pages):
+    # The extractors print progress; keep it out of the timings and the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [extract(page.url, page.text, None) for page in pages]
+
+
+async def run_pool(pool, extract, pages):
+    futures = [await pool.submit(extract, page.url, page.body, page.encoding) for page in pages]
+    return await asyncio.gather(*futures)
+
+
+def bench_site(site, cache_root, worker_counts, max_pending, limit):
+    pages = load_pages(os.path.join(cache_root, site.name), limit)
+    if not pages:
+        print(f"{site.name}: no saved pages in {os.path.join(cache_root, site.name)} (run the scraper with a cache first)")
+        return
+    print(f"\n{site.name}: {len(pages)} pages")
+    start = time.perf_counter()
+    reference = run_inline(site.extract, pages)
+    baseline = len(pages) / (time.perf_counter() - start)
+    print(f"  {'in-process':<12} {baseline:8.1f} pages/s")
+
+    for workers in worker_counts:
+        with ParsePool(workers, max_pending=max_pending) as pool:
+            # Starting the workers and loading the script in each is not part of the steady state
+            asyncio.run(run_pool(pool, site.extract, pages[:4 * workers]))
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                records = asyncio.run(run_pool(pool, site.extract, pages))
+                rate = len(pages) / (time.perf_counter() - start)
+        mismatches = sum(1 for ours, theirs in zip(records, reference) if ours != theirs)
+        print(f"  {f'{workers} workers':<12} {rate:8.1f} pages/s  {rate / baseline:5.2f}x  "
+              f"{'identical' if not mismatches else f'{mismatches} records differ'}")
+
+
+def main():
+    sites = load_scripts()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", nargs="+", choices=sorted(sites), default=sorted(sites))
+    parser.add_argument("--cache-root", default=os.path.join(ROOT, "http_cache"))
+    parser.add_argument("--workers", nargs="+", type=int,
+                        default=sorted({1, 2, os.cpu_count() or 1}), help="worker counts to try")
+    parser.add_argument("--max-pending", type=int, help="pages queued for the pool (default: two per worker)")
+    parser.add_argument("--limit", type=int, help="pages per site")
+    args = parser.parse_args()
+    print(f"{os.cpu_count()} CPU cores")
+    for name in args.sites:
+        bench_site(sites[name], args.cache_root, args.workers, args.max_pending, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Pages/second of each site extractor on every HTML parser backend.
+
+Reads the pages a scraper saved in its response cache (http_cache/<site>), runs the site's
+extractor on each backend and checks the records match the html.parser output:
+
+    python benchmarks/bench_parsers.py
+    python benchmarks/bench_parsers.py --sites addapinch allrecipes --repeat 5
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from recipe_common import parsing
+from recipe_common.cache import ResponseCache
+
+# site -> (script, how to call its selector-based extractor)
+SITES = {
+    "15gram": ("Type-1/15gram.py", lambda module, url, html: module.scrape_recipe_html(url, html)),
+    "addapinch": ("Type-1/Add_a_pinch.py", lambda module, url, html: module.scrape_recipe_html(url, html)),
+    "alexandracooks": ("Type-2/Alexandra_cooks_script.py",
+                       lambda module, url, html: module.scrape_recipe(url, html, set())),
+    "jamieoliver": ("Type-2/Jamie_Oliver_Script.py", lambda module, url, html: module.scrape_recipe_html(url, html)),
+    "allrecipes": ("Type-2/all_recipes.py", lambda module, url, html: module.scrape_recipe(url, html)),
+    "barefeet": ("Type-1/Barefeet_in_the_kitchen.py", lambda module, url, html: module.fallback_scraper(url, html)),
+    "barefoot": ("Type-1/Barefoot_in_the_pines.py",
+                 lambda module, url, html: module.extract_recipe_details(url, "", html)),
+}
+
+
+def load_script(path):
+    name = os.path.splitext(os.path.basename(path))[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(f"site_{name}", os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_pages(cache_dir, limit=None):
+    cache = ResponseCache(cache_dir)
+    pages = [(page.url, page.text) for page in cache.pages()
+             if page.status == 200 and "html" in page.headers.get("content-type", "text/html")]
+    cache.close()
+    return pages[:limit] if limit else pages
+
+
+def run(extract, module, pages):
+    # The extractors print progress; keep it out of the timings and the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [extract(module, url, html) for url, html in pages]
+
+
+def bench_site(site, cache_root, parsers, repeat, limit):
+    script, extract = SITES[site]
+    pages = load_pages(os.path.join(cache_root, site), limit)
+    if not pages:
+        print(f"{site}: no saved pages in {os.path.join(cache_root, site)} (run the scraper with a cache first)")
+        return
+    module = load_script(script)
+    size = sum(len(html) for _, html in pages) / len(pages) / 1024
+    print(f"\n{site}: {len(pages)} pages, {size:.0f} KiB average")
+
+    reference = None
+    baseline = None
+    for parser in parsers:
+        parsing.set_default_parser(parser)
+        records = run(extract, module, pages)  # warm-up, and the output to compare
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run(extract, module, pages)
+            best = min(best, time.perf_counter() - start)
+        rate = len(pages) / best
+        if reference is None:
+            reference, baseline = records, rate
+        mismatches = sum(1 for ours, theirs in zip(records, reference) if ours != theirs)
+        print(f"  {parser:<12} {rate:8.1f} pages/s  {rate / baseline:5.2f}x  "
+              f"{'identical' if not mismatches else f'{mismatches} records differ'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", nargs="+", choices=sorted(SITES), default=sorted(SITES))
+    parser.add_argument("--cache-root", default=os.path.join(ROOT, "http_cache"))
+    parser.add_argument("--parsers", nargs="+", default=parsing.available_parsers(),
+                        help="the first one is the reference output (default: html.parser)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--limit", type=int, help="pages per site")
+    args = parser.parse_args()
+    for site in args.sites:
+        bench_site(site, args.cache_root, args.parsers, args.repeat, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Recipe-card-only parsing against a full-page parse for the WPRM / Tasty Recipes extractors.
+
+Runs each extractor twice over the pages saved in its response cache: as shipped (only the
+recipe card and a few page elements are parsed) and with make_card_soup replaced by a
+full-page parse. Reports pages/second, peak memory per page and whether the records match.
+Peak memory comes from tracemalloc, so it only covers the Python heap: BeautifulSoup trees
+are counted, lexbor's C-side allocations (selectolax) are not.
+
+    python benchmarks/bench_partial_parse.py --parser selectolax
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from bench_parsers import ROOT, SITES, load_pages, load_script, run
+from recipe_common import parsing
+
+CARD_SITES = ["addapinch", "alexandracooks", "barefeet", "barefoot"]
+
+
+def full_parse(html, card, keep=(), parser=None):
+    return parsing.make_soup(html, parser)
+
+
+def measure(extract, module, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = run(extract, module, pages)
+        best = min(best, time.perf_counter() - start)
+
+    peak = 0
+    for url, html in pages:
+        tracemalloc.start()
+        run(extract, module, [(url, html)])
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return records, len(pages) / best, peak
+
+
+def bench_site(site, cache_root, repeat, limit):
+    script, extract = SITES[site]
+    pages = load_pages(os.path.join(cache_root, site), limit)
+    if not pages:
+        print(f"{site}: no saved pages in {os.path.join(cache_root, site)}")
+        return
+    module = load_script(script)
+    card_soup = module.make_card_soup
+
+    module.make_card_soup = full_parse
+    full_records, full_rate, full_peak = measure(extract, module, pages, repeat)
+    module.make_card_soup = card_soup
+    card_records, card_rate, card_peak = measure(extract, module, pages, repeat)
+
+    same = sum(1 for ours, theirs in zip(card_records, full_records) if ours == theirs)
+    print(f"\n{site}: {len(pages)} pages, parser {parsing.DEFAULT_PARSER}")
+    print(f"  full page  {full_rate:8.1f} pages/s  peak {full_peak / 1024:8.0f} KiB")
+    print(f"  card only  {card_rate:8.1f} pages/s  peak {card_peak / 1024:8.0f} KiB  "
+          f"{card_rate / full_rate:5.2f}x  {same}/{len(pages)} records identical")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", nargs="+", choices=CARD_SITES, default=CARD_SITES)
+    parser.add_argument("--cache-root", default=os.path.join(ROOT, "http_cache"))
+    parser.add_argument("--parser", choices=parsing.available_parsers(), default=parsing.DEFAULT_PARSER)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--limit", type=int, help="pages per site")
+    args = parser.parse_args()
+    parsing.set_default_parser(args.parser)
+    for site in args.sites:
+        bench_site(site, args.cache_root, args.repeat, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Fixed per-host rate against the adaptive rate controller, on a local test server.
+
+Starts an aiohttp server on 127.0.0.1 that plays three kinds of host: a fast CDN that
+takes whatever it is sent, a small WordPress host that allows `--host-limit` requests/s
+and answers the rest with 429 and Retry-After, and a host whose robots.txt asks for a
+Crawl-delay. Each is crawled once at the fixed starting rate and once adaptively:
+
+    python benchmarks/bench_rate_control.py
+    python benchmarks/bench_rate_control.py --requests 300 --start-rate 2 --host-limit 5
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.fetch import FetchEngine
+
+
+class TestServer:
+    """/cdn/<n> always answers and /limited/<n> allows `limit` requests per second; on the second port
+    robots.txt asks for a Crawl-delay."""
+
+    __test__ = False  # not a pytest test class, though pytest collects this file
+
+    def __init__(self, limit, latency=0.02):
+        self.limit = limit
+        self.latency = latency
+        self.window = []  # start times of the /limited requests in the last second
+
+    async def page(self, request):
+        await asyncio.sleep(self.latency)
+        if request.match_info["kind"] == "limited":
+            now = time.monotonic()
+            self.window = [t for t in self.window if now - t < 1.0] + [now]
+            if len(self.window) > self.limit:
+                return web.Response(status=429, headers={"Retry-After": "1"})
+        return web.Response(text="<html><body>recipe</body></html>", content_type="text/html")
+
+    async def robots(self, request):
+        # Every "host" is the same server here, so robots.txt is told apart by the port
+        delay = "Crawl-delay: 0.25\n" if request.host.endswith(f":{self.polite_port}") else ""
+        return web.Response(text=f"User-agent: *\n{delay}Disallow: /wp-admin/\n")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/robots.txt", self.robots)
+        app.router.add_get("/{kind}/{n}", self.page)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        sites = [web.TCPSite(self.runner, "127.0.0.1", 0) for _ in range(2)]
+        for site in sites:
+            await site.start()
+        self.port, self.polite_port = (site._server.sockets[0].getsockname()[1] for site in sites)
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def crawl(server, kind, port, count, adaptive, args):
+    urls = [f"http://127.0.0.1:{port}/{kind}/{n}" for n in range(count)]
+    async with FetchEngine(per_host_concurrency=args.in_flight, per_host_rate=args.start_rate, adaptive=adaptive,
+                           max_host_rate=args.max_rate, timeout=30) as engine:
+        start = time.perf_counter()
+        statuses = [page.status async for page in engine.fetch_all(urls)]
+        elapsed = time.perf_counter() - start
+        stats = engine.host_stats()[f"127.0.0.1:{port}"]
+    return elapsed, statuses.count(200), statuses.count(429), stats
+
+
+async def main_async(args):
+    server = TestServer(args.host_limit)
+    await server.start()
+    try:
+        print(f"{args.requests} requests per run, starting at {args.start_rate:g} req/s, {args.in_flight} in flight")
+        for label, kind, port in (("fast CDN", "cdn", server.port),
+                                  (f"host allowing {args.host_limit:g} req/s", "limited", server.port),
+                                  ("Crawl-delay: 0.25", "cdn", server.polite_port)):
+            print(f"\n{label}")
+            for adaptive in (False, True):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    elapsed, ok, limited, stats = await crawl(server, kind, port, args.requests, adaptive, args)
+                print(f"  {'adaptive' if adaptive else 'fixed':<9} {elapsed:6.1f} s  {ok / elapsed:5.1f} pages/s  "
+                      f"{limited:3} × 429  final rate {stats['rate']:g} req/s, {stats['backoffs']} backoffs")
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--start-rate", type=float, default=2.0, help="per_host_rate, the fixed rate")
+    parser.add_argument("--max-rate", type=float, default=16.0, help="max_host_rate for the adaptive runs")
+    parser.add_argument("--in-flight", type=int, default=4, help="per_host_concurrency")
+    parser.add_argument("--host-limit", type=float, default=5.0, help="requests/s the limited host allows")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Memory and speed of the frontier's seen-set: an exact set against a Bloom filter.
+
+Adds synthetic recipe URLs (through url_key, as Frontier.add does) and then looks up as
+many URLs that were never added, which gives the measured false-positive rate:
+
+    python benchmarks/bench_seen_set.py
+    python benchmarks/bench_seen_set.py --urls 5000000 --error-rate 0.0001
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.urls import BloomFilter, url_key
+
+
+def fill(make_seen, urls):
+    seen = make_seen()
+    for url in urls:
+        seen.add(url_key(url))
+    return seen
+
+
+def bench(name, make_seen, urls, unseen):
+    start = time.perf_counter()
+    fill(make_seen, urls)
+    added = time.perf_counter() - start
+    # A set keeps every key string alive; a Bloom filter only its bit array
+    tracemalloc.start()
+    seen = fill(make_seen, urls)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    false_positives = sum(1 for url in unseen if url_key(url) in seen)
+    print(f"  {name:<6} {memory / len(urls):7.1f} bytes/URL  {len(urls) / added:8.0f} URLs/s  "
+          f"{false_positives / len(unseen):.4%} false positives")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--urls", type=int, default=1_000_000)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    args = parser.parse_args()
+    urls = [f"https://www.allrecipes.com/recipe/{i}/banana-bread-{i % 97}/" for i in range(args.urls)]
+    unseen = [f"https://www.allrecipes.com/recipe/{i}/other/" for i in range(args.urls, args.urls + 100_000)]
+    print(f"{args.urls} URLs")
+    bench("set", set, urls, unseen)
+    bench("bloom", lambda: BloomFilter(args.urls, args.error_rate), urls, unseen)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Tree traversals per page: compiled selector plan vs one find() per field.
+
+For the extractors ported to recipe_common.plan, runs each page with the plan matched in a
+single pass and again with one walk per field (what the separate soup.find() calls did),
+and reports traversals and elements visited per page, pages/second and whether the
+records match. On selectolax the plan always runs one native css() call per field (a
+Python-driven walk would be slower than lexbor's matching), so only the call count shows:
+
+    python benchmarks/bench_selector_plan.py
+    RECIPE_PARSER=html.parser python benchmarks/bench_selector_plan.py --sites alexandracooks addapinch
+"""
+import argparse
+import os
+import time
+
+from bench_parsers import ROOT, SITES as PARSER_SITES, load_pages, load_script, run
+from recipe_common import parsing
+
+SITES = ("15gram", "addapinch", "alexandracooks", "jamieoliver", "allrecipes", "barefeet", "barefoot")
+
+
+def profile(extract, module, pages, repeat):
+    plan = module.RECIPE_PLAN
+    plan.traversals = plan.visited = 0
+    records = run(extract, module, pages)
+    traversals, visited = plan.traversals / len(pages), plan.visited / len(pages)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(extract, module, pages)
+        best = min(best, time.perf_counter() - start)
+    return records, traversals, visited, len(pages) / best
+
+
+def bench_site(site, cache_root, repeat, limit):
+    script, extract = PARSER_SITES[site]
+    pages = load_pages(os.path.join(cache_root, site), limit)
+    if not pages:
+        print(f"{site}: no saved pages in {os.path.join(cache_root, site)}")
+        return
+    module = load_script(script)
+    print(f"\n{site}: {len(pages)} pages, {len(module.RECIPE_PLAN.fields)} fields, {parsing.DEFAULT_PARSER}")
+    if parsing.DEFAULT_PARSER == "selectolax":
+        records, traversals, visited, rate = profile(extract, module, pages, repeat)
+        print(f"  native       {traversals:5.1f} css() calls/page  {rate:8.1f} pages/s")
+        return
+
+    results = {}
+    for single_pass in (False, True):
+        module.RECIPE_PLAN.single_pass = single_pass
+        results[single_pass] = profile(extract, module, pages, repeat)
+    module.RECIPE_PLAN.single_pass = True
+
+    baseline_rate = results[False][3]
+    for single_pass, label in ((False, "per field"), (True, "single pass")):
+        records, traversals, visited, rate = results[single_pass]
+        print(f"  {label:<12} {traversals:5.1f} traversals/page  {visited:9.0f} elements/page  "
+              f"{rate:8.1f} pages/s  {rate / baseline_rate:5.2f}x")
+    mismatches = sum(1 for ours, theirs in zip(results[True][0], results[False][0]) if ours != theirs)
+    print(f"  records: {'identical' if not mismatches else f'{mismatches} differ'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", nargs="+", choices=SITES, default=list(SITES))
+    parser.add_argument("--cache-root", default=os.path.join(ROOT, "http_cache"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--limit", type=int, help="pages per site")
+    args = parser.parse_args()
+    for site in args.sites:
+        bench_site(site, args.cache_root, args.repeat, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Shared building blocks for the site scrapers in Type-1/ and Type-2/."""
@@ -0,0 +1,298 @@
+"""WARC archive of every fetched response, zstd-compressed with a dictionary per host.
+
+Extracted records keep a few fields; the archive keeps the whole page, so a selector
+fix can be replayed over pages already downloaded instead of crawling the site again.
+Each response becomes a WARC/1.1 `response` record (the HTTP status line, headers and
+body), compressed as a zstd frame of its own, in files following the .warc.zst
+convention: a file starts with a skippable frame holding the zstd dictionary that its
+records were compressed with, so any .warc.zst reader can open it. The dictionary is
+trained per host on its first `train_records` pages, since a site's pages share their
+templates, and kept for later runs. An SQLite index maps each URL to its file, offset
+and length, so one page is read back with a seek and a single frame decompression:
+
+    archive = WarcArchive("warc")
+    async with FetchEngine(archive=archive) as engine:
+        ...
+    page = archive.read("https://addapinch.com/chocolate-cake/")  # a fetch.Page, or None
+    print(archive.stats())
+    archive.close()
+
+Needs `pip install zstandard`.
+"""
+import base64
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+import struct
+import time
+import uuid
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+try:
+    import zstandard
+except ImportError:  # only needed when an archive is used
+    zstandard = None
+
+from recipe_common.fetch import Page
+from recipe_common.urls import canonical_url
+
+DICTIONARY_FRAME = 0x184D2A5D  # skippable frame magic the .warc.zst convention reserves for the dictionary
+ZSTD_FRAME = b"\x28\xb5\x2f\xfd"
+# aiohttp has already decoded the body, so these would no longer describe it
+REWRITTEN_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def warc_record(page, fetched_at=None):
+    """The WARC/1.1 response record of a Page, as bytes."""
+    try:
+        reason = HTTPStatus(page.status).phrase
+    except ValueError:
+        reason = ""
+    lines = [f"HTTP/1.1 {page.status} {reason}"]
+    for name, value in page.headers.items():
+        lines.append(f"{'X-Archive-Orig-' + name if name in REWRITTEN_HEADERS else name}: {value}")
+    http = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + page.body
+    digest = base64.b32encode(hashlib.sha1(page.body).digest()).decode("ascii")
+    date = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(fetched_at or time.time()))
+    header = (f"WARC/1.1\r\nWARC-Type: response\r\nWARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+              f"WARC-Date: {date}\r\nWARC-Target-URI: {page.url}\r\nWARC-Payload-Digest: sha1:{digest}\r\n"
+              f"Content-Type: application/http;msgtype=response\r\nContent-Length: {len(http)}\r\n\r\n")
+    return header.encode("utf-8") + http + b"\r\n\r\n"
+
+
+def parse_record(record):
+    """A Page from the bytes of a WARC response record."""
+    warc_header, _, rest = record.partition(b"\r\n\r\n")
+    fields = dict(line.split(": ", 1) for line in warc_header.decode("utf-8").split("\r\n")[1:])
+    http = rest[:int(fields["Content-Length"])]
+    http_header, _, body = http.partition(b"\r\n\r\n")
+    status_line, *header_lines = http_header.decode("utf-8").split("\r\n")
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(": ")
+        headers[name[len("X-Archive-Orig-"):] if name.startswith("X-Archive-Orig-") else name] = value
+    encoding = None
+    if "charset=" in headers.get("content-type", ""):
+        encoding = headers["content-type"].split("charset=")[-1].split(";")[0].strip().strip('"')
+    return Page(fields["WARC-Target-URI"], int(status_line.split()[1]), headers, body, encoding=encoding or "utf-8")
+
+
+def read_dictionary(path):
+    """The zstd dictionary in the skippable frame a .warc.zst file starts with, or None."""
+    with open(path, "rb") as f:
+        head = f.read(8)
+        if len(head) < 8 or struct.unpack("<I", head[:4])[0] != DICTIONARY_FRAME:
+            return None
+        data = f.read(struct.unpack("<I", head[4:])[0])
+    if data.startswith(ZSTD_FRAME):  # the convention allows the dictionary itself to be compressed
+        data = zstandard.ZstdDecompressor().decompress(data, max_output_size=16 * 1024 * 1024)
+    return zstandard.ZstdCompressionDict(data)
+
+
+class HostWriter:
+    """The .warc.zst files of one host, in <archive>/<host>/."""
+
+    def __init__(self, directory, host, level, dictionary_size, train_records, max_file_bytes):
+        self.directory = os.path.join(directory, host)
+        os.makedirs(self.directory, exist_ok=True)
+        self.host = host
+        self.level = level
+        self.dictionary_size = dictionary_size
+        self.train_records = train_records
+        self.max_file_bytes = max_file_bytes
+        self.dictionary_path = os.path.join(self.directory, "dictionary.zdict")
+        self.dictionary = None
+        if os.path.exists(self.dictionary_path):
+            with open(self.dictionary_path, "rb") as f:
+                self.dictionary = zstandard.ZstdCompressionDict(f.read())
+        self.waiting = []  # (url, status, record, fetched_at) until the dictionary is trained
+        self.file = None
+        self.path = None
+        self.compressor = None
+
+    def _open(self):
+        # A new file per run (and per max_file_bytes), so a crash never leaves a frame half written mid-file
+        # Numbered after the highest existing file: a count would reuse a number once any file is deleted
+        numbers = [int(match.group(1)) for path in glob.glob(os.path.join(glob.escape(self.directory), "*.warc.zst"))
+                   for match in [re.search(r"-(\d+)\.warc\.zst$", path)] if match]
+        number = max(numbers, default=-1) + 1
+        self.path = os.path.join(self.directory, f"{self.host}-{number:05d}.warc.zst")
+        self.file = open(self.path, "xb")  # never truncate a file the index points into
+        if self.dictionary is not None:
+            data = self.dictionary.as_bytes()
+            self.file.write(struct.pack("<II", DICTIONARY_FRAME, len(data)) + data)
+        self.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary, write_checksum=True)
+
+    def _train(self):
+        samples = [record for url, status, record, fetched_at in self.waiting]
+        try:
+            self.dictionary = zstandard.train_dictionary(self.dictionary_size, samples, level=self.level)
+        except zstandard.ZstdError:
+            return  # too few or too similar samples; these records go out without a dictionary
+        with open(self.dictionary_path, "wb") as f:
+            f.write(self.dictionary.as_bytes())
+
+    def write(self, url, status, record, fetched_at):
+        """Compresses and appends a record; returns [(url, status, file, offset, length, size, fetched_at)] written."""
+        if self.dictionary is None and self.file is None:
+            self.waiting.append((url, status, record, fetched_at))
+            return self.flush() if len(self.waiting) >= self.train_records else []
+        return self._append(url, status, record, fetched_at)
+
+    def flush(self):
+        """Writes the records waiting for a dictionary (training one on them if there are enough)."""
+        if self.dictionary is None and self.file is None and len(self.waiting) >= 8:
+            self._train()
+        waiting, self.waiting = self.waiting, []
+        return [row for url, status, record, fetched_at in waiting
+                for row in self._append(url, status, record, fetched_at)]
+
+    def _append(self, url, status, record, fetched_at):
+        if self.file is None or self.file.tell() >= self.max_file_bytes:
+            if self.file is not None:
+                self.file.close()
+            self._open()
+        frame = self.compressor.compress(record)
+        offset = self.file.tell()
+        self.file.write(frame)
+        self.file.flush()
+        return [(url, status, os.path.relpath(self.path, os.path.dirname(self.directory)), offset, len(frame),
+                 len(record), fetched_at)]
+
+    def close(self):
+        rows = self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return rows
+
+
+class WarcArchive:
+    """Every response given to write(), in per-host .warc.zst files under `directory`.
+
+    `level` is the zstd level; `train_records` pages of a host are held back to train its
+    `dictionary_size`-byte dictionary (if the run ends first, they are written with one
+    trained on what there is, or without). Files roll over after `max_file_bytes`.
+    """
+
+    def __init__(self, directory="warc", level=9, dictionary_size=112 * 1024, train_records=64,
+                 max_file_bytes=1024 ** 3):
+        if zstandard is None:
+            raise ImportError("The WARC archive needs zstandard (pip install zstandard)")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.options = (level, dictionary_size, train_records, max_file_bytes)
+        self.writers = {}
+        self.db = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                key TEXT,
+                url TEXT,
+                status INTEGER,
+                file TEXT,
+                offset INTEGER,
+                length INTEGER,
+                size INTEGER,
+                fetched_at REAL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS records_key ON records (key)")
+        # The crawl's recipe pages, as opposed to listings and robots.txt (see label())
+        self.db.execute("CREATE TABLE IF NOT EXISTS labels (key TEXT PRIMARY KEY, site TEXT, category TEXT)")
+        self.db.commit()
+        self._decompressors = {}  # file -> ZstdDecompressor with that file's dictionary
+
+    def write(self, page):
+        """Archives a fetched Page (its status, headers and body)."""
+        host = urlsplit(page.url).netloc
+        if host not in self.writers:
+            self.writers[host] = HostWriter(self.directory, host, *self.options)
+        self._index(self.writers[host].write(page.url, page.status, warc_record(page), time.time()))
+
+    def _index(self, rows):
+        if rows:
+            self.db.executemany(
+                "INSERT INTO records (key, url, status, file, offset, length, size, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(canonical_url(url), url, *rest) for url, *rest in rows])
+            self.db.commit()
+
+    def has(self, url):
+        """Whether a response for `url` is archived (or waiting for its host's dictionary)."""
+        writer = self.writers.get(urlsplit(url).netloc)
+        key = canonical_url(url)
+        if writer and any(canonical_url(waiting_url) == key for waiting_url, *rest in writer.waiting):
+            return True
+        return self.db.execute("SELECT 1 FROM records WHERE key = ? LIMIT 1", (key,)).fetchone() is not None
+
+    def label(self, url, site, category=None):
+        """Records that `url` is a recipe page of `site` (in `category`), for recipe_common.reextract."""
+        self.db.execute("INSERT OR REPLACE INTO labels (key, site, category) VALUES (?, ?, ?)",
+                        (canonical_url(url), site, category))
+        self.db.commit()
+
+    def flush(self):
+        for writer in self.writers.values():
+            self._index(writer.flush())
+
+    def _decompressor(self, file):
+        if file not in self._decompressors:
+            dictionary = read_dictionary(os.path.join(self.directory, file))
+            self._decompressors[file] = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return self._decompressors[file]
+
+    def _read(self, file, offset, length, size):
+        with open(os.path.join(self.directory, file), "rb") as f:
+            f.seek(offset)
+            frame = f.read(length)
+        return parse_record(self._decompressor(file).decompress(frame, max_output_size=size))
+
+    def read(self, url):
+        """The latest archived response for `url` as a Page, or None."""
+        writer = self.writers.get(urlsplit(canonical_url(url)).netloc) or self.writers.get(urlsplit(url).netloc)
+        for waiting_url, status, record, fetched_at in reversed(writer.waiting if writer else []):
+            if canonical_url(waiting_url) == canonical_url(url):
+                return parse_record(record)
+        row = self.db.execute("SELECT file, offset, length, size FROM records WHERE key = ? ORDER BY rowid DESC "
+                              "LIMIT 1", (canonical_url(url),)).fetchone()
+        return self._read(*row) if row else None
+
+    def locations(self, host=None, status=200):
+        """Yields (url, file, offset, length, size) of the latest response of every archived URL, in
+        archive order; only `host`'s if given, and only those with `status`."""
+        query = ("SELECT url, file, offset, length, size FROM records WHERE rowid IN "
+                 "(SELECT MAX(rowid) FROM records GROUP BY key) AND status = ?")
+        params = [status]
+        if host:
+            query += " AND file LIKE ?"
+            params.append(f"{host}/%")
+        yield from self.db.execute(query + " ORDER BY rowid", params)
+
+    def labelled(self, site):
+        """Yields (url, category, file, offset, length, size) of the latest 200 response of every page
+        labelled as `site`'s, in archive order."""
+        yield from self.db.execute(
+            "SELECT records.url, labels.category, file, offset, length, size FROM records "
+            "JOIN labels ON labels.key = records.key WHERE labels.site = ? AND records.rowid IN "
+            "(SELECT MAX(rowid) FROM records GROUP BY key) AND status = 200 ORDER BY records.rowid", (site,))
+
+    def pages(self, host=None, status=200):
+        """Yields the latest archived Page of every URL (see locations())."""
+        for url, *location in self.locations(host, status):
+            yield self._read(*location)
+
+    def stats(self):
+        records, raw, stored = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM records").fetchone()
+        return {"records": records, "raw_bytes": raw, "stored_bytes": stored,
+                "ratio": round(raw / stored, 1) if stored else None}
+
+    def close(self):
+        for writer in self.writers.values():
+            self._index(writer.close())
+        self.writers.clear()
+        self.db.close()
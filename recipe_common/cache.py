@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import time
+
+from recipe_common.fetch import Page
+from recipe_common.urls import canonical_url
+
+
+def cache_key(url):
+    """Canonical cache key, so variants of a URL (http, utm_* parameters, a fragment) share one entry."""
+    return canonical_url(url)
+
+
+class ResponseCache:
+    """Persistent HTTP response cache stored in a single SQLite file.
+
+    Entries younger than `ttl` seconds are served without touching the network; older
+    entries are revalidated with If-None-Match / If-Modified-Since so unchanged pages come
+    back as 304 without a body. Entries not refreshed for `expire_after` seconds are dropped,
+    and the least recently used entries are evicted once the bodies exceed `max_bytes`.
+
+    The cache is used from the event loop, so writes are not committed one by one: they
+    are committed every COMMIT_EVERY writes or COMMIT_INTERVAL seconds, and on close(). A
+    crash loses at most those last entries, which are fetched again.
+    """
+
+    EVICT_EVERY = 200  # stores between eviction passes
+    COMMIT_EVERY = 100  # writes between commits
+    COMMIT_INTERVAL = 5.0  # seconds
+
+    def __init__(self, path="http_cache", ttl=12 * 3600, expire_after=30 * 24 * 3600,
+                 max_bytes=2 * 1024 ** 3):
+        os.makedirs(path, exist_ok=True)
+        self.ttl = ttl
+        self.expire_after = expire_after
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(os.path.join(path, "responses.sqlite"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                status INTEGER,
+                headers TEXT,
+                encoding TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB,
+                size INTEGER,
+                stored_at REAL,
+                last_access REAL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self.db.commit()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evicted = 0
+        self._stores = 0
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def lookup(self, url):
+        """Returns the cached row for the URL as a dict, or None."""
+        row = self.db.execute(
+            "SELECT status, headers, encoding, etag, last_modified, body, stored_at FROM responses WHERE key = ?",
+            (cache_key(url),)).fetchone()
+        if row is None:
+            return None
+        status, headers, encoding, etag, last_modified, body, stored_at = row
+        return {"status": status, "headers": json.loads(headers), "encoding": encoding, "etag": etag,
+                "last_modified": last_modified, "body": body, "stored_at": stored_at}
+
+    def is_fresh(self, entry):
+        return time.time() - entry["stored_at"] < self.ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def hit(self, url, entry):
+        """Serves a fresh entry."""
+        self.hits += 1
+        self._touch(url)
+        return self._page(url, entry)
+
+    def not_modified(self, url, entry, headers):
+        """Serves an entry the server confirmed with 304 and restarts its TTL."""
+        self.revalidated += 1
+        now = time.time()
+        etag = headers.get("etag") or entry["etag"]
+        last_modified = headers.get("last-modified") or entry["last_modified"]
+        self.db.execute(
+            "UPDATE responses SET etag = ?, last_modified = ?, stored_at = ?, last_access = ? WHERE key = ?",
+            (etag, last_modified, now, now, cache_key(url)))
+        self._written()
+        return self._page(url, entry)
+
+    def store(self, page):
+        """Records a full response; only successful, storable responses are kept."""
+        self.misses += 1
+        if page.status != 200 or "no-store" in page.headers.get("cache-control", ""):
+            return
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (cache_key(page.url), page.status, json.dumps(page.headers), page.encoding,
+             page.headers.get("etag"), page.headers.get("last-modified"), page.body,
+             len(page.body), now, now))
+        self._written()
+        self._stores += 1
+        if self._stores % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones until under `max_bytes`."""
+        cursor = self.db.execute("DELETE FROM responses WHERE stored_at < ?",
+                                 (time.time() - self.expire_after,))
+        self.evicted += cursor.rowcount
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            doomed = []
+            for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                if total <= self.max_bytes:
+                    break
+                doomed.append((key,))
+                total -= size
+            self.db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+            self.evicted += len(doomed)
+        self.flush()
+
+    def pages(self):
+        """Yields every cached response as a Page (e.g. to re-run extractors offline)."""
+        rows = self.db.execute("SELECT key, status, headers, encoding, body FROM responses ORDER BY stored_at")
+        for key, status, headers, encoding, body in rows:
+            yield Page(key, status, json.loads(headers), body, encoding=encoding)
+
+    def stats(self):
+        entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "revalidated": self.revalidated, "misses": self.misses,
+                "evicted": self.evicted, "entries": entries, "bytes": size}
+
+    def flush(self):
+        """Commits the writes made since the last commit."""
+        self.db.commit()
+        self._uncommitted = 0
+        self._last_commit = time.monotonic()
+
+    def close(self):
+        self.evict()
+        self.db.close()
+
+    def _written(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.COMMIT_EVERY or time.monotonic() - self._last_commit >= self.COMMIT_INTERVAL:
+            self.flush()
+
+    def _touch(self, url):
+        self.db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), cache_key(url)))
+        self._written()
+
+    def _page(self, url, entry):
+        return Page(url, entry["status"], entry["headers"], entry["body"], encoding=entry["encoding"])
@@ -0,0 +1,576 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from recipe_common.metrics import METRICS, trace_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+BACK_OFF_STATUSES = {429, 502, 503, 504}  # the server (or its proxy) is overloaded or rate limiting us
+MAX_RETRY_AFTER = 300.0  # seconds; a longer Retry-After is capped rather than stalling the crawl
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}  # transient; any other status is the page's answer
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of a request to a host whose circuit breaker gave up on it for this run."""
+
+
+class Page:
+    """A fetched response: requested URL, status code, headers (lower-cased names) and raw body bytes."""
+
+    def __init__(self, url, status, headers, body, encoding=None, error=None):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.encoding = encoding
+        self.error = error
+
+    @property
+    def text(self):
+        return self.body.decode(self.encoding or "utf-8", errors="replace")
+
+    def __repr__(self):
+        return f"<Page {self.status} {self.url}>"
+
+
+def retry_after_seconds(value):
+    """Seconds to wait from a Retry-After header (delay-seconds or an HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def crawl_delay(robots_txt, user_agent="*"):
+    """The Crawl-delay robots.txt asks of `user_agent` (its own group, else the * group), or None."""
+    token = (user_agent or "*").split("/")[0].strip().lower()
+    delays = {}
+    agents, in_rules = [], False
+    for line in robots_txt.splitlines():
+        field, _, value = line.split("#", 1)[0].partition(":")
+        field, value = field.strip().lower(), value.strip()
+        if field == "user-agent":
+            if in_rules:  # a User-agent line after rules starts a new group
+                agents, in_rules = [], False
+            agents.append(value.lower())
+        elif field:
+            in_rules = True
+            if field == "crawl-delay":
+                try:
+                    delay = float(value)
+                except ValueError:
+                    continue
+                for agent in agents:
+                    delays.setdefault(agent, delay)
+    for agent, delay in delays.items():
+        if agent != "*" and agent in token:
+            return delay
+    return delays.get("*")
+
+
+class CircuitBreaker:
+    """Pauses the requests to one host that keeps failing, without holding up the other hosts.
+
+    After `threshold` failures in a row (network errors or RETRY_STATUSES) the circuit
+    opens: the host's requests wait `cooldown` seconds, then a single one goes out as a
+    probe. A successful probe closes the circuit; a failed one opens it again for twice
+    as long. Once a probe fails after the longest cooldown, `max_cooldown` (by default 30
+    times `cooldown`, so about ten minutes of failing for the default 10 s), the host is
+    given up for the rest of the run and its requests fail at once with
+    CircuitOpenError, so its URLs end up in the frontier's dead letters instead of
+    stalling the crawl.
+    """
+
+    def __init__(self, host="", threshold=5, cooldown=10.0, max_cooldown=None):
+        self.host = host
+        self.threshold = threshold
+        self.initial_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown or 30 * cooldown
+        self.failures = 0  # in a row
+        self.opened_at = None  # loop time the circuit (last) opened; None while closed
+        self.trips = 0
+        self.given_up = False
+        self._probe = None  # future the waiting requests watch while the probe is out
+
+    @property
+    def state(self):
+        if self.given_up:
+            return "given up"
+        return "closed" if self.opened_at is None else "open"
+
+    async def wait(self):
+        """Waits while the circuit is open; returns True if this request is to go out as the probe."""
+        loop = asyncio.get_running_loop()
+        while self.opened_at is not None:
+            if self.given_up:
+                raise CircuitOpenError(f"circuit breaker open: {self.host} kept failing")
+            remaining = self.opened_at + self.cooldown - loop.time()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            elif self._probe is None:
+                self._probe = loop.create_future()
+                return True
+            else:
+                await asyncio.shield(self._probe)
+        return False
+
+    def record(self, ok, probe=False):
+        """Counts one request's outcome; only the probe's counts while the circuit is open."""
+        now = asyncio.get_running_loop().time()
+        if probe:
+            self._probe.set_result(ok)
+            self._probe = None
+            if ok:
+                logger.warning("%s is answering again; circuit closed", self.host)
+                self.failures, self.opened_at, self.cooldown = 0, None, self.initial_cooldown
+            elif self.cooldown >= self.max_cooldown:
+                logger.warning("%s is still failing; giving up on it for this run", self.host)
+                self.given_up = True
+            else:
+                self.opened_at, self.cooldown = now, min(self.max_cooldown, self.cooldown * 2)
+                logger.warning("%s is still failing; pausing it for %g s", self.host, self.cooldown)
+            return
+        if self.opened_at is not None:
+            return  # sent before the circuit opened
+        if ok:
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = now
+            self.trips += 1
+            logger.warning("%s failed %d times in a row; pausing it for %g s", self.host, self.failures, self.cooldown)
+
+    def release(self):
+        # The probe was cancelled before it had an outcome; let another request probe
+        if self._probe is not None:
+            self._probe.set_result(None)
+            self._probe = None
+
+
+class HostBudget:
+    """In-flight window and request spacing for a single host.
+
+    With `adaptive`, the request rate follows the server (AIMD): every healthy response
+    adds `increase / rate`, so the rate climbs by about `increase` requests/second each
+    second, up to `max_rate`, and it holds on a response slower than twice the average
+    latency (the server starting to queue requests). A 429/502/503/504 or a network error halves it (once per round
+    trip, not once per response already in flight), down to `min_rate`. A Retry-After
+    header pauses the host, adaptive or not, and a robots.txt Crawl-delay caps the rate.
+    """
+
+    def __init__(self, max_in_flight, requests_per_second, adaptive=False, max_rate=None, min_rate=0.05,
+                 increase=1.0, breaker=None):
+        self.window = asyncio.Semaphore(max_in_flight)
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = 0
+        self.rate = requests_per_second or 0.0  # 0 means no spacing
+        self.adaptive = adaptive and bool(requests_per_second)
+        self.max_rate = max(max_rate or self.rate, self.rate)
+        self.min_rate = min(min_rate, self.rate) if self.rate else min_rate
+        self.increase = increase
+        self.crawl_delay = None
+        self.backoffs = 0
+        self.robots_read = False
+        self.robots_lock = asyncio.Lock()
+        self._latency = None  # moving average of the response times
+        self._last_backoff = float("-inf")
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def interval(self):
+        return 1.0 / self.rate if self.rate else 0.0
+
+    async def wait_turn(self):
+        # Reserve the next free start time so requests to this host are spaced by `interval`
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            start = max(now, self._next_slot)
+            self._next_slot = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def feedback(self, status, latency, retry_after=None):
+        """Adjusts the rate from one response (status 0 for a network error) and its latency in seconds."""
+        now = asyncio.get_running_loop().time()
+        if retry_after:
+            self._next_slot = max(self._next_slot, now + retry_after)
+        if not self.adaptive:
+            return
+        if status == 0 or status in BACK_OFF_STATUSES:
+            if now - self._last_backoff > max(latency, self.interval):
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._last_backoff = now
+                self.backoffs += 1
+            return
+        if status >= 500:
+            return
+        average = self._latency
+        self._latency = latency if average is None else 0.8 * average + 0.2 * latency
+        if average is not None and latency > 2 * average:
+            return
+        self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def set_crawl_delay(self, delay):
+        """Caps the rate at one request per `delay` seconds."""
+        self.crawl_delay = delay
+        if delay > 0:
+            self.max_rate = 1.0 / delay if not self.max_rate else min(self.max_rate, 1.0 / delay)
+            self.rate = self.max_rate if not self.rate else min(self.rate, self.max_rate)
+            self.min_rate = min(self.min_rate, self.rate)
+
+
+class FetchEngine:
+    """Concurrent HTTP fetcher with a global concurrency cap and per-host politeness.
+
+    Use it as an async context manager:
+
+        async with FetchEngine(per_host_rate=2) as engine:
+            async for page in engine.fetch_all(urls):
+                ...
+
+    A host's rate starts at `per_host_rate` (or its `host_rates` entry) and, with
+    `adaptive`, moves between that and `max_host_rate` with the server's responses (see
+    HostBudget); host_stats() shows where each host is. With `respect_crawl_delay`, each
+    host's robots.txt is read before its first request and its Crawl-delay caps the rate.
+
+    Every request times out after `timeout` seconds; a streamed body (stream(),
+    fetch_stream()) instead fails once no bytes have arrived for `read_timeout` seconds. Network errors and RETRY_STATUSES
+    are retried up to `retries` times, after a random delay of up to `backoff`·2^attempt
+    seconds (full jitter, capped at `max_backoff`), so the retries of many URLs do not
+    arrive together. Each host also has a CircuitBreaker (`breaker_threshold` failures
+    in a row open it for `breaker_cooldown` seconds), which pauses only that host.
+
+    Requests, retries, bytes and the DNS/connect/TTFB/download time of each request are
+    recorded per host in `metrics` (recipe_common.metrics.METRICS by default).
+
+    With `replay` (the base URL of a recipe_common.replay server) every request goes to
+    that server instead of the real host; pages, budgets and metrics keep the real URL.
+    With an `archive` (recipe_common.archive.WarcArchive) every response that comes over
+    the network, robots.txt included, is also written to it, headers and all, and so is
+    a page served from the cache that the archive does not have yet.
+    """
+
+    def __init__(self, max_concurrency=16, per_host_concurrency=4, per_host_rate=1.0,
+                 host_rates=None, host_concurrency=None, host_headers=None, timeout=10, headers=None, cache=None,
+                 adaptive=True, max_host_rate=16.0, respect_crawl_delay=True, retries=3, backoff=0.5, max_backoff=30.0,
+                 breaker_threshold=5, breaker_cooldown=10.0, metrics=None, replay=None, archive=None,
+                 read_timeout=30.0):
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_rate = per_host_rate
+        self.adaptive = adaptive
+        self.max_host_rate = max_host_rate
+        self.respect_crawl_delay = respect_crawl_delay
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.host_rates = dict(host_rates or {})  # host -> requests/second override
+        self.host_concurrency = dict(host_concurrency or {})  # host -> in-flight window override
+        self.host_headers = dict(host_headers or {})  # host -> extra request headers (e.g. its own User-Agent)
+        self.timeout = timeout
+        self.read_timeout = read_timeout
+        self._stream_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=read_timeout)
+        self.headers = dict(DEFAULT_HEADERS, **(headers or {}))
+        self.cache = cache  # optional recipe_common.cache.ResponseCache
+        self.archive = archive  # optional recipe_common.archive.WarcArchive
+        self.metrics = metrics or METRICS
+        self.replay = replay.rstrip("/") if replay else None
+        self.session = None
+        self._global = None
+        self._budgets = {}
+
+    async def __aenter__(self):
+        self._global = asyncio.Semaphore(self.max_concurrency)
+        # Under replay every host is the one server, so only the host budgets limit each host
+        limit_per_host = 0 if self.replay else max([self.per_host_concurrency, *self.host_concurrency.values()])
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency, limit_per_host=limit_per_host)
+        self.session = aiohttp.ClientSession(headers=self.headers, connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                             trace_configs=[trace_config(self.metrics)])
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    def budget(self, host):
+        if host not in self._budgets:
+            rate = self.host_rates.get(host, self.per_host_rate)
+            breaker = CircuitBreaker(host, self.breaker_threshold, self.breaker_cooldown)
+            self._budgets[host] = HostBudget(self.host_concurrency.get(host, self.per_host_concurrency), rate,
+                                             adaptive=self.adaptive, max_rate=self.max_host_rate, breaker=breaker)
+        return self._budgets[host]
+
+    def host_stats(self):
+        """host -> current request rate, Crawl-delay, how often the rate was cut, retries and circuit breaker trips."""
+        return {host: {"rate": round(budget.rate, 2), "crawl_delay": budget.crawl_delay, "backoffs": budget.backoffs,
+                       "retries": budget.retries, "trips": budget.breaker.trips, "circuit": budget.breaker.state}
+                for host, budget in self._budgets.items()}
+
+    @asynccontextmanager
+    async def slot(self, url):
+        """Holds one request slot for the URL's host: in-flight window, rate turn and global cap."""
+        parts = urlsplit(url)
+        budget = self.budget(parts.netloc)
+        if self.respect_crawl_delay and not budget.robots_read and parts.path != "/robots.txt":
+            await self._read_crawl_delay(parts, budget)
+        async with budget.window:
+            await budget.wait_turn()
+            async with self._global:
+                yield budget
+
+    async def _read_crawl_delay(self, parts, budget):
+        async with budget.robots_lock:
+            if budget.robots_read:
+                return
+            url = f"{parts.scheme}://{parts.netloc}/robots.txt"
+            robots = await self.fetch_or_error(url)
+            budget.robots_read = True
+            if robots.status != 200:
+                return
+            delay = crawl_delay(robots.text, (self._headers(url, None) or self.headers).get("User-Agent"))
+            if delay:
+                logger.info("%s asks for a Crawl-delay of %g s", parts.netloc, delay)
+                budget.set_crawl_delay(delay)
+
+    async def fetch(self, url, headers=None):
+        """Fetches one URL and returns a Page; network errors propagate.
+
+        With a cache, fresh entries are served locally and stale ones are revalidated
+        with a conditional GET, so unchanged pages cost a 304 instead of a download.
+        """
+        if self.cache is None:
+            return self._archived(await self._get_with_retries(url, headers))
+
+        entry = self.cache.lookup(url)
+        if entry is not None and self.cache.is_fresh(entry):
+            return self._archived(self.cache.hit(url, entry), cached=True)
+        if entry is not None:
+            headers = dict(headers or {}, **self.cache.conditional_headers(entry))
+        page = await self._get_with_retries(url, headers)
+        if page.status == 304 and entry is not None:
+            return self._archived(self.cache.not_modified(url, entry, page.headers), cached=True)
+        self.cache.store(page)
+        return self._archived(page)
+
+    def _archived(self, page, cached=False):
+        # A page served from the cache is archived too, once, so every page a crawl labels has a record
+        if self.archive is not None and page.status != 304 and not (cached and self.archive.has(page.url)):
+            self.archive.write(page)
+        return page
+
+    def _target(self, url):
+        """Where the request for `url` is actually sent: the URL itself, or its replay path."""
+        if self.replay is None:
+            return url
+        parts = urlsplit(url)
+        return f"{self.replay}/{parts.netloc}{parts.path or '/'}" + (f"?{parts.query}" if parts.query else "")
+
+    def _headers(self, url, headers):
+        host_headers = self.host_headers.get(urlsplit(url).netloc)
+        return dict(host_headers, **(headers or {})) if host_headers else headers
+
+    async def _get_with_retries(self, url, headers):
+        """_get, retried with jittered exponential backoff on network errors and RETRY_STATUSES."""
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                page = await self._get(url, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if last:
+                    raise
+                reason = str(e) or type(e).__name__
+            else:
+                if page.status not in RETRY_STATUSES or last:
+                    return page
+                reason = f"HTTP {page.status}"
+            await self._back_off(url, attempt, reason)
+
+    async def _back_off(self, url, attempt, reason):
+        """Counts a retry of `url` and sleeps a random delay of up to backoff·2^attempt seconds."""
+        host = urlsplit(url).netloc
+        self.budget(host).retries += 1
+        self.metrics.count("retries", host=host, reason=reason if reason.startswith("HTTP") else "network")
+        await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    @asynccontextmanager
+    async def _response(self, url, headers=None, timeout=None):
+        """One GET of `url` in its host's circuit breaker and slot; yields the aiohttp response.
+
+        The response's status, or a network error while its body was read, goes to the
+        host's budget and breaker and to the metrics when the block exits.
+        """
+        headers = self._headers(url, headers)
+        host = urlsplit(url).netloc
+        breaker = self.budget(host).breaker
+        probe = await breaker.wait()
+        try:
+            async with self.slot(url) as budget:
+                loop = asyncio.get_running_loop()
+                start = loop.time()
+                response = None
+                options = {"timeout": timeout} if timeout else {}
+                try:
+                    async with self.session.get(self._target(url), headers=headers, trace_request_ctx={"host": host},
+                                                **options) as response:
+                        started = time.perf_counter()
+                        try:
+                            yield response
+                        finally:
+                            self.metrics.stage("download", time.perf_counter() - started, host=host)
+                            self.metrics.count("response_bytes", response.content.total_bytes, host=host)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    self.metrics.count("requests", host=host, status="error")
+                    budget.feedback(0, loop.time() - start)
+                    breaker.record(False, probe)
+                    probe = False
+                    raise
+                except Exception as e:
+                    if response is None:
+                        raise
+                    error = e  # the caller's own error; the server still answered
+                else:
+                    error = None
+                self.metrics.count("requests", host=host, status=str(response.status))
+                budget.feedback(response.status, loop.time() - start,
+                                retry_after_seconds(response.headers.get("retry-after")))
+                breaker.record(response.status not in RETRY_STATUSES, probe)
+                probe = False
+                if error is not None:
+                    raise error
+        finally:
+            if probe:
+                breaker.release()
+
+    async def _get(self, url, headers):
+        async with self._response(url, headers) as response:
+            body = await response.read()
+            return Page(url, response.status, {k.lower(): v for k, v in response.headers.items()}, body,
+                        encoding=response.get_encoding() if body else None)
+
+    async def stream(self, url, chunk_size=64 * 1024):
+        """Yields the body of a 200 response in chunks without buffering it (bypasses the cache).
+
+        The request is retried like fetch()'s until the first chunk arrives; after that a
+        network error propagates. There is no total timeout, only `read_timeout` between
+        chunks, so a large sitemap can take as long as it needs.
+        """
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            streaming = False
+            try:
+                async with self._response(url, timeout=self._stream_timeout) as response:
+                    if response.ok:
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            streaming = True
+                            yield chunk
+                        return
+                    error = aiohttp.ClientResponseError(response.request_info, response.history,
+                                                        status=response.status, message=response.reason,
+                                                        headers=response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if streaming or last:
+                    raise
+                reason = str(e) or type(e).__name__
+            else:
+                if error.status not in RETRY_STATUSES or last:
+                    raise error
+                reason = f"HTTP {error.status}"
+            await self._back_off(url, attempt, reason)
+
+    async def fetch_stream(self, url, consume, headers=None, retry_on=()):
+        """Returns `await consume(response)` for a GET of `url` whose body `consume` reads itself.
+
+        The request goes through the same circuit breaker, host slot, rate feedback and
+        metrics as fetch(), with `read_timeout` between chunks instead of a total timeout.
+        Network errors (also those while `consume` reads the body), RETRY_STATUSES and
+        the `retry_on` exceptions `consume` raises are retried with fetch()'s backoff; on
+        the last attempt a retry status is handed to `consume` like any other. `headers`
+        may be a function, called before each attempt, e.g. to ask with Range for the
+        rest of a body an earlier attempt already read part of.
+        """
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                async with self._response(url, headers() if callable(headers) else headers,
+                                          self._stream_timeout) as response:
+                    if response.status not in RETRY_STATUSES or last:
+                        return await consume(response)
+                    reason = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError, *retry_on) as e:
+                if last:
+                    raise
+                reason = str(e) or type(e).__name__
+            await self._back_off(url, attempt, reason)
+
+    async def fetch_or_error(self, url, headers=None):
+        """Like fetch, but turns network errors into a Page with status 0 and `error` set."""
+        try:
+            return await self.fetch(url, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError, UnicodeError, ValueError) as e:
+            return Page(url, 0, {}, b"", error=str(e) or type(e).__name__)
+
+    async def fetch_all(self, urls, headers=None):
+        """Yields Pages in completion order, keeping the in-flight window full."""
+        urls = iter(urls)
+        pending = set()
+        window = self.max_concurrency * 2
+        try:
+            while True:
+                for url in urls:
+                    pending.add(asyncio.ensure_future(self.fetch_or_error(url, headers)))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def run_sync(coro):
+    """Runs a coroutine to completion, also from inside a running loop (e.g. Colab/Jupyter)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    result = {}
+
+    def runner():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=runner)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+from recipe_common.metrics import Progress, timed_extract
+from recipe_common.urls import canonical_url, url_key
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DONE = "done"          # extracted; `record` holds the row
+SKIPPED = "skipped"    # fetched, but the extractor returned nothing (e.g. duplicate title)
+FAILED = "failed"      # fetch or extraction error; retried on resume until `max_attempts`, then dead-lettered
+
+
+class Frontier:
+    """Disk-backed crawl frontier in SQLite (WAL mode).
+
+    Holds every discovered URL with its category, fetch status, attempt count and the
+    extracted record or error, plus which listing pages (categories, sitemaps) were
+    fully discovered. A crashed or interrupted run reopens the same file and continues
+    with the URLs that are still pending; once a run calls finish(), the next run starts
+    from scratch.
+
+    URLs are stored in their canonical form (recipe_common.urls) next to their url_key(),
+    which is unique in the table, so a recipe listed under several categories, or linked
+    with and without a trailing slash or utm_* parameters, is queued (INSERT OR IGNORE)
+    and fetched once; every category it was listed under is kept. Nothing is held in
+    memory for this, so reopening a large frontier reads no URLs. An optional `seen`
+    set (e.g. a urls.BloomFilter, or one set shared between frontiers) is checked first
+    and drops the links it has seen in this run without a write.
+
+    URLs that still fail after `max_attempts`, or are still failed when the crawl
+    finishes, are kept in a dead-letter table that outlives finish(); redrive() puts
+    them back in the queue, all at once or only those with a matching error.
+    """
+
+    def __init__(self, path, max_attempts=3, seen=None):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.seen = seen
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                key TEXT,
+                category TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                record TEXT,
+                error TEXT,
+                updated_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS urls_status ON urls (status);
+            CREATE TABLE IF NOT EXISTS categories (key TEXT, category TEXT, PRIMARY KEY (key, category));
+            CREATE TABLE IF NOT EXISTS discovered (key TEXT PRIMARY KEY, finished_at REAL);
+            CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, finished INTEGER NOT NULL DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                url TEXT PRIMARY KEY,
+                category TEXT,
+                attempts INTEGER,
+                error TEXT,
+                failed_at REAL
+            );
+        """)
+        finished = self.db.execute("SELECT finished FROM runs WHERE id = 1").fetchone()
+        if finished and finished[0]:
+            self.reset()
+        self.db.execute("INSERT OR IGNORE INTO runs (id, finished) VALUES (1, 0)")
+        if "key" not in [column[1] for column in self.db.execute("PRAGMA table_info(urls)")]:
+            # A frontier written before URLs had a key column: add it once
+            self.db.execute("ALTER TABLE urls ADD COLUMN key TEXT")
+            self.db.executemany("UPDATE urls SET key = ? WHERE rowid = ?",
+                                [(url_key(url), rowid) for rowid, url in self.db.execute("SELECT rowid, url FROM urls")])
+        self.db.execute("CREATE UNIQUE INDEX IF NOT EXISTS urls_key ON urls (key)")
+        self.db.commit()
+
+    def reset(self):
+        """Forgets everything but the dead letters, so the next crawl starts from scratch."""
+        self.db.executescript("DELETE FROM urls; DELETE FROM categories; DELETE FROM discovered; DELETE FROM runs;")
+        self.db.commit()
+
+    # Discovery
+
+    def is_discovered(self, key):
+        return self.db.execute("SELECT 1 FROM discovered WHERE key = ?", (key,)).fetchone() is not None
+
+    def mark_discovered(self, key):
+        self.db.execute("INSERT OR REPLACE INTO discovered VALUES (?, ?)", (key, time.time()))
+        self.db.commit()
+
+    def add(self, urls, category=""):
+        """Adds newly discovered URLs; URLs already known keep their status. Returns how many were new.
+
+        A known URL listed under another `category` gains that category instead of a second fetch.
+        """
+        new = []
+        memberships = []
+        for url in urls:
+            url = canonical_url(url)
+            key = url_key(url)
+            if category:
+                memberships.append((key, category))
+            if self.seen is not None:
+                if key in self.seen:
+                    continue
+                self.seen.add(key)
+            new.append((url, key, category, time.time()))
+        before = self.db.total_changes
+        # A URL whose key is already queued (by this run or an interrupted one) is ignored
+        self.db.executemany("INSERT OR IGNORE INTO urls (url, key, category, updated_at) VALUES (?, ?, ?, ?)", new)
+        added = self.db.total_changes - before
+        self.db.executemany("INSERT OR IGNORE INTO categories (key, category) VALUES (?, ?)", memberships)
+        self.db.commit()
+        return added
+
+    # Fetching
+
+    def pending(self, batch_size=500):
+        """Yields (url, category) for URLs still to fetch, reading the table in batches."""
+        last = 0
+        while True:
+            rows = self.db.execute(
+                "SELECT rowid, url, category FROM urls WHERE rowid > ? AND "
+                "(status = ? OR (status = ? AND attempts < ?)) ORDER BY rowid LIMIT ?",
+                (last, PENDING, FAILED, self.max_attempts, batch_size)).fetchall()
+            if not rows:
+                return
+            for rowid, url, category in rows:
+                yield url, category
+            last = rows[-1][0]
+
+    def pending_count(self):
+        return self.db.execute(
+            "SELECT COUNT(*) FROM urls WHERE status = ? OR (status = ? AND attempts < ?)",
+            (PENDING, FAILED, self.max_attempts)).fetchone()[0]
+
+    def categories(self, url):
+        """Every category `url` was listed under, in discovery order."""
+        return [category for (category,) in self.db.execute(
+            "SELECT category FROM categories WHERE key = ? ORDER BY rowid", (url_key(url),))]
+
+    def category(self, url):
+        """The categories of `url` as one value ("christmas, desserts"), which is what extractors get."""
+        categories = self.categories(url)
+        if categories:
+            return ", ".join(categories)
+        row = self.db.execute("SELECT category FROM urls WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else ""
+
+    def mark_done(self, url, record):
+        status = DONE if record is not None else SKIPPED
+        self.db.execute(
+            "UPDATE urls SET status = ?, attempts = attempts + 1, record = ?, error = NULL, updated_at = ? "
+            "WHERE url = ?",
+            (status, json.dumps(record) if record is not None else None, time.time(), url))
+        self.db.commit()
+
+    def mark_failed(self, url, error):
+        self.db.execute(
+            "UPDATE urls SET status = ?, attempts = attempts + 1, error = ?, updated_at = ? WHERE url = ?",
+            (FAILED, str(error), time.time(), url))
+        self._dead_letter("url = ? AND attempts >= ?", (url, self.max_attempts))
+        self.db.commit()
+
+    # Dead letters
+
+    def _dead_letter(self, where, params):
+        rows = self.db.execute(
+            f"SELECT url, attempts, error, updated_at FROM urls WHERE status = ? AND {where}", (FAILED, *params)).fetchall()
+        # Every category the URL was listed under, as the categories table goes with the next reset
+        self.db.executemany(
+            "INSERT OR REPLACE INTO dead_letters (url, category, attempts, error, failed_at) VALUES (?, ?, ?, ?, ?)",
+            [(url, self.category(url), attempts, error, failed_at) for url, attempts, error, failed_at in rows])
+
+    def dead_letters(self, error=None):
+        """Yields (url, category, attempts, error) of the dead letters, those whose error contains `error` if given."""
+        yield from self.db.execute(
+            "SELECT url, category, attempts, error FROM dead_letters WHERE instr(error, ?) > 0 ORDER BY failed_at",
+            (error or "",))
+
+    def dead_letter_count(self):
+        return self.db.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+
+    def redrive(self, error=None):
+        """Queues the dead letters (those whose error contains `error`) again with fresh attempts; returns how many."""
+        rows = list(self.dead_letters(error))
+        if self.seen is not None:
+            for url, category, attempts, last_error in rows:
+                self.seen.add(url_key(url))
+        self.db.executemany(
+            "INSERT INTO urls (url, key, category, updated_at) VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+            "status = 'pending', attempts = 0, error = NULL, updated_at = excluded.updated_at",
+            [(url, url_key(url), category, time.time()) for url, category, attempts, last_error in rows])
+        self.db.executemany("DELETE FROM dead_letters WHERE url = ?", [(url,) for url, *rest in rows])
+        self.db.commit()
+        return len(rows)
+
+    # Results
+
+    def records(self):
+        """Yields extracted records in discovery order."""
+        for (record,) in self.db.execute("SELECT record FROM urls WHERE status = ? ORDER BY rowid", (DONE,)):
+            yield json.loads(record)
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM urls GROUP BY status").fetchall())
+
+    def finish(self):
+        """Marks the crawl complete; the next Frontier opened on this file starts over.
+
+        URLs that are still failed become dead letters, so starting over does not lose them.
+        """
+        self._dead_letter("1", ())
+        self.db.execute("UPDATE runs SET finished = 1 WHERE id = 1")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+async def drain(engine, frontier, extract, sink=None, executor=None, site=None):
+    """Fetches every pending URL and stores extract(url, html, category) results in the frontier.
+
+    `extract` returns a record dict, or None to skip the page; exceptions are recorded as
+    failures and retried by the next run. With a `sink` (recipe_common.sink), each record
+    is also written out as soon as it is extracted. With an `executor`, extraction runs in
+    that pool so the event loop keeps fetching (for this and other crawls) meanwhile; pages
+    of one crawl are still extracted one at a time, in order. Parse, extract and write
+    times and the page outcomes go to engine.metrics under `site` (default: the host), and
+    progress is printed every few seconds rather than per page.
+    """
+    loop = asyncio.get_running_loop()
+    metrics = engine.metrics
+    progress = Progress(site or frontier.path, frontier.pending_count())
+    urls = (url for url, category in frontier.pending())
+    async for response in engine.fetch_all(urls):
+        name = site or urlsplit(response.url).netloc
+        if response.status != 200:
+            logger.debug("Failed to fetch %s", response.url)
+            frontier.mark_failed(response.url, response.error or f"HTTP {response.status}")
+            metrics.count("pages", site=name, outcome="failed")
+            progress.update(failed=True)
+            continue
+        category = frontier.category(response.url)
+        if engine.archive is not None:
+            # Only frontier pages get here, so this tells recipe pages apart from listings in the archive
+            engine.archive.label(response.url, name, category)
+        try:
+            if executor is None:
+                record, parse, work = timed_extract(extract, response.url, response.text, category)
+            else:
+                record, parse, work = await loop.run_in_executor(executor, timed_extract, extract, response.url,
+                                                                 response.text, category)
+        except Exception as e:
+            logger.debug("Error scraping %s: %s", response.url, e)
+            frontier.mark_failed(response.url, e)
+            metrics.count("pages", site=name, outcome="failed")
+            progress.update(failed=True)
+            continue
+        metrics.stage("parse", parse, site=name)
+        metrics.stage("extract", work, site=name)
+        frontier.mark_done(response.url, record)
+        metrics.count("pages", site=name, outcome="done" if record is not None else "skipped")
+        progress.update()
+        if record is not None and sink is not None:
+            with metrics.timer("write", site=name):
+                sink.write(record)
+    progress.report()
@@ -0,0 +1,319 @@
+"""Downloaded images written straight into zip or tar parts, with a CSV manifest.
+
+Zipping the image folder after the download reads every image back from disk and
+needs twice the space at the peak. An ImageArchive takes the place of the ImageStore
+as the downloader's destination instead: each image is kept in memory while it
+streams in (hashed and sniffed like any other download) and then written once, whole,
+as the next entry of the archive. JPEGs do not compress, so zip entries are stored.
+An image already in the archive (same bytes) is not written again: the manifest points
+the recipe at the existing entry, and a tar part also gets a hard link member to it.
+
+    stats = download_images(rows, "addapinch_recipe_images.zip", "download_errors.log",
+                            max_part_bytes=2 * 1024 ** 3)
+
+The parts are `<name>-00000.zip`, `<name>-00001.zip`, …; a new part is started once
+the next image would take the current one past `max_part_bytes` (256 MB by default)
+or, for zip, once it holds `max_part_entries` images. The manifest,
+`<name>.zip.manifest.csv` (or .tar), has one row per recipe: recipe, url, part, entry,
+sha256, format and size, so a rerun skips the recipes it lists:
+
+- A tar part stays readable up to its last complete member, so its rows are appended
+  and flushed after each entry. A rerun cuts a part the last run left unfinished back
+  to its last listed member and closes it.
+- A zip part is only readable once its central directory is written on close, so its
+  rows are appended then; an interrupted run loses at most one bounded part.
+
+A part that no manifest row refers to was cut off before anything in it counted, and
+is removed when the archive is opened again.
+"""
+import csv
+import glob
+import os
+import re
+import tarfile
+import time
+import zipfile
+
+from recipe_common.imagestore import EXTENSIONS, IncomingImage, NotAnImage, describe_payload
+
+MANIFEST_FIELDS = ["recipe", "url", "part", "entry", "sha256", "format", "size"]
+DEFAULT_PART_BYTES = 256 * 1024 ** 2
+
+
+class ImageArchive:
+    """The destination for downloaded images that writes them into archive parts.
+
+    Subclasses open a part (_open_part()), write one entry (_write_entry()), and may
+    add a link to an entry of the same part (_write_link()) and finish the part a run
+    left unfinished (_recover_part()). With `rows_per_entry`, manifest rows are written
+    as each entry is; otherwise when its part is closed.
+    """
+
+    extension = None
+    rows_per_entry = False
+    default_part_entries = None
+
+    def __init__(self, path, max_part_bytes=DEFAULT_PART_BYTES, max_part_entries=None):
+        base = path[:-len(self.extension)] if path.endswith(self.extension) else path
+        self.folder = os.path.dirname(base) or "."
+        os.makedirs(self.folder, exist_ok=True)
+        self.base = base
+        self.max_part_bytes = max_part_bytes
+        self.max_part_entries = max_part_entries or self.default_part_entries
+        self.manifest_path = base + self.extension + ".manifest.csv"
+        self.recipes = {}  # recipe -> (url, sha256, format), of finished parts and the open one
+        self.entries = {}  # sha256 -> (part, entry, format, size)
+        self.urls = {}  # url -> sha256
+        rows = []
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+        listed = {}  # part -> its entries in the manifest
+        for row in rows:
+            listed.setdefault(row["part"], set()).add(row["entry"])
+        numbers = [_part_number(part) for part in listed]
+        for path in sorted(glob.glob(glob.escape(base) + "-*" + self.extension)):
+            name = os.path.basename(path)
+            if name not in listed:
+                print(f"Removing {path}: an earlier run stopped before finishing it")
+                os.remove(path)
+                continue
+            numbers.append(_part_number(name))
+            self._recover_part(path, listed[name])
+        for row in rows:
+            self._remember(row)
+        self.number = max((number for number in numbers if number is not None), default=-1) + 1
+        self.part = None
+        self.part_name = None
+        self.part_bytes = 0
+        self.part_rows = []
+        self.part_entries = set()
+        self.written = 0
+        self.deduplicated = 0
+        new = not os.path.exists(self.manifest_path)
+        self._manifest = open(self.manifest_path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._manifest, fieldnames=MANIFEST_FIELDS)
+        if new:
+            self._writer.writeheader()
+            self._manifest.flush()
+
+    def _remember(self, row):
+        self.recipes[row["recipe"]] = (row["url"], row["sha256"], row["format"])
+        self.entries.setdefault(row["sha256"], (row["part"], row["entry"], row["format"], int(row["size"])))
+        self.urls[row["url"]] = row["sha256"]
+
+    # The same calls the ImageDownloader makes on an ImageStore
+
+    def existing(self, recipe, url, filename):
+        stored = self.recipes.get(recipe)
+        return stored is not None and stored[0] == url
+
+    def lookup(self, recipe):
+        return self.recipes.get(recipe)
+
+    def digest_for_url(self, url):
+        return self.urls.get(url)
+
+    def incoming_path(self, filename, url):
+        return None  # downloads stay in memory until written to the archive
+
+    def add(self, recipe, url, filename, incoming):
+        """Writes a completed in-memory download as the next entry (unless the same bytes already are one)."""
+        fmt = incoming.format
+        if fmt is None:
+            raise NotAnImage(f"Not an image: {describe_payload(incoming.head)}")
+        digest = incoming.hash.hexdigest()
+        if digest in self.entries:
+            self.deduplicated += 1
+            self.map(recipe, url, filename, digest)
+            return "deduplicated"
+        if (self.part is None
+                or (self.max_part_bytes and self.part_bytes and self.part_bytes + incoming.size > self.max_part_bytes)
+                or (self.max_part_entries and len(self.part_entries) >= self.max_part_entries)):
+            self._next_part()
+        entry = os.path.splitext(filename)[0] + EXTENSIONS[fmt]
+        if entry in self.part_entries:
+            entry = f"{os.path.splitext(entry)[0]}-{digest[:8]}{EXTENSIONS[fmt]}"
+        self._write_entry(entry, incoming.data)
+        self.part_entries.add(entry)
+        self.part_bytes += incoming.size
+        self.written += 1
+        self.entries[digest] = (self.part_name, entry, fmt, incoming.size)
+        self._row(recipe, url, digest)
+        return "downloaded"
+
+    def map(self, recipe, url, filename, digest):
+        """Points `recipe` at the entry already holding the image `digest`."""
+        part, entry, fmt, size = self.entries[digest]
+        if part == self.part_name and self.part is not None:
+            link = os.path.splitext(filename)[0] + EXTENSIONS[fmt]
+            if link not in self.part_entries and self._write_link(link, entry):
+                self.part_entries.add(link)
+        self._row(recipe, url, digest)
+
+    def _row(self, recipe, url, digest):
+        part, entry, fmt, size = self.entries[digest]
+        row = {"recipe": recipe, "url": url, "part": part, "entry": entry, "sha256": digest, "format": fmt,
+               "size": size}
+        self.recipes[recipe] = (url, digest, fmt)
+        self.urls[url] = digest
+        if self.rows_per_entry or part != self.part_name:
+            # The entry is already readable: in a finished part, or a tar member already flushed
+            self._writer.writerow(row)
+            self._manifest.flush()
+        else:
+            self.part_rows.append(row)
+
+    def _next_part(self):
+        self._close_part()
+        self.part_name = os.path.basename(f"{self.base}-{self.number:05d}{self.extension}")
+        self.number += 1
+        self.part = self._open_part(os.path.join(self.folder, self.part_name))
+        self.part_bytes = 0
+        self.part_entries = set()
+
+    def _close_part(self):
+        if self.part is not None:
+            self.part.close()
+            self.part = None
+        if self.part_rows:
+            # Only now is the part readable, so only now may a rerun skip its recipes
+            self._writer.writerows(self.part_rows)
+            self._manifest.flush()
+            self.part_rows = []
+
+    def _open_part(self, path):
+        raise NotImplementedError
+
+    def _write_entry(self, name, data):
+        raise NotImplementedError
+
+    def _write_link(self, name, target):
+        return False
+
+    def _recover_part(self, path, entries):
+        pass
+
+    def stats(self):
+        return {"recipes": len(self.recipes), "images": len(self.entries), "written": self.written,
+                "deduplicated": self.deduplicated, "parts": self.number}
+
+    def close(self):
+        self._close_part()
+        self._manifest.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _part_number(name):
+    match = re.search(r"-(\d+)\.[a-z]+$", name)
+    return int(match.group(1)) if match else None
+
+
+class ZipImageArchive(ImageArchive):
+    """Zip parts with stored (uncompressed) entries; duplicates exist only in the manifest."""
+
+    extension = ".zip"
+
+    default_part_entries = 1000
+
+    def _open_part(self, path):
+        return zipfile.ZipFile(path, "x", compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    def _write_entry(self, name, data):
+        info = zipfile.ZipInfo(name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_STORED
+        self.part.writestr(info, data)
+
+
+class TarImageArchive(ImageArchive):
+    """Uncompressed tar parts; a duplicate in the same part becomes a hard link member."""
+
+    extension = ".tar"
+    rows_per_entry = True
+
+    def _open_part(self, path):
+        return tarfile.open(path, "x", format=tarfile.PAX_FORMAT)
+
+    def _write_entry(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        self.part.addfile(info, _Reader(data))
+        self.part.fileobj.flush()
+
+    def _write_link(self, name, target):
+        info = tarfile.TarInfo(name)
+        info.type = tarfile.LNKTYPE
+        info.linkname = target
+        info.mtime = time.time()
+        self.part.addfile(info)
+        self.part.fileobj.flush()
+        return True
+
+    def _recover_part(self, path, entries):
+        """Cuts a part an interrupted run left open back to the end of its last listed member and closes it."""
+        end = 0
+        with tarfile.open(path, "r:") as tar:
+            try:
+                for member in tar:
+                    if member.name not in entries and not member.islnk():
+                        break
+                    end = member.offset_data + -(-member.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            except tarfile.ReadError:
+                pass  # cut off in the middle of a member
+        with open(path, "r+b") as f:
+            f.seek(end)
+            if f.read(2 * tarfile.BLOCKSIZE) == b"\0" * 2 * tarfile.BLOCKSIZE:
+                return  # closed properly
+            f.seek(end)
+            f.truncate()
+            f.write(b"\0" * 2 * tarfile.BLOCKSIZE)
+        print(f"Closed {path}, which an earlier run left unfinished")
+
+
+class _Reader:
+    """A file object over a memoryview, so tarfile copies the bytes without another copy of them."""
+
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def read(self, size=-1):
+        end = len(self.data) if size is None or size < 0 else self.position + size
+        chunk = self.data[self.position:end]
+        self.position += len(chunk)
+        return bytes(chunk)
+
+
+ARCHIVES = {".zip": ZipImageArchive, ".tar": TarImageArchive}
+
+
+def open_image_archive(path, max_part_bytes=DEFAULT_PART_BYTES, max_part_entries=None):
+    """Opens the image archive matching the file extension (.zip or .tar)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in ARCHIVES:
+        raise ValueError(f"Unsupported archive format {extension!r}; use one of {', '.join(ARCHIVES)}")
+    return ARCHIVES[extension](path, max_part_bytes=max_part_bytes, max_part_entries=max_part_entries)
+
+
+def archive_store(store, archive):
+    """Writes every recipe of an ImageStore into an ImageArchive, reading each distinct blob once."""
+    from recipe_common.images import image_filename
+
+    for recipe, url, digest, fmt, size, path in store.manifest():
+        filename = image_filename(recipe)
+        if archive.existing(recipe, url, filename):
+            continue
+        if digest in archive.entries:
+            archive.map(recipe, url, filename, digest)
+            continue
+        incoming = IncomingImage(None)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                incoming.write(chunk)
+        archive.add(recipe, url, filename, incoming)
@@ -0,0 +1,350 @@
+"""Concurrent, resumable downloads of the recipe images listed in a scraper's CSV or Excel output.
+
+The rows are read lazily (csv.DictReader, or openpyxl in read-only mode for .xlsx),
+so a 20k-row sheet is never loaded whole, and each image is streamed through the
+shared FetchEngine, which keeps many downloads in flight within each image host's
+window, into an ImageStore (recipe_common/imagestore.py) that keeps every distinct
+image once and maps each recipe to it. A download goes to
+`incoming/<name>-<url hash>.jpg.part` and is only stored once all of its bytes are
+there, so a recipe already in the store is skipped on the next run. An interrupted `.part` file is resumed with a Range
+request, guarded by If-Range with the ETag or Last-Modified of the first response, so a
+changed image is fetched whole instead of being spliced onto the old bytes. Given a
+.zip or .tar path instead of a folder, the images go straight into an ImageArchive
+(recipe_common/imagearchive.py). Failures go to an ErrorLog, written in batches:
+
+    rows = read_rows("jamieoliver_recipes.csv", "product_number", "image_url")
+    stats = download_images(rows, "jamieoliver_recipe_images", "download_errors_jamieoliver_recipes.log")
+"""
+import asyncio
+import csv
+import json
+import os
+import re
+import time
+
+import aiohttp
+
+from recipe_common.fetch import CircuitOpenError, FetchEngine, run_sync
+from recipe_common.imagearchive import ARCHIVES, DEFAULT_PART_BYTES, ImageArchive, open_image_archive
+from recipe_common.imagestore import ImageStore, IncomingImage, NotAnImage
+from recipe_common.metrics import METRICS, Progress
+
+CONTENT_RANGE = re.compile(r"bytes (?:(\d+)-\d+|\*)/(\d+|\*)")
+
+
+def is_valid_image_url(url):
+    """Whether `url` is an http(s) URL. What it points to is read from the bytes that come back,
+    not from its extension, which CDN URLs often lack or get wrong."""
+    return isinstance(url, str) and bool(re.match(r"https?://\S+$", url))
+
+
+def image_filename(recipe_name):
+    """The file name of a recipe's image: `<recipe_name>.jpg`, with slashes and spaces replaced
+    (the store swaps the extension for the real format's)."""
+    return f"{recipe_name}.jpg".replace("/", "_").replace(" ", "_")
+
+
+def detect_encoding(path, sample_size=10000):
+    """The encoding chardet guesses from the start of the file (utf-8 without chardet)."""
+    try:
+        import chardet
+    except ImportError:
+        return "utf-8"
+    with open(path, "rb") as f:
+        return chardet.detect(f.read(sample_size))["encoding"] or "utf-8"
+
+
+def read_csv(path, id_column, url_column, encoding=None):
+    """Yields (recipe id, image URL) per row of a CSV file, one row at a time."""
+    with open(path, newline="", encoding=encoding or detect_encoding(path), errors="replace") as f:
+        for row in csv.DictReader(f):
+            yield (row.get(id_column) or "").strip(), (row.get(url_column) or "").strip()
+
+
+def read_xlsx(path, id_column, url_column, sheet=None):
+    """Yields (recipe id, image URL) per row of an .xlsx sheet (the active one by default).
+
+    The workbook is opened read-only, so openpyxl streams the rows from the file
+    instead of building every cell in memory.
+    """
+    import openpyxl  # only needed for Excel input
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = (workbook[sheet] if sheet else workbook.active).iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else "" for name in next(rows, ())]
+        id_index, url_index = header.index(id_column), header.index(url_column)
+        for row in rows:
+            values = [row[id_index] if id_index < len(row) else None, row[url_index] if url_index < len(row) else None]
+            yield tuple("" if value is None else str(value).strip() for value in values)
+    finally:
+        workbook.close()
+
+
+def read_rows(path, id_column, url_column, **options):
+    """read_csv() or read_xlsx(), by the file's extension."""
+    if os.path.splitext(path)[1].lower() in (".xlsx", ".xlsm"):
+        return read_xlsx(path, id_column, url_column, **options)
+    return read_csv(path, id_column, url_column, **options)
+
+
+class ErrorLog:
+    """The `<recipe> -> <url> : <error>` lines of failed downloads, appended in batches.
+
+    The file is opened once and written every `batch_size` failures or `flush_interval`
+    seconds instead of being reopened for each one.
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=10.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.count = 0
+        self._file = None
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def write(self, recipe_name, image_url, error_message):
+        self._buffer.append(f"{recipe_name} -> {image_url} : {error_message}\n")
+        self.count += 1
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.writelines(self._buffer)
+            self._file.flush()
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DownloadError(Exception):
+    """An image that could not be downloaded."""
+
+
+class IncompleteDownload(DownloadError):
+    """A response that did not complete the image; retried, resuming from the bytes already written."""
+
+
+class ImageDownloader:
+    """Streams images into an ImageStore (or an ImageArchive) through a FetchEngine, resuming partial files.
+
+    Each response is written in `chunk_size` pieces through a `buffer_size` file buffer,
+    hashed and sniffed on the way (recipe_common.imagestore.IncomingImage). A URL already
+    stored for another recipe is mapped to the same blob without a request. Requests go
+    through FetchEngine.fetch_stream(), so network errors, RETRY_STATUSES and incomplete
+    bodies are retried with the engine's backoff, circuit breaker and metrics; a retry
+    resumes from the bytes already written.
+    """
+
+    def __init__(self, engine, store, error_log, chunk_size=256 * 1024, buffer_size=1024 * 1024, metrics=None):
+        self.engine = engine
+        self.store = store
+        self.error_log = error_log
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.metrics = metrics or METRICS
+        self.stats = {"downloaded": 0, "deduplicated": 0, "resumed": 0, "skipped": 0, "failed": 0, "bytes": 0}
+        self._in_flight = {}  # url -> future of its digest, so rows sharing an image download it once
+
+    async def download(self, recipe_name, image_url):
+        """Stores one recipe's image unless it already is; returns "downloaded", "deduplicated", "skipped" or "failed"."""
+        try:
+            return await self._store(recipe_name, image_url)
+        except Exception as e:  # a disk error or a bad row fails this image, not the whole run
+            return self._failed(recipe_name, image_url, f"{type(e).__name__}: {e}")
+
+    async def _store(self, recipe_name, image_url):
+        if not is_valid_image_url(image_url):
+            return self._failed(recipe_name, image_url, "Invalid image URL")
+        filename = image_filename(recipe_name)
+        if self.store.existing(recipe_name, image_url, filename):
+            return self._outcome("skipped")
+        digest = self.store.digest_for_url(image_url)
+        if digest is None and image_url in self._in_flight:
+            digest = await asyncio.shield(self._in_flight[image_url])
+        if digest is not None:
+            self.store.map(recipe_name, image_url, filename, digest)
+            return self._outcome("deduplicated")
+
+        self._in_flight[image_url] = future = asyncio.get_running_loop().create_future()
+        outcome = "failed"
+        try:
+            outcome = await self._download(recipe_name, image_url, filename)
+        finally:
+            row = self.store.lookup(recipe_name)
+            future.set_result(row[1] if outcome != "failed" and row else None)
+            del self._in_flight[image_url]
+        return outcome
+
+    async def _download(self, recipe_name, image_url, filename):
+        part = self.store.incoming_path(filename, image_url)
+
+        def resume_headers():
+            offset, validator = _partial(image_url, part)
+            return {"Range": f"bytes={offset}-", "If-Range": validator} if offset else None
+
+        try:
+            incoming = await self.engine.fetch_stream(image_url, lambda response: self._receive(image_url, part, response),
+                                                      headers=resume_headers, retry_on=(IncompleteDownload,))
+            outcome = self.store.add(recipe_name, image_url, filename, incoming)
+        except NotAnImage as e:
+            _remove(part)
+            _remove(_meta_path(part))
+            return self._failed(recipe_name, image_url, str(e))
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError, DownloadError) as e:
+            return self._failed(recipe_name, image_url, str(e) or type(e).__name__)
+        _remove(_meta_path(part))
+        return self._outcome(outcome)
+
+    async def _receive(self, url, part, response):
+        """Writes the rest of `url`'s body into `part`; returns the IncomingImage once the file holds all of it."""
+        offset, validator = _partial(url, part)  # what resume_headers() asked for
+        if response.status == 416 and offset:
+            match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+            if match and match.group(2) == str(offset):
+                with IncomingImage(part, offset, self.buffer_size) as incoming:
+                    return incoming  # the .part file already held the whole image
+            _remove(part)
+            raise IncompleteDownload("HTTP 416 for a partial download; starting over")
+        if response.status not in (200, 206):
+            raise DownloadError(f"HTTP {response.status}")
+        if response.status == 206:
+            match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+            if not match or match.group(1) != str(offset):
+                _remove(part)
+                raise IncompleteDownload("Content-Range does not continue the partial download")
+            total = int(match.group(2)) if match.group(2) != "*" else None
+            self.stats["resumed"] += 1
+        else:
+            offset = 0  # the server sent the whole image: no Range support, or it changed
+            total = response.content_length
+            validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+            _write_meta(part, url, validator)
+        with IncomingImage(part, offset, self.buffer_size) as incoming:
+            try:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    incoming.write(chunk)
+            finally:
+                self.stats["bytes"] += incoming.size - offset
+        if total is not None and incoming.size != total:
+            raise IncompleteDownload(f"Incomplete download: {incoming.size} of {total} bytes")
+        return incoming
+
+    def _outcome(self, outcome):
+        self.stats[outcome] += 1
+        self.metrics.count("images", outcome=outcome)
+        return outcome
+
+    def _failed(self, recipe_name, image_url, error_message):
+        self.error_log.write(recipe_name, image_url, error_message)
+        return self._outcome("failed")
+
+    async def run(self, rows, progress=None):
+        """Downloads the (recipe id, image URL) rows, keeping the engine's window of downloads in flight."""
+        rows = iter(rows)
+        pending = set()
+        window = self.engine.max_concurrency * 2
+        try:
+            while True:
+                for recipe_name, image_url in rows:
+                    pending.add(asyncio.ensure_future(self.download(recipe_name, image_url)))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    return self.stats
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if progress is not None:
+                        progress.update(failed=task.result() == "failed")
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def _meta_path(part):
+    return part + ".json" if part else None
+
+
+def _partial(url, part):
+    """(bytes already in `part`, the validator to resume them with); (0, None) if they cannot be resumed
+    (or the download is kept in memory, with no `part` file)."""
+    if not part:
+        return 0, None
+    try:
+        size = os.path.getsize(part)
+        with open(_meta_path(part), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return 0, None
+    if not size or meta.get("url") != url or not meta.get("validator"):
+        return 0, None  # without a validator a resumed file could mix two versions of the image
+    return size, meta["validator"]
+
+
+def _write_meta(part, url, validator):
+    if not part:
+        return
+    with open(_meta_path(part), "w", encoding="utf-8") as f:
+        json.dump({"url": url, "validator": validator}, f)
+
+
+def _remove(path):
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def download_all(rows, store, error_log, **engine_options):
+    async with FetchEngine(**engine_options) as engine:
+        downloader = ImageDownloader(engine, store, error_log)
+        progress = Progress("images", None, unit="images")
+        stats = await downloader.run(rows, progress)
+        progress.report()
+        return stats
+
+
+def open_destination(folder, link="hard", near_duplicates=False, max_part_bytes=DEFAULT_PART_BYTES):
+    """An ImageArchive for a .zip or .tar path, otherwise an ImageStore in the folder."""
+    if os.path.splitext(folder)[1].lower() in ARCHIVES:
+        return open_image_archive(folder, max_part_bytes=max_part_bytes)
+    return ImageStore(folder, link=link, near_duplicates=near_duplicates)
+
+
+def download_images(rows, folder, log_path, max_concurrency=32, per_host_concurrency=8, per_host_rate=0,
+                    near_duplicates=False, link="hard", max_part_bytes=DEFAULT_PART_BYTES, **engine_options):
+    """Downloads every (recipe id, image URL) row into `folder`; returns the counts of each outcome.
+
+    `folder` is an ImageStore's folder, or a .zip or .tar path to write the images
+    straight into an ImageArchive (split into parts of at most `max_part_bytes`). Image hosts are
+    CDNs, so by default each one gets 8 downloads in flight and no request spacing;
+    `per_host_rate` and the other FetchEngine options still apply. `near_duplicates` and
+    `link` are passed to the ImageStore.
+    """
+    store = open_destination(folder, link, near_duplicates, max_part_bytes)
+    try:
+        with ErrorLog(log_path) as error_log:
+            stats = run_sync(download_all(rows, store, error_log, max_concurrency=max_concurrency,
+                                          per_host_concurrency=per_host_concurrency, per_host_rate=per_host_rate,
+                                          **engine_options))
+        print(f"Image {'archive' if isinstance(store, ImageArchive) else 'store'}: {store.stats()}")
+        return stats
+    finally:
+        store.close()
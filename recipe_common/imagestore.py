@@ -0,0 +1,352 @@
+"""Content-addressed store for the downloaded recipe images.
+
+Recipes often share a hero image, and an image URL's extension says little about what
+comes back (WebP behind a .jpg, an HTML error page with status 200). So each download
+is hashed (SHA-256) and its format read from its first bytes while it streams in. A
+payload that is not an image is rejected before the rest of it is written. Every
+distinct image is kept once, as `blobs/<aa>/<sha256>.<ext>`, and `images.sqlite` maps
+each recipe to its blob. A recipe also gets a `<recipe>.<ext>` hard link (or symlink) to
+its blob in the store's folder, so the folder still reads as one image per recipe
+without the duplicates taking any space:
+
+    store = ImageStore("jamieoliver_recipe_images", near_duplicates=True)
+    for recipe, url, digest, fmt, size, path in store.manifest():
+        ...
+    print(store.stats())
+    store.close()
+
+With `near_duplicates` (needs Pillow), a 64-bit difference hash of each new blob is
+compared with those already stored, and an image within `max_distance` bits of one, the
+same photo re-encoded or resized by the CDN, is mapped to the stored blob instead.
+"""
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import time
+
+# format -> the extension its files get
+EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "gif": ".gif", "webp": ".webp", "bmp": ".bmp", "avif": ".avif",
+              "heic": ".heic", "tiff": ".tif"}
+SNIFF_BYTES = 16  # enough for every signature in sniff_format()
+
+
+def sniff_format(head):
+    """The image format the first bytes of a file belong to, or None if they are not an image."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:2] == b"BM":
+        return "bmp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"avif", b"avis"):
+            return "avif"
+        if brand in (b"heic", b"heix", b"mif1", b"msf1"):
+            return "heic"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+
+def describe_payload(head):
+    """A short description of bytes that are not an image, for the error log."""
+    text = head.lstrip().lower()
+    if text.startswith((b"<!doctype html", b"<html", b"<head", b"<body")):
+        return "an HTML page"
+    if text.startswith((b"{", b"[")):
+        return "JSON"
+    if text.startswith(b"<?xml") or text.startswith(b"<svg"):
+        return "XML/SVG"
+    return f"unknown bytes {head[:8].hex()}"
+
+
+class NotAnImage(Exception):
+    """Raised when a download's first bytes are not an image format the store keeps."""
+
+
+class IncomingImage:
+    """A download being written to its `.part` file, hashed and sniffed as its bytes arrive.
+
+    With an `offset`, the bytes already in the file are read back once to carry on the
+    hash, and the new ones are appended. With no `path` the bytes are kept in memory
+    (`data`), for sinks that write each image out whole, such as an ImageArchive.
+    """
+
+    def __init__(self, path, offset=0, buffer_size=1024 * 1024):
+        self.path = path
+        self.hash = hashlib.sha256()
+        self.head = b""
+        self.size = 0
+        if path is None:
+            self.file = io.BytesIO()
+            return
+        if offset:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(buffer_size), b""):
+                    self._consume(chunk)
+        self.file = open(path, "ab" if offset else "wb", buffering=buffer_size)
+
+    def _consume(self, chunk):
+        if len(self.head) < SNIFF_BYTES:
+            self.head += chunk[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES and sniff_format(self.head) is None:
+                raise NotAnImage(f"Not an image: {describe_payload(self.head)}")
+        self.hash.update(chunk)
+        self.size += len(chunk)
+
+    def write(self, chunk):
+        self._consume(chunk)
+        self.file.write(chunk)
+
+    @property
+    def format(self):
+        return sniff_format(self.head)
+
+    @property
+    def data(self):
+        """The bytes of an in-memory download."""
+        return self.file.getbuffer()
+
+    def close(self):
+        if self.path is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def difference_hash(path):
+    """64-bit dHash of an image: whether each pixel of a 9x8 grey thumbnail is brighter than the next."""
+    from PIL import Image  # only needed for near-duplicate detection
+
+    with Image.open(path) as image:
+        image.draft("L", (64, 64))  # JPEG: let the decoder scale down by up to 8x
+        pixels = list(image.convert("L").resize((9, 8), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            bits = bits << 1 | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return bits
+
+
+class ImageStore:
+    """Downloaded images kept once each under `folder`, with a recipe -> blob map in SQLite.
+
+    `link` is how a recipe's `<recipe>.<ext>` file points at its blob: "hard" (a hard
+    link, falling back to a symlink where the file system has none), "symlink", or None
+    for no per-recipe files at all (the map is then the only way in).
+    """
+
+    def __init__(self, folder, link="hard", near_duplicates=False, max_distance=3):
+        self.folder = folder
+        self.link = link
+        self.near_duplicates = near_duplicates
+        self.max_distance = max_distance
+        os.makedirs(os.path.join(folder, "incoming"), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(folder, "images.sqlite"), check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                format TEXT,
+                size INTEGER,
+                dhash INTEGER,
+                stored_at REAL
+            )""")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                recipe TEXT PRIMARY KEY,
+                url TEXT,
+                digest TEXT,
+                downloaded_digest TEXT,
+                filename TEXT
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS images_url ON images (url)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS images_downloaded ON images (downloaded_digest)")
+        self.db.commit()
+        self.deduplicated = 0
+        self.near_duplicate_count = 0
+        self._bands = None  # near-duplicate lookup, built on first use (see _similar())
+
+    def blob_path(self, digest, fmt):
+        return os.path.join(self.folder, "blobs", digest[:2], digest + EXTENSIONS[fmt])
+
+    def incoming_path(self, filename, url):
+        """Where the download of `url` for the recipe file `filename` is written until it is complete.
+
+        The name carries a hash of the URL, so recipes whose names sanitize to the same
+        file name never write into (or resume) each other's partial file.
+        """
+        stem, extension = os.path.splitext(filename)
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.folder, "incoming", f"{stem}-{key}{extension}.part")
+
+    def lookup(self, recipe):
+        """(url, digest, format) of the recipe's stored image, or None if it has none on disk."""
+        row = self.db.execute("SELECT images.url, images.digest, blobs.format FROM images JOIN blobs "
+                              "ON blobs.digest = images.digest WHERE recipe = ?", (recipe,)).fetchone()
+        if row is None or not os.path.exists(self.blob_path(row[1], row[2])):
+            return None
+        return row
+
+    def existing(self, recipe, url, filename):
+        """Whether the recipe's image from `url` is already stored.
+
+        A plain `<recipe>.jpg` saved before the store existed is moved into it first.
+        """
+        stored = self.lookup(recipe)
+        if stored is not None:
+            return stored[0] == url
+        legacy = os.path.join(self.folder, filename)
+        return os.path.isfile(legacy) and not os.path.islink(legacy) and self.adopt(recipe, url, filename, legacy)
+
+    def digest_for_url(self, url):
+        """The digest a URL's image was stored under for any recipe, or None."""
+        row = self.db.execute("SELECT images.digest, blobs.format FROM images JOIN blobs "
+                              "ON blobs.digest = images.digest WHERE url = ? LIMIT 1", (url,)).fetchone()
+        if row is None or not os.path.exists(self.blob_path(*row)):
+            return None
+        return row[0]
+
+    def add(self, recipe, url, filename, incoming):
+        """Moves a completed IncomingImage into the store (or drops it as a duplicate) and maps the recipe to it.
+
+        Returns "downloaded" for a new blob, or "deduplicated" when the same (or, with
+        near_duplicates, a nearly identical) image was already stored.
+        """
+        fmt = incoming.format
+        if fmt is None:
+            raise NotAnImage(f"Not an image: {describe_payload(incoming.head)}")
+        digest = downloaded = incoming.hash.hexdigest()
+        outcome = "downloaded"
+        # The same bytes may have been stored, or mapped to a near-duplicate, before
+        known = (self.db.execute("SELECT digest FROM blobs WHERE digest = ?", (digest,)).fetchone()
+                 or self.db.execute("SELECT digest FROM images WHERE downloaded_digest = ? LIMIT 1",
+                                    (digest,)).fetchone())
+        if known:
+            os.remove(incoming.path)
+            digest, outcome = known[0], "deduplicated"
+        else:
+            dhash = None
+            if self.near_duplicates and fmt not in ("avif", "heic"):
+                try:
+                    dhash = difference_hash(incoming.path)
+                except (OSError, ValueError):
+                    pass  # Pillow cannot decode it; it is still stored, just not compared
+            similar = self._similar(dhash) if dhash is not None else None
+            if similar is not None:
+                os.remove(incoming.path)
+                digest, outcome = similar, "deduplicated"
+                self.near_duplicate_count += 1
+            else:
+                path = self.blob_path(digest, fmt)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(incoming.path, path)
+                self.db.execute("INSERT OR REPLACE INTO blobs (digest, format, size, dhash, stored_at) "
+                                "VALUES (?, ?, ?, ?, ?)", (digest, fmt, incoming.size, _signed(dhash), time.time()))
+                if dhash is not None and self._bands is not None:
+                    self._index_dhash(digest, dhash)
+        if outcome == "deduplicated":
+            self.deduplicated += 1
+        self.map(recipe, url, filename, digest, downloaded)
+        return outcome
+
+    def map(self, recipe, url, filename, digest, downloaded=None):
+        """Points `recipe` at the stored blob `digest`, linking `<filename stem>.<ext>` to it."""
+        fmt = self.db.execute("SELECT format FROM blobs WHERE digest = ?", (digest,)).fetchone()[0]
+        name = os.path.splitext(filename)[0] + EXTENSIONS[fmt]
+        previous = self.db.execute("SELECT filename FROM images WHERE recipe = ?", (recipe,)).fetchone()
+        if previous and previous[0] and previous[0] != name:
+            _remove(os.path.join(self.folder, previous[0]))
+        if self.link:
+            self._link(self.blob_path(digest, fmt), os.path.join(self.folder, name))
+        self.db.execute("INSERT OR REPLACE INTO images (recipe, url, digest, downloaded_digest, filename) "
+                        "VALUES (?, ?, ?, ?, ?)", (recipe, url, digest, downloaded or digest, name if self.link else None))
+        self.db.commit()
+
+    def adopt(self, recipe, url, filename, path):
+        """Moves an image saved before the store existed (e.g. a `<recipe>.jpg`) into it; False if it is not an image."""
+        incoming_path = self.incoming_path(filename, url)
+        shutil.move(path, incoming_path)
+        try:
+            with IncomingImage(incoming_path, offset=os.path.getsize(incoming_path)) as incoming:
+                pass
+            self.add(recipe, url, filename, incoming)
+        except NotAnImage:
+            os.remove(incoming_path)
+            return False
+        return True
+
+    def _link(self, blob, path):
+        _remove(path)
+        if self.link == "hard":
+            try:
+                os.link(blob, path)
+                return
+            except OSError:
+                pass  # no hard links here (some network and FAT file systems)
+        os.symlink(os.path.relpath(blob, os.path.dirname(path)), path)
+
+    def _index_dhash(self, digest, dhash):
+        # Split into max_distance + 1 bands: two hashes within max_distance bits agree on at least one band
+        for band, value in enumerate(_bands(dhash, self.max_distance + 1)):
+            self._bands.setdefault((band, value), []).append((digest, dhash))
+
+    def _similar(self, dhash):
+        """The stored blob whose dHash is within max_distance bits of `dhash`, or None."""
+        if self._bands is None:
+            self._bands = {}
+            for digest, stored in self.db.execute("SELECT digest, dhash FROM blobs WHERE dhash IS NOT NULL"):
+                self._index_dhash(digest, stored & (2 ** 64 - 1))
+        for band, value in enumerate(_bands(dhash, self.max_distance + 1)):
+            for digest, stored in self._bands.get((band, value), ()):
+                if bin(stored ^ dhash).count("1") <= self.max_distance:
+                    return digest
+        return None
+
+    def manifest(self):
+        """Yields (recipe, url, digest, format, size, blob path) for every mapped recipe."""
+        for recipe, url, digest, fmt, size in self.db.execute(
+                "SELECT recipe, url, images.digest, format, size FROM images JOIN blobs "
+                "ON blobs.digest = images.digest ORDER BY recipe"):
+            yield recipe, url, digest, fmt, size, self.blob_path(digest, fmt)
+
+    def stats(self):
+        recipes, mapped_bytes = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM images JOIN blobs ON blobs.digest = images.digest").fetchone()
+        blobs, stored_bytes = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return {"recipes": recipes, "blobs": blobs, "stored_bytes": stored_bytes,
+                "saved_bytes": max(0, mapped_bytes - stored_bytes), "deduplicated": self.deduplicated,
+                "near_duplicates": self.near_duplicate_count}
+
+    def close(self):
+        self.db.close()
+
+
+def _bands(dhash, count):
+    width = 64 // count
+    return [(dhash >> (band * width)) & ((1 << width) - 1) if band < count - 1 else dhash >> (band * width)
+            for band in range(count)]
+
+
+def _signed(dhash):
+    # SQLite integers are signed 64-bit
+    return dhash - 2 ** 64 if dhash is not None and dhash >= 2 ** 63 else dhash
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,299 @@
+import html as htmllib
+import json
+import re
+from html.parser import HTMLParser
+
+from recipe_common.parsing import element_spans
+
+LD_JSON = re.compile(rb"""<script\b[^>]*\btype\s*=\s*["']?application/ld\+json["']?[^>]*>(.*?)</script\s*>""",
+                     re.S | re.I)
+ISO_DURATION = re.compile(r"^P(?:(\d+(?:\.\d+)?)D)?(?:T(?:(\d+(?:\.\d+)?)H)?(?:(\d+(?:\.\d+)?)M)?(?:(\d+(?:\.\d+)?)S)?)?$",
+                          re.I)
+# itemtype may list several types ("https://schema.org/Recipe https://schema.org/NewsArticle")
+MICRODATA_RECIPE = re.compile(r"""<(\w+)\b[^>]*\bitemtype\s*=\s*(?:["'][^"'>]*?)?https?://schema\.org/Recipe/?["'\s>]""",
+                              re.I)
+TAGS = re.compile(r"<[^>]+>")
+
+
+def _type_name(value):
+    # "Recipe", "schema:Recipe" and "https://schema.org/Recipe" all name the same type
+    return str(value).rstrip("/").rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+
+
+def _is_recipe(node):
+    """Whether a JSON-LD or microdata item is a Recipe; @type may be one type or a list (["Recipe", "NewsArticle"])."""
+    types = node.get("@type")
+    return any(_type_name(value) == "Recipe" for value in (types if isinstance(types, list) else [types]) if value)
+
+
+def _find_in(node):
+    if isinstance(node, list):
+        for item in node:
+            found = _find_in(item)
+            if found is not None:
+                return found
+    elif isinstance(node, dict):
+        if _is_recipe(node):
+            return node
+        # @graph, mainEntity and friends
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                found = _find_in(value)
+                if found is not None:
+                    return found
+    return None
+
+
+def find_jsonld_recipe(page):
+    """Returns the schema.org Recipe object from the page's ld+json blocks, or None.
+
+    The blocks are located with a regex on the raw bytes and decoded with json; no DOM is built.
+    """
+    if isinstance(page, str):
+        page = page.encode("utf-8")
+    for match in LD_JSON.finditer(page):
+        blob = match.group(1).strip()
+        if blob.startswith(b"<![CDATA["):
+            blob = blob[9:].rsplit(b"]]>", 1)[0]
+        try:
+            data = json.loads(blob.rstrip(b";"), strict=False)
+        except ValueError:
+            continue
+        recipe = _find_in(data)
+        if recipe is not None:
+            return recipe
+    return None
+
+
+class MicrodataReader(HTMLParser):
+    """Collects itemprop values into nested dicts while the HTML streams past (no tree is built)."""
+
+    ATTRIBUTE_VALUES = {"meta": "content", "img": "src", "audio": "src", "video": "src", "source": "src",
+                        "embed": "src", "iframe": "src", "a": "href", "link": "href", "area": "href",
+                        "time": "datetime", "data": "value", "meter": "value"}
+    VOID = {"meta", "img", "link", "source", "embed", "area", "br", "hr", "input", "wbr"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.items = []   # top-level items, in page order
+        self._stack = []  # open elements: [tag, props, item, text parts or None]
+
+    def _owner(self):
+        for entry in reversed(self._stack):
+            if entry[2] is not None:
+                return entry[2]
+        return None
+
+    def _assign(self, props, value):
+        owner = self._owner()
+        if owner is None:
+            return
+        for prop in props:
+            if prop in owner:
+                existing = owner[prop]
+                owner[prop] = existing + [value] if isinstance(existing, list) else [existing, value]
+            else:
+                owner[prop] = value
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        props = (attrs.get("itemprop") or "").split()
+        item = None
+        if "itemscope" in attrs:
+            types = [_type_name(value) for value in (attrs.get("itemtype") or "").split()]
+            item = {"@type": types[0] if len(types) == 1 else types}
+            if not props and self._owner() is None:
+                self.items.append(item)
+        if props and item is None and tag in self.ATTRIBUTE_VALUES and attrs.get(self.ATTRIBUTE_VALUES[tag]) is not None:
+            self._assign(props, attrs[self.ATTRIBUTE_VALUES[tag]])
+            props = []
+        if tag in self.VOID:
+            if props:
+                self._assign(props, item if item is not None else "")
+            return
+        self._stack.append([tag, props, item, [] if props and item is None else None])
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in self.VOID:
+            self.handle_endtag(tag)
+
+    def handle_data(self, data):
+        for entry in self._stack:
+            if entry[3] is not None:
+                entry[3].append(data)
+
+    def handle_endtag(self, tag):
+        if not any(entry[0] == tag for entry in self._stack):
+            return  # stray end tag
+        while self._stack:
+            open_tag, props, item, text = self._stack.pop()
+            if props:
+                self._assign(props, item if item is not None else " ".join("".join(text).split()))
+            if open_tag == tag:
+                return
+
+
+def find_microdata_recipe(page):
+    """Returns the itemscope schema.org Recipe on the page as a JSON-LD-like dict, or None.
+
+    Only the Recipe element is cut out of the page and streamed through MicrodataReader.
+    """
+    if isinstance(page, bytes):
+        page = page.decode("utf-8", errors="replace")
+    match = MICRODATA_RECIPE.search(page)
+    if match is None:
+        return None
+    span = next(element_spans(page[match.start():], match.group(1).lower()), None)
+    if span is None:
+        return None
+    reader = MicrodataReader()
+    reader.feed(page[match.start():match.start() + span[1]])
+    reader.close()
+    return next((item for item in reader.items if _is_recipe(item)), None)
+
+
+def find_recipe(page):
+    """The page's schema.org Recipe: JSON-LD first, then microdata."""
+    return find_jsonld_recipe(page) or find_microdata_recipe(page)
+
+
+# Normalising schema.org values
+
+def format_minutes(minutes, separator=" "):
+    """"1 hr 5 mins", "2 hr", "15 mins"; with separator="" as WPRM cards read ("1hr5mins")."""
+    hours, mins = divmod(int(round(minutes)), 60)
+    if hours > 0 and mins > 0:
+        parts = [str(hours), "hr", str(mins), "mins"]
+    elif hours > 0:
+        parts = [str(hours), "hr"]
+    else:
+        parts = [str(mins), "mins"]
+    return separator.join(parts)
+
+
+def duration_minutes(value):
+    """Minutes in an ISO 8601 duration such as "PT1H5M", or None."""
+    match = ISO_DURATION.match((value or "").strip()) if isinstance(value, str) else None
+    if not match or not any(match.groups()):
+        return None
+    days, hours, mins, secs = (float(part) if part else 0.0 for part in match.groups())
+    return days * 1440 + hours * 60 + mins + secs / 60
+
+
+def format_duration(value, format_time=format_minutes):
+    """An ISO 8601 duration as format_time(minutes) writes it (a site's own wording), or None."""
+    if value in (None, ""):
+        return None
+    minutes = duration_minutes(value)
+    if minutes is None:
+        return clean_text(value)  # some sites put "20 minutes" straight in
+    return format_time(minutes) if minutes else None
+
+
+def clean_text(value):
+    if value is None:
+        return None
+    if isinstance(value, list):
+        value = " ".join(str(part) for part in value if part)
+    text = " ".join(TAGS.sub(" ", htmllib.unescape(str(value))).split())
+    return text or None
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def image_url(value):
+    for image in _as_list(value):
+        if isinstance(image, dict):
+            image = image.get("url") or image.get("contentUrl")
+        if isinstance(image, str) and image:
+            return image
+    return None
+
+
+def instruction_steps(value):
+    """Flattens recipeInstructions (text, HowToStep, HowToSection, or one block of text) into step strings."""
+    steps = []
+    for entry in _as_list(value):
+        if isinstance(entry, dict):
+            if entry.get("itemListElement"):
+                steps.extend(instruction_steps(entry["itemListElement"]))
+            else:
+                text = clean_text(entry.get("text") or entry.get("name"))
+                if text:
+                    steps.append(text)
+        elif isinstance(entry, str):
+            steps.extend(line for line in (clean_text(part) for part in entry.splitlines()) if line)
+    return steps
+
+
+def yields(value):
+    values = [clean_text(entry) for entry in _as_list(value)]
+    values = [entry for entry in values if entry]
+    # ["4", "4 servings"]: the one with words is the more useful
+    return next((entry for entry in values if not entry.isdigit()), values[0] if values else None)
+
+
+def servings(value):
+    """The number of servings in recipeYield ("12" from ["12", "12 slices"] or "12 servings"), or None."""
+    values = [entry for entry in map(clean_text, _as_list(value)) if entry]
+    for entry in sorted(values, key=lambda entry: not entry.isdigit()):
+        match = re.match(r"\d+", entry)
+        if match:
+            return match.group()
+    return None
+
+
+def nutrition(value):
+    """{"Calories": "250 kcal", "Saturated Fat": "3 g", ...} from a NutritionInformation object."""
+    if not isinstance(value, dict):
+        return None
+    facts = {}
+    for key, amount in value.items():
+        if key.startswith("@") or amount in (None, ""):
+            continue
+        label = re.sub(r"Content$", "", key)
+        label = re.sub(r"(?<!^)(?=[A-Z])", " ", label).title()  # as nutrition labels read: "Saturated Fat"
+        facts[label] = clean_text(amount)
+    return facts or None
+
+
+def recipe_fields(recipe, format_time=format_minutes):
+    """Maps a schema.org Recipe onto plain fields; anything the page does not provide is None.
+
+    Times are written by `format_time(minutes)`, so they read as the site's own time
+    fields do. `yields` is the recipeYield text ("4 servings"), `servings` its number.
+    """
+    return {
+        "name": clean_text(recipe.get("name")),
+        "description": clean_text(recipe.get("description")),
+        "prep_time": format_duration(recipe.get("prepTime"), format_time),
+        "cook_time": format_duration(recipe.get("cookTime"), format_time),
+        "total_time": format_duration(recipe.get("totalTime"), format_time),
+        "yields": yields(recipe.get("recipeYield")),
+        "servings": servings(recipe.get("recipeYield")),
+        "ingredients": [text for text in map(clean_text, _as_list(recipe.get("recipeIngredient")
+                                                                    or recipe.get("ingredients"))) if text] or None,
+        "instructions": instruction_steps(recipe.get("recipeInstructions")) or None,
+        "image": image_url(recipe.get("image")),
+        "nutrition": nutrition(recipe.get("nutrition")),
+        "category": clean_text(", ".join(map(str, _as_list(recipe.get("recipeCategory")))) or None),
+        "cuisine": clean_text(", ".join(map(str, _as_list(recipe.get("recipeCuisine")))) or None),
+    }
+
+
+def fill_missing(record, fallback):
+    """Fills the fields of `record` that are None from `fallback(missing)`, called only if any are.
+
+    `fallback` returns a dict (e.g. the site's selector-based extractor) or None.
+    """
+    missing = [key for key, value in record.items() if value is None]
+    if missing:
+        extra = fallback(missing) or {}
+        for key in missing:
+            record[key] = extra.get(key)
+    return record
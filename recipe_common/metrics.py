@@ -0,0 +1,279 @@
+"""Counters and latency histograms for the crawl stages, per host and per site.
+
+The fetch engine records DNS, connect, time to first byte and download per host, the
+first three through an aiohttp TraceConfig; drain() and the ParsePool record parse (building the
+tree), extract (everything else the extractor does) and write (the sink) per site. All
+of it goes to one Metrics registry, METRICS unless another is passed, which can be read
+as a JSON snapshot or in the Prometheus text format:
+
+    print(METRICS.summary())                  # where the time went, per stage
+    METRICS.write_snapshot("metrics.json")    # or report() to rewrite it every few seconds
+    runner = await serve(METRICS, port=9108)  # http://127.0.0.1:9108/metrics for Prometheus
+"""
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from recipe_common import parsing
+
+STAGES = ("dns", "connect", "ttfb", "download", "parse", "extract", "write")
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+PREFIX = "recipe_"
+
+
+class Histogram:
+    """Observation counts in fixed latency buckets, plus their count and sum."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimates the q-quantile by interpolating inside its bucket, as Prometheus does."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def summary(self):
+        mean = self.sum / self.count if self.count else 0.0
+        return {"count": self.count, "sum": round(self.sum, 6), "mean": round(mean, 6),
+                "p50": round(self.quantile(0.5), 6), "p90": round(self.quantile(0.9), 6),
+                "p99": round(self.quantile(0.99), 6)}
+
+
+class Metrics:
+    """A thread-safe registry of counters and histograms, each keyed by name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # (name, ((label, value), ...)) -> number
+        self.histograms = {}  # (name, ((label, value), ...)) -> Histogram
+        self.started = time.time()
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    def stage(self, stage, seconds, **labels):
+        """Records the time one page spent in a stage (see STAGES)."""
+        self.observe("stage_seconds", seconds, stage=stage, **labels)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage(stage, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        """Everything recorded so far as a JSON-serializable dict."""
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{"name": name, "labels": dict(labels), **histogram.summary()}
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+        return {"time": time.time(), "uptime": round(time.time() - self.started, 3),
+                "counters": counters, "histograms": histograms}
+
+    def write_snapshot(self, path):
+        # Written next to the file and renamed over it, so a reader never sees half a snapshot
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(f"{path}.tmp", path)
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(h.counts), h.count, h.sum, h.buckets) for key, h in self.histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name}_total counter")
+            lines.append(f"{PREFIX}{name}_total{_labels(labels)} {value}")
+        for (name, labels), counts, count, total, buckets in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """One line per stage and host/site: how many pages, total seconds and p50/p90/p99."""
+        lines = []
+        with self._lock:
+            rows = [(dict(labels), histogram.summary()) for (name, labels), histogram in self.histograms.items()
+                    if name == "stage_seconds"]
+        rows.sort(key=lambda row: (STAGES.index(row[0]["stage"]) if row[0]["stage"] in STAGES else len(STAGES),
+                                   row[0].get("host") or row[0].get("site", "")))
+        for labels, stats in rows:
+            where = labels.get("host") or labels.get("site", "")
+            lines.append(f"{labels['stage']:<9} {where:<30} {stats['count']:6} × {stats['sum']:8.2f} s  "
+                         f"p50 {stats['p50'] * 1000:7.1f} ms  p90 {stats['p90'] * 1000:7.1f} ms  "
+                         f"p99 {stats['p99'] * 1000:7.1f} ms")
+        return "\n".join(lines)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+METRICS = Metrics()
+
+
+def trace_config(metrics=METRICS):
+    """An aiohttp TraceConfig recording DNS, connect and time-to-first-byte per host into `metrics`."""
+    clock = time.perf_counter
+
+    async def on_request_start(session, context, params):
+        # The page's host comes with the request, as the URL's is the replay server's under replay
+        context.host = (context.trace_request_ctx or {}).get("host") or urlsplit(str(params.url)).netloc
+        context.start = clock()
+
+    async def on_dns_start(session, context, params):
+        context.dns_start = clock()
+
+    async def on_dns_end(session, context, params):
+        metrics.stage("dns", clock() - context.dns_start, host=context.host)
+
+    async def on_connection_start(session, context, params):
+        context.connect_start = clock()
+
+    async def on_connection_end(session, context, params):
+        metrics.stage("connect", clock() - context.connect_start, host=context.host)
+
+    async def on_connection_reused(session, context, params):
+        metrics.count("connections_reused", host=context.host)
+
+    async def on_request_end(session, context, params):
+        # Fired once the response headers are in, before the body is read
+        metrics.stage("ttfb", clock() - context.start, host=context.host)
+
+    async def on_request_exception(session, context, params):
+        metrics.count("request_errors", host=context.host, error=type(params.exception).__name__)
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(on_request_start)
+    config.on_dns_resolvehost_start.append(on_dns_start)
+    config.on_dns_resolvehost_end.append(on_dns_end)
+    config.on_connection_create_start.append(on_connection_start)
+    config.on_connection_create_end.append(on_connection_end)
+    config.on_connection_reuseconn.append(on_connection_reused)
+    config.on_request_end.append(on_request_end)
+    config.on_request_exception.append(on_request_exception)
+    return config
+
+
+def timed_extract(extract, url, html, category):
+    """Runs extract(url, html, category); returns (record, seconds parsing, seconds extracting)."""
+    parsed = parsing.parse_seconds()
+    start = time.perf_counter()
+    record = extract(url, html, category)
+    elapsed = time.perf_counter() - start
+    parse = parsing.parse_seconds() - parsed
+    return record, parse, elapsed - parse
+
+
+class Progress:
+    """A progress line every `interval` seconds instead of a print per page (`total` may be None if unknown)."""
+
+    def __init__(self, label, total, interval=5.0, unit="pages"):
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.started = self.last = time.monotonic()
+
+    def update(self, failed=False):
+        self.done += 1
+        self.failed += failed
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.report(now)
+
+    def report(self, now=None):
+        elapsed = max((now or time.monotonic()) - self.started, 1e-9)
+        rate = self.done / elapsed
+        if self.total is None:
+            print(f"{self.label}: {self.done} {self.unit}, {rate:.1f}/s, {self.failed} failed")
+            return
+        left = f", ~{(self.total - self.done) / rate:.0f} s left" if rate and self.done < self.total else ""
+        print(f"{self.label}: {self.done}/{self.total} {self.unit}, {rate:.1f}/s, {self.failed} failed{left}")
+
+
+async def report(metrics=METRICS, path="metrics.json", interval=10.0):
+    """Rewrites the JSON snapshot at `path` every `interval` seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        metrics.write_snapshot(path)
+
+
+async def serve(metrics=METRICS, port=9108, host="127.0.0.1"):
+    """Serves /metrics (Prometheus text) and /metrics.json; returns the runner, to cleanup() when done."""
+    from aiohttp import web
+
+    async def prometheus(request):
+        return web.Response(text=metrics.prometheus(), content_type="text/plain", charset="utf-8")
+
+    async def snapshot(request):
+        return web.json_response(metrics.snapshot())
+
+    app = web.Application()
+    app.router.add_get("/metrics", prometheus)
+    app.router.add_get("/metrics.json", snapshot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Metrics at http://{host}:{port}/metrics")
+    return runner
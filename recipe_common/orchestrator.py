@@ -0,0 +1,239 @@
+"""Runs several site scrapers concurrently in one process.
+
+Every site crawls through one shared FetchEngine, where its host keeps its own in-flight
+window, request rate and headers. The pages are extracted in one shared worker pool and
+written to one output file, so the total wall time approaches that of the slowest site
+instead of the sum of all of them. The pool is one of worker processes (recipe_common.pipeline),
+so extraction uses every core while the event loop fetches; --threads uses threads instead:
+
+    python -m recipe_common.orchestrator --output recipes.jsonl
+    python -m recipe_common.orchestrator --sites addapinch jamieoliver --cache-dir http_cache/all
+    python -m recipe_common.orchestrator --archive warc/all   # keep every raw page (recipe_common.archive)
+    python -m recipe_common.orchestrator --workers 8 --output recipes.jsonl
+    python -m recipe_common.orchestrator --redrive --output redriven.jsonl
+    python -m recipe_common.orchestrator --metrics-port 9108 --metrics-file metrics.json
+    python -m recipe_common.orchestrator --replay http://127.0.0.1:8800   # against recipe_common.replay
+    python -m recipe_common.orchestrator --reextract --archive warc/all --output fresh.jsonl   # no crawling
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recipe_common.archive import WarcArchive
+from recipe_common.cache import ResponseCache
+from recipe_common.fetch import FetchEngine, run_sync
+from recipe_common.frontier import Frontier
+from recipe_common.metrics import METRICS, report, serve
+from recipe_common.pipeline import ParsePool, drain_parallel, first_seen
+from recipe_common.reextract import reextract_sites
+from recipe_common.registry import SITES, load_scripts
+from recipe_common.sink import open_sink
+from recipe_common.urls import BloomFilter
+
+
+class SiteSink:
+    """One site's view of the shared sink: adds a `site` column and drops that site's duplicates.
+
+    Each site deduplicates on its own key fields (product_name/product_url,
+    title/url, ...), which the shared sink cannot do for all of them at once.
+    """
+
+    def __init__(self, sink, site):
+        self.sink = sink
+        self.site = site
+        self.count = 0
+        self._seen = set()
+
+    def write(self, record):
+        key = hash(tuple(str(record.get(field)) for field in self.site.key_fields))
+        if key in self._seen:
+            self.sink.duplicates += 1
+            return False
+        self._seen.add(key)
+        self.sink.write({"site": self.site.name, **record})
+        self.count += 1
+        return True
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+
+
+async def crawl_site(engine, site, frontier, sink, pool, discovery="category", since=None):
+    if discovery is None:
+        pass  # only the URLs already queued, e.g. redriven dead letters
+    elif site.sitemap:
+        await site.discover(engine, frontier, discovery=discovery, since=since)
+    else:
+        await site.discover(engine, frontier)
+    # Repeated titles are dropped here; the workers do not share the titles they have seen
+    keep = first_seen(site.unique_field) if site.unique_field else None
+    await drain_parallel(engine, frontier, site.extract, pool, sink, keep=keep, site=site.name)
+
+
+async def crawl_sites(sites, frontiers, sinks, workers=None, processes=True, max_pending=None, discovery="category",
+                      since=None, metrics_port=None, metrics_file=None, metrics_interval=10.0, **engine_options):
+    """Crawls all `sites` at once; returns {site name: exception} for the ones that failed.
+
+    With `metrics_port` the metrics are served for Prometheus while the crawl runs, and
+    with `metrics_file` a JSON snapshot of them is rewritten every `metrics_interval` seconds.
+    """
+    runner = await serve(METRICS, metrics_port) if metrics_port else None
+    reporter = asyncio.ensure_future(report(METRICS, metrics_file, metrics_interval)) if metrics_file else None
+    try:
+        engine_options.setdefault("max_concurrency", sum(site.per_host_concurrency for site in sites))
+        engine = FetchEngine(host_rates={site.host: site.per_host_rate for site in sites},
+                             host_concurrency={site.host: site.per_host_concurrency for site in sites},
+                             host_headers={site.host: site.headers for site in sites if site.headers},
+                             **engine_options)
+        with ParsePool(workers, max_pending=max_pending, processes=processes) as pool:
+            async with engine:
+                results = await asyncio.gather(
+                    *(crawl_site(engine, site, frontiers[site.name], sinks[site.name], pool,
+                                 discovery=discovery, since=since) for site in sites),
+                    return_exceptions=True)
+                for host, stats in sorted(engine.host_stats().items()):
+                    print(f"{host}: {stats['rate']:g} req/s at the end, {stats['backoffs']} backoffs, "
+                          f"{stats['retries']} retries, circuit {stats['circuit']} after {stats['trips']} trips"
+                          + (f", Crawl-delay {stats['crawl_delay']:g} s" if stats["crawl_delay"] else ""))
+        print(f"\nTime per stage:\n{METRICS.summary()}")
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+            METRICS.write_snapshot(metrics_file)
+        if runner is not None:
+            await runner.cleanup()
+    return {site.name: result for site, result in zip(sites, results) if isinstance(result, BaseException)}
+
+
+def select_sites(names, output_file):
+    load_scripts()
+    unknown = sorted(set(names or ()) - set(SITES))
+    if unknown:
+        raise ValueError(f"Unknown site(s) {', '.join(unknown)}; registered: {', '.join(sorted(SITES))}")
+    sites = [SITES[name] for name in (names or sorted(SITES))]
+    if len(sites) > 1 and not output_file.lower().endswith(".jsonl"):
+        raise ValueError("Several sites have different columns; write them to a .jsonl file")
+    return sites
+
+
+def run_sites(names=None, output_file="recipes.jsonl", frontier_dir=".", workers=None, processes=True,
+              max_pending=None, discovery="category", since=None, bloom_capacity=None, redrive=None, metrics_port=None,
+              metrics_file=None, **engine_options):
+    """Scrapes the named sites (default: every registered one) into one output file.
+
+    Each site keeps its progress in <frontier_dir>/<site>_frontier.sqlite, the same file its
+    own script uses, so an interrupted run resumes per site. The sites' columns differ, so
+    mixing several of them needs JSON Lines output (CSV and Parquet take their columns
+    from the first record). `workers` sizes the extraction pool (default: one per CPU core),
+    which is one of processes unless processes=False, and `max_pending` bounds the pages
+    waiting for it (see recipe_common.pipeline.ParsePool); discovery="sitemap" and `since`
+    apply to the sites that support sitemap discovery. Each frontier deduplicates
+    URLs in its SQLite table; with `bloom_capacity` (the URLs expected per site) a Bloom
+    filter of that size also drops repeated links before they reach it.
+
+    With `redrive` (an error substring, "" for all) nothing is discovered: the sites'
+    dead letters whose error matches are queued again and only those are fetched.
+    `metrics_port` and `metrics_file` expose the crawl's metrics (see crawl_sites).
+    """
+    sites = select_sites(names, output_file)
+    frontiers = {site.name: Frontier(os.path.join(frontier_dir, f"{site.name}_frontier.sqlite"),
+                                     seen=BloomFilter(bloom_capacity) if bloom_capacity else None)
+                 for site in sites}
+    if redrive is not None:
+        discovery = None
+        for site in sites:
+            print(f"{site.name}: redriving {frontiers[site.name].redrive(redrive)} dead letters")
+    with open_sink(output_file) as sink:
+        sinks = {site.name: SiteSink(sink, site) for site in sites}
+        for site in sites:
+            # Recipes scraped by an interrupted run go out first
+            sinks[site.name].write_all(frontiers[site.name].records())
+        failed = run_sync(crawl_sites(sites, frontiers, sinks, workers=workers, processes=processes,
+                                      max_pending=max_pending, discovery=discovery, since=since,
+                                      metrics_port=metrics_port, metrics_file=metrics_file, **engine_options))
+
+    for site in sites:
+        frontier = frontiers[site.name]
+        if site.name in failed:
+            # Left unfinished, so the next run resumes this site
+            print(f"❌ {site.name} failed: {failed[site.name]!r}")
+        else:
+            frontier.finish()
+        print(f"{site.name}: {sinks[site.name].count} recipes, frontier {frontier.counts()}, "
+              f"{frontier.dead_letter_count()} dead letters")
+        frontier.close()
+    print(f"\n✅ Saved {sink.count} recipes from {len(sites) - len(failed)} of {len(sites)} sites to {output_file}")
+    return failed
+
+
+def reextract(names=None, archive_dir="warc", output_file="recipes.jsonl", workers=None, batch_size=64):
+    """Rebuilds the named sites' records from the pages archived in `archive_dir`, fetching nothing.
+
+    The output is written as run_sites() writes it; the sites whose crawls did not write
+    to this archive have no pages in it and are reported as such (see recipe_common.reextract).
+    """
+    sites = select_sites(names, output_file)
+    with open_sink(output_file) as sink:
+        sinks = {site.name: SiteSink(sink, site) for site in sites}
+        start = time.perf_counter()
+        reextract_sites(sites, archive_dir, sinks, workers=workers, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+    print(f"\n✅ Saved {sink.count} recipes to {output_file} in {elapsed:.1f} s, {sink.count / elapsed:.0f} records/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", nargs="+", help="site names (default: all registered sites)")
+    parser.add_argument("--output", default="recipes.jsonl")
+    parser.add_argument("--frontier-dir", default=".")
+    parser.add_argument("--workers", type=int, help="extraction threads or processes (default: one per CPU core)")
+    parser.add_argument("--threads", action="store_true", help="extract in threads instead of worker processes")
+    parser.add_argument("--max-pending", type=int, help="pages waiting for extraction (default: two per worker)")
+    parser.add_argument("--discovery", choices=("category", "sitemap"), default="category")
+    parser.add_argument("--bloom", type=int, metavar="URLS",
+                        help="also drop repeated links with a Bloom filter sized for this many URLs per site")
+    parser.add_argument("--cache-dir", help="shared response cache (e.g. http_cache/all)")
+    parser.add_argument("--archive", metavar="DIR", help="also write every response to a WARC archive here")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port during the crawl")
+    parser.add_argument("--metrics-file", help="rewrite a JSON snapshot of the metrics here every 10 s")
+    parser.add_argument("--redrive", nargs="?", const="", metavar="ERROR",
+                        help="only fetch the dead letters again (those whose error contains ERROR)")
+    parser.add_argument("--replay", metavar="URL", help="send every request to this recipe_common.replay server")
+    parser.add_argument("--reextract", action="store_true",
+                        help="fetch nothing; run the extractors again over the pages in --archive")
+    parser.add_argument("--list", action="store_true", help="list the registered sites and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.list:
+        for name, site in sorted(load_scripts().items()):
+            print(f"{name:<16} {site.host:<28} {site.per_host_concurrency} in flight, {site.per_host_rate:g} req/s")
+        return
+    if args.reextract:
+        if not args.archive:
+            parser.error("--reextract needs the --archive the pages were written to")
+        reextract(args.sites, args.archive, args.output, workers=args.workers)
+        return
+    cache = ResponseCache(args.cache_dir) if args.cache_dir else None
+    archive = WarcArchive(args.archive) if args.archive else None
+    failed = run_sites(args.sites, output_file=args.output, frontier_dir=args.frontier_dir, workers=args.workers,
+                       processes=not args.threads, max_pending=args.max_pending, discovery=args.discovery, bloom_capacity=args.bloom,
+                       redrive=args.redrive, metrics_port=args.metrics_port, metrics_file=args.metrics_file,
+                       cache=cache, replay=args.replay, archive=archive)
+    if cache is not None:
+        print(f"HTTP cache: {cache.stats()}")
+        cache.close()
+    if archive is not None:
+        print(f"Raw page archive: {archive.stats()}")
+        archive.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import logging
+import re
+from urllib.parse import urljoin
+
+from recipe_common.parsing import make_soup
+from recipe_common.urls import canonical_url
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = "PAGENUMBER"
+
+
+def page_pattern(page_url):
+    """Regex matching the canonical URLs of `page_url` ("…/page/{page}/"), capturing the number."""
+    url = re.escape(canonical_url(page_url.format(page=PLACEHOLDER)).rstrip("/"))
+    return re.compile(url.replace(PLACEHOLDER, r"(\d+)") + "/?")
+
+
+def last_page_number(soup, pattern, base_url):
+    """The highest page number linked from the page (its pagination nav), or None without any."""
+    numbers = []
+    for link in soup.find_all("a", href=True):
+        match = pattern.fullmatch(canonical_url(urljoin(base_url, link["href"])))
+        if match:
+            numbers.append(int(match.group(1)))
+    return max(numbers) if numbers else None
+
+
+async def paginate(engine, first_url, page_url, extract_links, max_pages=500):
+    """Yields (page number, links) for every page of a paginated listing, as each page arrives.
+
+    `page_url` is the URL of page 2 onwards with a {page} placeholder, e.g.
+    f"{category_url}/page/{{page}}/", and `extract_links(soup)` returns the links wanted
+    from one listing page. The first page's pagination nav says how many pages there
+    are, and all of them are then fetched at once, within the engine's per-host budget,
+    instead of one after another. Without a nav, or with one that only shows the pages
+    nearby ("1 2 3 … Next"), the last page is found by probing exponentially further
+    pages and bisecting. A page past the end is one that fails or has no links besides
+    those the first page has too (menus, sidebars).
+    """
+    pattern = page_pattern(page_url)
+    response = await engine.fetch_or_error(first_url)
+    if response.status != 200:
+        print(f"Failed to fetch {first_url}. Stopping pagination.")
+        return
+    soup = make_soup(response.text)
+    links = extract_links(soup)
+    yield 1, links
+    first_links = set(links)
+    done = {1}
+
+    last = last_page_number(soup, pattern, first_url)
+    start = 1 if last is None else None
+    while True:
+        if start is not None:
+            probed = {}
+            last = await probe_last_page(engine, page_url, extract_links, first_links, probed, start, max_pages)
+            for page, links in sorted(probed.items()):
+                if links is not None:
+                    yield page, links
+            done.update(probed)
+
+        pages = {page_url.format(page=page): page for page in range(2, min(last, max_pages) + 1) if page not in done}
+        if pages:
+            logger.debug("Fetching %d listing pages of %s at once", len(pages), first_url)
+        furthest = last
+        async for response in engine.fetch_all(pages):
+            page = pages[response.url]
+            done.add(page)
+            if response.status != 200:
+                logger.debug("Failed to fetch %s", response.url)
+                continue
+            soup = make_soup(response.text)
+            yield page, extract_links(soup)
+            furthest = max(furthest, last_page_number(soup, pattern, first_url) or 0)
+        if furthest <= last:
+            return
+        # The nav only links the pages nearby; look for the end beyond the furthest one
+        start = furthest
+
+
+async def probe_last_page(engine, page_url, extract_links, first_links, probed, start=1, max_pages=500):
+    """The last page of a listing, given that page `start` exists, in about 2·log2(pages) requests.
+
+    Probes pages 2·start, 4·start, … until one is past the end, then bisects. Fills
+    `probed` with page number -> links (None past the end), so those pages are not
+    fetched again.
+    """
+    async def exists(page):
+        response = await engine.fetch_or_error(page_url.format(page=page))
+        links = extract_links(make_soup(response.text)) if response.status == 200 else []
+        probed[page] = links if set(links) - first_links else None
+        return probed[page] is not None
+
+    found, missing = start, None
+    page = max(2, 2 * start)
+    while page <= max_pages:
+        if not await exists(page):
+            missing = page
+            break
+        found, page = page, page * 2
+    if missing is None:
+        return min(found, max_pages)
+    while missing - found > 1:
+        middle = (found + missing) // 2
+        if await exists(middle):
+            found = middle
+        else:
+            missing = middle
+    return found
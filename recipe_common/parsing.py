@@ -0,0 +1,301 @@
+import os
+import re
+import threading
+import time
+
+from bs4 import BeautifulSoup
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # selectolax is optional; BeautifulSoup backends still work
+    LexborHTMLParser = None
+
+try:
+    import lxml  # noqa: F401  (only checked for availability; BeautifulSoup loads it)
+    HAVE_LXML = True
+except ImportError:
+    HAVE_LXML = False
+
+PARSERS = ("html.parser", "lxml", "selectolax")
+
+
+def available_parsers():
+    return [name for name in PARSERS
+            if name == "html.parser" or (name == "lxml" and HAVE_LXML)
+            or (name == "selectolax" and LexborHTMLParser is not None)]
+
+
+# html.parser unless RECIPE_PARSER (or set_default_parser(), or a parser= argument) picks another backend
+DEFAULT_PARSER = os.environ.get("RECIPE_PARSER") or "html.parser"
+
+
+def set_default_parser(parser):
+    global DEFAULT_PARSER
+    if parser not in available_parsers():
+        raise ValueError(f"Parser {parser!r} is not available; installed: {', '.join(available_parsers())}")
+    DEFAULT_PARSER = parser
+
+
+# Seconds each thread has spent in make_soup, so recipe_common.metrics can tell parsing from extracting
+_parse_clock = threading.local()
+
+
+def parse_seconds():
+    return getattr(_parse_clock, "seconds", 0.0)
+
+
+def make_soup(markup, parser=None):
+    """Parses HTML with the chosen backend ("html.parser", "lxml" or "selectolax").
+
+    All backends return an object with the subset of the BeautifulSoup API the scrapers
+    use (find, find_all, select, select_one, get_text, .text, attribute access), so an
+    extractor gives the same output whichever backend parsed the page.
+    """
+    parser = parser or DEFAULT_PARSER
+    start = time.perf_counter()
+    if parser == "selectolax":
+        if isinstance(markup, bytes):
+            markup = markup.decode("utf-8", errors="replace")
+        soup = FastSoup(LexborHTMLParser(markup))
+    else:
+        soup = BeautifulSoup(markup, parser)
+    _parse_clock.seconds = parse_seconds() + time.perf_counter() - start
+    return soup
+
+
+# Attributes BeautifulSoup treats as space-separated lists
+MULTI_VALUED = {"class", "rel", "rev", "accesskey", "headers", "accept-charset", "archive", "sizes", "sandbox"}
+
+# Text inside these elements is not part of get_text() in BeautifulSoup either
+NON_TEXT_PARENTS = {"script", "style", "template"}
+
+
+def _css_string(value):
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _compile(name, attrs, kwargs):
+    """Turns find()/find_all() arguments into a CSS selector plus Python checks CSS cannot express."""
+    conditions = dict(attrs if isinstance(attrs, dict) else {"class": attrs} if attrs else {})
+    for key, value in kwargs.items():
+        conditions["class" if key == "class_" else key] = value
+
+    selector = name or "*"
+    checks = []
+    for attr, wanted in conditions.items():
+        if wanted is True:
+            selector += f"[{attr}]"
+        elif wanted is None or wanted is False:
+            checks.append(lambda node, attr=attr: attr not in node.attributes)
+        elif isinstance(wanted, str):
+            if attr in MULTI_VALUED and len(wanted.split()) != 1:
+                # "a b" matches the whole (normalised) attribute value, as in BeautifulSoup
+                selector += f"[{attr}]"
+                checks.append(lambda node, attr=attr, wanted=" ".join(wanted.split()):
+                              " ".join((node.attributes.get(attr) or "").split()) == wanted)
+            elif attr in MULTI_VALUED:
+                selector += f"[{attr}~={_css_string(wanted)}]"
+            else:
+                selector += f"[{attr}={_css_string(wanted)}]"
+        elif isinstance(wanted, re.Pattern):
+            selector += f"[{attr}]"
+            checks.append(lambda node, attr=attr, wanted=wanted: _pattern_matches(
+                wanted, node.attributes.get(attr) or "", attr in MULTI_VALUED))
+        else:
+            raise TypeError(f"Unsupported filter for {attr!r}: {wanted!r}")
+    return selector, checks
+
+
+def _pattern_matches(pattern, value, multi_valued):
+    if pattern.search(value):
+        return True
+    return multi_valued and any(pattern.search(token) for token in value.split())
+
+
+def _in_document_order(root, selector):
+    matches = root.css(selector)
+    if "," not in selector:
+        return iter(matches)
+    # A selector list is matched one selector at a time, which can repeat nodes and break
+    # document order; BeautifulSoup returns each node once, in order
+    wanted = {node.mem_id for node in matches}
+    return (node for node in root.traverse() if node.mem_id in wanted)
+
+
+class FastTag:
+    """BeautifulSoup-compatible view of a selectolax (lexbor) node."""
+
+    __slots__ = ("node",)
+
+    def __init__(self, node):
+        self.node = node
+
+    @property
+    def name(self):
+        return self.node.tag
+
+    @property
+    def attrs(self):
+        # Valueless attributes (<input checked>) come back as None from lexbor and "" from BeautifulSoup
+        return {key: (value or "").split() if key in MULTI_VALUED else value or ""
+                for key, value in self.node.attributes.items()}
+
+    @property
+    def parent(self):
+        parent = self.node.parent
+        return FastTag(parent) if parent is not None and parent.tag != "-document" else None
+
+    def _matches(self, selector):
+        # lexbor also matches the node itself; BeautifulSoup only searches descendants
+        own = self.node.mem_id
+        return (node for node in _in_document_order(self.node, selector) if node.mem_id != own)
+
+    def find_all(self, name=None, attrs=None, limit=None, **kwargs):
+        selector, checks = _compile(name, attrs, kwargs)
+        found = []
+        for node in self._matches(selector):
+            if all(check(node) for check in checks):
+                found.append(FastTag(node))
+                if limit and len(found) >= limit:
+                    break
+        return found
+
+    def find(self, name=None, attrs=None, **kwargs):
+        found = self.find_all(name, attrs, limit=1, **kwargs)
+        return found[0] if found else None
+
+    def select(self, selector):
+        return [FastTag(node) for node in self._matches(selector)]
+
+    def select_one(self, selector):
+        return next((FastTag(node) for node in self._matches(selector)), None)
+
+    def get_text(self, separator="", strip=False):
+        parts = []
+        for node in self.node.traverse(include_text=True):
+            if node.tag != "-text" or node.parent.tag in NON_TEXT_PARENTS:
+                continue
+            text = node.text_content
+            if strip:
+                text = text.strip()
+                if not text:
+                    continue
+            parts.append(text)
+        return separator.join(parts)
+
+    @property
+    def text(self):
+        return self.get_text()
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+    def has_attr(self, key):
+        return key in self.node.attributes
+
+    def __getitem__(self, key):
+        return self.attrs[key]
+
+    def __setitem__(self, key, value):
+        self.node.attrs[key] = value
+
+    def __contains__(self, key):
+        return self.has_attr(key)
+
+    def __repr__(self):
+        return self.node.html
+
+
+class FastSoup(FastTag):
+    """The parsed document; unlike a tag, it searches from (and including) <html>."""
+
+    __slots__ = ("tree",)
+
+    def __init__(self, tree):
+        super().__init__(tree.root)
+        self.tree = tree  # keeps the lexbor document alive
+
+    def _matches(self, selector):
+        return _in_document_order(self.tree.root, selector)
+
+
+# Partial parsing: only the recipe card (and a few other elements) of a page is parsed
+
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+ATTRIBUTE = re.compile(r"""([^\s"'>/=]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""")
+HEAD = re.compile(r"<head\b.*?</head\s*>", re.S | re.I)
+
+
+def _attrs_match(opening_tag, attrs):
+    found = {}
+    for name, double, single, bare in ATTRIBUTE.findall(opening_tag):
+        found[name.lower()] = double or single or bare
+    for attr, wanted in attrs.items():
+        value = found.get(attr)
+        if value is None:
+            return False
+        if attr in MULTI_VALUED and len(wanted.split()) == 1:
+            if wanted not in value.split():
+                return False
+        elif " ".join(value.split()) != " ".join(wanted.split()):
+            return False
+    return True
+
+
+def _element_end(html, tag, pos):
+    """End offset of the element whose opening tag ends at `pos`, counting nested same-name tags."""
+    depth = 1
+    for match in re.compile(rf"<(/?){tag}\b[^>]*>", re.I).finditer(html, pos):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return match.end()
+    return None
+
+
+def element_spans(html, tag, attrs=None):
+    """Yields (start, end) offsets of every <tag> element whose attributes match `attrs` (find_all rules)."""
+    # Cheap substring test first; most tags on a page fail it without parsing their attributes
+    needles = [wanted.split()[0] for wanted in (attrs or {}).values() if wanted.split()]
+    for match in re.compile(rf"<{tag}\b[^>]*>", re.I).finditer(html):
+        opening_tag = match.group(0)
+        if any(needle not in opening_tag for needle in needles) or not _attrs_match(opening_tag, attrs or {}):
+            continue
+        end = match.end() if tag in VOID_ELEMENTS else _element_end(html, tag, match.end())
+        if end is not None:
+            yield match.start(), end
+
+
+def make_fragment_soup(html, elements, parser=None):
+    """Parses only `elements` and the <head> of a page.
+
+    Each entry is a (tag, attrs) pair, e.g. ("div", {"class": "wprm-recipe-container"}); every
+    matching element is cut out of the raw HTML, in page order, into a small document, so the
+    comments, ads and sidebars around them are never tokenised.
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    spans = []
+    for tag, attrs in elements:
+        spans.extend(element_spans(html, tag, attrs))
+
+    parts = []
+    covered = 0
+    for start, end in sorted(spans):
+        if start >= covered:  # skip elements nested in one already kept
+            parts.append(html[start:end])
+            covered = end
+    head = HEAD.search(html)
+    return make_soup(f"<html>{head.group(0) if head else ''}<body>{''.join(parts)}</body></html>", parser)
+
+
+def make_card_soup(html, card, keep=(), parser=None):
+    """Parses only the recipe card, the <head> and the `keep` elements instead of the whole page.
+
+    See make_fragment_soup; if the page has no card, the whole page is parsed so the
+    extractor still sees everything.
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    if next(element_spans(html, *card), None) is None:
+        return make_soup(html, parser)
+    return make_fragment_soup(html, [card, *keep], parser)
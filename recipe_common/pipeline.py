@@ -0,0 +1,206 @@
+"""Extraction in worker processes, decoupled from the network I/O.
+
+Parsing a recipe page is CPU-bound and, in one process, holds the GIL while the event loop
+should be fetching. Here the event loop only fetches: the raw bytes of each page go to a
+ProcessPoolExecutor, whose workers decode and parse them and run the site's extractor,
+and only the small record dict comes back. At most `max_pending` pages are queued for or
+inside the pool; when it is full the crawl stops taking pages from the fetcher, whose own
+in-flight window then stops new requests, so neither side piles pages up in memory:
+
+    with ParsePool(workers=8) as pool:
+        await drain_parallel(engine, frontier, extract, pool, sink)
+
+The site scripts run their crawls through drain_site(), which does this with a pool of
+their own; the orchestrator shares one pool between all the sites it crawls.
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from recipe_common import parsing
+from recipe_common.metrics import METRICS, Progress, timed_extract
+from recipe_common.registry import load_script
+
+logger = logging.getLogger(__name__)
+
+_scripts = {}  # script path -> module, loaded once per worker process
+
+
+class ScriptFunction:
+    """A picklable stand-in for a module-level function of a site script.
+
+    The scripts are loaded by path rather than imported, so pickle cannot find their
+    functions by module name; this sends the script path and the function name instead,
+    and each worker loads the script the first time it needs it.
+    """
+
+    def __init__(self, function):
+        self.path = os.path.abspath(inspect.getfile(function))
+        self.name = function.__name__
+
+    def __call__(self, *args):
+        module = _scripts.get(self.path)
+        if module is None:
+            module = _scripts[self.path] = load_script(self.path)
+        return getattr(module, self.name)(*args)
+
+    def __repr__(self):
+        return f"<ScriptFunction {self.name} from {os.path.basename(self.path)}>"
+
+
+def _start_worker(parser):
+    # A parser chosen with set_default_parser() in the parent applies in the workers too
+    parsing.set_default_parser(parser)
+
+
+def _extract_page(extract, url, body, encoding, category):
+    # Decoding happens here as well, so the parent only passes the bytes along; the
+    # timings go back with the record, since the worker's own metrics are not the parent's
+    return timed_extract(extract, url, body.decode(encoding or "utf-8", errors="replace"), category)
+
+
+class ParsePool:
+    """Worker pool for the extraction stage, with a bound on the pages waiting for it.
+
+    `workers` defaults to one per CPU core and `max_pending` to two per worker, enough to
+    keep every worker busy while the next pages arrive. The workers are started with
+    "spawn", so they do not inherit the event loop, open sockets or SQLite handles of the
+    crawl. With processes=False the same stage runs in threads instead (no pickling, but
+    the extractors then share the GIL with the event loop). Each page's parse and extract
+    times are recorded in `metrics` under the `site` it was submitted with.
+    """
+
+    def __init__(self, workers=None, max_pending=None, processes=True, parser=None, metrics=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or 2 * self.workers
+        self.processes = processes
+        self.metrics = metrics or METRICS
+        if processes:
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=_start_worker,
+                                                initargs=(parser or parsing.DEFAULT_PARSER,))
+        else:
+            self.executor = ThreadPoolExecutor(self.workers)
+        self._loop = None
+        self._slots = None
+        self._functions = {}  # extract function -> its picklable ScriptFunction
+
+    async def submit(self, extract, url, body, encoding=None, category=None, site=None):
+        """Queues one page once a slot is free; returns the future of extract(url, html, category)."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # The semaphore belongs to one event loop; the pool may outlive it
+            self._loop, self._slots = loop, asyncio.Semaphore(self.max_pending)
+        slots = self._slots
+        await slots.acquire()
+        if self.processes and not isinstance(extract, ScriptFunction):
+            if extract not in self._functions:
+                self._functions[extract] = ScriptFunction(extract)
+            extract = self._functions[extract]
+        timed = loop.run_in_executor(self.executor, _extract_page, extract, url, body, encoding, category)
+        future = loop.create_future()
+
+        def done(timed):
+            slots.release()
+            if timed.exception() is not None:
+                future.set_exception(timed.exception())
+                return
+            record, parse, work = timed.result()
+            self.metrics.stage("parse", parse, site=site or "")
+            self.metrics.stage("extract", work, site=site or "")
+            future.set_result(record)
+        timed.add_done_callback(done)
+        return future
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def drain_parallel(engine, frontier, extract, pool, sink=None, keep=None, site=None):
+    """frontier.drain() with the extraction in a ParsePool, several pages at a time.
+
+    `extract` must be a module-level function (of a site script or a module) for a process
+    pool. Records are stored and written in the order the workers finish them. State a
+    worker cannot share, such as the titles seen so far, goes in `keep(record)`, which runs
+    here; returning False skips the record, as an extractor returning None does. Metrics
+    and progress are reported as in frontier.drain().
+    """
+    metrics = engine.metrics
+    progress = Progress(site or frontier.path, frontier.pending_count())
+    in_flight = set()
+
+    def settle(url, name, future):
+        in_flight.discard(future)
+        try:
+            record = future.result()
+        except Exception as e:
+            logger.debug("Error scraping %s: %s", url, e)
+            frontier.mark_failed(url, e)
+            metrics.count("pages", site=name, outcome="failed")
+            progress.update(failed=True)
+            return
+        if record is not None and keep is not None and not keep(record):
+            record = None
+        frontier.mark_done(url, record)
+        metrics.count("pages", site=name, outcome="done" if record is not None else "skipped")
+        progress.update()
+        if record is not None and sink is not None:
+            with metrics.timer("write", site=name):
+                sink.write(record)
+
+    urls = (url for url, category in frontier.pending())
+    async for response in engine.fetch_all(urls):
+        name = site or urlsplit(response.url).netloc
+        if response.status != 200:
+            logger.debug("Failed to fetch %s", response.url)
+            frontier.mark_failed(response.url, response.error or f"HTTP {response.status}")
+            metrics.count("pages", site=name, outcome="failed")
+            progress.update(failed=True)
+            continue
+        category = frontier.category(response.url)
+        if engine.archive is not None:
+            engine.archive.label(response.url, name, category)  # as in frontier.drain()
+        # Waits while the pool is full, which is what holds the fetcher back
+        future = await pool.submit(extract, response.url, response.body, response.encoding, category, site=name)
+        in_flight.add(future)
+        future.add_done_callback(functools.partial(settle, response.url, name))
+    if in_flight:
+        await asyncio.wait(in_flight)
+    progress.report()
+
+
+def first_seen(field):
+    """A keep() for drain_parallel that skips records whose `field` an earlier record of the run had."""
+    seen = set()
+
+    def keep(record):
+        value = record.get(field)
+        if value in seen:
+            logger.debug("Skipping duplicate recipe: %s", value)
+            return False
+        seen.add(value)
+        return True
+    return keep
+
+
+async def drain_site(engine, frontier, extract, sink=None, site=None, unique_field=None, workers=None,
+                     processes=True, max_pending=None):
+    """drain_parallel() in a ParsePool of its own: how a site script extracts its pages.
+
+    The pool is of worker processes unless processes=False, in which case it is of threads.
+    Records whose `unique_field` an earlier record of the run had are skipped (first_seen()).
+    """
+    keep = first_seen(unique_field) if unique_field else None
+    with ParsePool(workers, max_pending=max_pending, processes=processes) as pool:
+        await drain_parallel(engine, frontier, extract, pool, sink, keep=keep, site=site)
@@ -0,0 +1,236 @@
+import re
+from itertools import chain
+
+from recipe_common.parsing import MULTI_VALUED, FastSoup, FastTag, _compile, _pattern_matches
+
+
+NO_FIELDS = ({}, ())
+
+
+class Field:
+    """One thing an extractor wants from the page, declared like a find() call.
+
+    `attrs` follows find_all(): a string matches one class token (or the whole value when
+    it has spaces), True means present, a compiled regex is searched. With `many`, every
+    match is kept, otherwise only the first. With `inside`, only elements inside the match
+    of that other field count (for a field with `many`, inside any of its matches), which
+    is how "div.a ul li" or soup.find(...).find(...) is written.
+    """
+
+    def __init__(self, tag=None, attrs=None, many=False, inside=None):
+        self.tag = tag
+        self.attrs = dict(attrs or {})
+        self.many = many
+        self.inside = inside
+
+
+class PlanMatches:
+    """What SelectorPlan.match() found: matches[name] is the first element (or None), or a list for `many` fields."""
+
+    def __init__(self, plan):
+        self._plan = plan
+        self._found = {name: [] for name in plan.fields}
+        self._ids = {name: set() for name in plan._containers}  # matches of the fields others are inside
+        self._containers = {}  # container element id -> {field: [elements]}
+
+    def _add(self, name, match, element):
+        self._found[name].append(match)
+        ids = self._ids.get(name)
+        # A single-match container only counts with its first match
+        if ids is not None and (self._plan.fields[name].many or not ids):
+            ids.add(element.mem_id if isinstance(match, FastTag) else id(element))
+
+    def __getitem__(self, name):
+        found = self._found[name]
+        if self._plan.fields[name].many:
+            return found
+        return found[0] if found else None
+
+    def inside(self, container, name):
+        """The matches of `name` inside `container` (an element matched by the field it is declared inside)."""
+        return self._containers.get(_identity(container), {}).get(name, [])
+
+    def first_inside(self, container, name):
+        found = self.inside(container, name)
+        return found[0] if found else None
+
+
+class SelectorPlan:
+    """A site's selectors, compiled once and matched against a parsed page in a single traversal.
+
+    Calling soup.find() once per field walks the tree once per field; match() walks it once
+    and tests each element only against the fields that want its tag name and class:
+
+        PLAN = SelectorPlan({"title": Field("h2", {"class": "tasty-recipes-title"}), ...})
+        found = PLAN.match(make_soup(html))
+        title = found["title"]
+
+    That is for the BeautifulSoup backends, whose tree walks run in Python. On selectolax
+    a walk driven from Python costs more than lexbor matching each field's precompiled CSS
+    selector natively, so there every field is one css() call, and fields declared `inside`
+    another only search within its matches.
+
+    `traversals` counts tree walks (css() calls on selectolax) and `visited` the elements
+    tested in Python; with `single_pass = False` every field gets its own walk, as separate
+    find() calls would, which the benchmarks use for comparison.
+    """
+
+    def __init__(self, fields):
+        self.fields = dict(fields)
+        order = list(self.fields)
+        for name, field in self.fields.items():
+            if field.inside is not None and order.index(field.inside) > order.index(name):
+                raise ValueError(f"Field {name!r} is declared before {field.inside!r}, which it is inside")
+        self._containers = {field.inside for field in self.fields.values() if field.inside is not None}
+        self._css = {}  # name -> (selector, selector from the document root, checks CSS cannot express)
+        for name, field in self.fields.items():
+            selector, checks = _compile(field.tag, field.attrs, {})
+            scoped = selector
+            if field.inside is not None:
+                # "div.a ul li": lexbor narrows the candidates to elements under a container
+                scoped = f"{self._css[field.inside][1]} {selector}"
+            self._css[name] = (selector, scoped, checks)
+        self.single_pass = True
+        self.traversals = 0
+        self.visited = 0
+
+    def match(self, soup):
+        found = PlanMatches(self)
+        if isinstance(soup, FastTag):
+            self._match_native(soup, found)
+        elif self.single_pass:
+            self._walk(soup, list(self.fields), found)
+        else:
+            for name in self.fields:
+                self._walk(soup, [name], found)
+        return found
+
+    def _match_native(self, soup, found):
+        top = soup.tree.root if isinstance(soup, FastSoup) else soup.node
+        own = None if isinstance(soup, FastSoup) else top.mem_id
+        for name, field in self.fields.items():
+            own_selector, selector, checks = self._css[name]
+            root = top
+            if field.inside is not None:
+                containers = found._found[field.inside]
+                if not containers:
+                    continue
+                if not self.fields[field.inside].many:
+                    # Only its subtree needs searching
+                    root = containers[0].node
+                    selector = own_selector
+            self.traversals += 1
+            for node in root.css(selector):
+                if node.mem_id == own or node.mem_id == root.mem_id:
+                    continue  # lexbor also matches the node it searches from
+                if not all(check(node) for check in checks):
+                    continue
+                if field.inside is None:
+                    found._add(name, FastTag(node), node)
+                    if not field.many:
+                        break
+                    continue
+                # With nested containers the element belongs to the nearest one
+                container = next((parent for parent in _parents(node, True) if parent in found._ids[field.inside]),
+                                 None)
+                if container is None:
+                    continue
+                within = found._containers.setdefault(container, {}).setdefault(name, [])
+                if within and not field.many:
+                    continue
+                match = FastTag(node)
+                within.append(match)
+                if field.many or not found._found[name]:
+                    found._add(name, match, node)
+
+    def _index(self, names):
+        """tag -> (fields wanting one of the element's class tokens, by token; fields to test regardless)."""
+        index = {}
+        for name in names:
+            field = self.fields[name]
+            by_class, others = index.setdefault(field.tag, ({}, []))
+            wanted = field.attrs.get("class")
+            if isinstance(wanted, str) and wanted.split():
+                by_class.setdefault(wanted.split()[0], []).append(name)
+            else:
+                others.append(name)
+        return index
+
+    def _walk(self, soup, names, found):
+        index = self._index(names)
+        any_tag = index.pop(None, None)  # fields declared without a tag name
+        done = set()  # single-match fields that cannot match again
+        self.traversals += 1
+        for element in soup.descendants:
+            if element.name is None:
+                continue  # text, comments
+            self.visited += 1
+            wanted = index.get(element.name)
+            if wanted is None and any_tag is None:
+                continue
+            attributes = element.attrs
+            classes = _soup_value(attributes, "class")
+            classes = classes.split() if classes else ()
+            for by_class, others in (wanted or NO_FIELDS, any_tag or NO_FIELDS):
+                for name in chain(others, *(by_class.get(token, ()) for token in classes)):
+                    if name not in done:
+                        self._consider(name, element, attributes, found, done)
+
+    def _consider(self, name, element, attributes, found, done):
+        field = self.fields[name]
+        if not all(_value_matches(attr, wanted, _soup_value(attributes, attr)) for attr, wanted in field.attrs.items()):
+            return
+        if field.inside is None:
+            found._add(name, element, element)
+            if not field.many:
+                done.add(name)
+            return
+        container = next((parent for parent in _parents(element, False) if parent in found._ids[field.inside]), None)
+        if container is None:
+            return
+        within = found._containers.setdefault(container, {}).setdefault(name, [])
+        if within and not field.many:
+            return
+        within.append(element)
+        if field.many or not found._found[name]:
+            found._add(name, element, element)
+        if not field.many and not self.fields[field.inside].many:
+            done.add(name)
+
+
+def _value_matches(attr, wanted, value):
+    if wanted is True:
+        return value is not None
+    if wanted is None or wanted is False:
+        return value is None
+    if value is None:
+        return False
+    if isinstance(wanted, re.Pattern):
+        return _pattern_matches(wanted, value, attr in MULTI_VALUED)
+    if attr in MULTI_VALUED:
+        tokens = wanted.split()
+        if len(tokens) == 1:
+            return tokens[0] in value.split()
+        return " ".join(value.split()) == " ".join(tokens)
+    return value == wanted
+
+
+def _soup_value(attributes, attr):
+    # BeautifulSoup keeps class, rel, ... as lists
+    value = attributes.get(attr)
+    return " ".join(value) if isinstance(value, list) else value
+
+
+def _identity(element):
+    return element.node.mem_id if isinstance(element, FastTag) else id(element)
+
+
+def _parents(element, lexbor):
+    if lexbor:
+        node = element.parent
+        while node is not None:
+            yield node.mem_id
+            node = node.parent
+    else:
+        for parent in element.parents:
+            yield id(parent)
@@ -0,0 +1,145 @@
+"""Rebuilds the sites' output from their archived pages instead of crawling them again.
+
+When a selector breaks or a field is added, every recipe page the crawl archived
+(recipe_common.archive; the crawl labels which pages were recipes and their category) is
+run through the site's registered extractor again, in worker processes, and written to
+a fresh output. The parent only reads the index and hands the workers batches of
+(file, offset, length) locations; each worker memory-maps the .warc.zst files and
+decompresses its own frames, so page bodies never go through a pipe:
+
+    python -m recipe_common.orchestrator --reextract --archive warc/addapinch --sites addapinch --output fresh.csv
+    python -m recipe_common.orchestrator --reextract --archive warc/all --workers 8 --output fresh.jsonl
+"""
+import mmap
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from recipe_common import parsing
+from recipe_common.archive import WarcArchive, parse_record, read_dictionary, zstandard
+from recipe_common.metrics import METRICS, Progress, timed_extract
+from recipe_common.pipeline import ScriptFunction, _start_worker, first_seen
+
+_files = {}  # archive file -> (open file, its mmap or None, decompressor), per worker process
+
+
+def _frame(directory, file, offset, length):
+    if file not in _files:
+        path = os.path.join(directory, file)
+        handle = open(path, "rb")
+        try:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):  # empty files and filesystems without mmap are read instead
+            mapped = None
+        _files[file] = (handle, mapped, zstandard.ZstdDecompressor(dict_data=read_dictionary(path)))
+    handle, mapped, decompressor = _files[file]
+    if mapped is not None:
+        return mapped[offset:offset + length], decompressor
+    handle.seek(offset)
+    return handle.read(length), decompressor
+
+
+def _extract_batch(extract, directory, batch):
+    """Runs in a worker: returns (url, record, error, parse seconds, extract seconds) per location."""
+    results = []
+    for url, category, file, offset, length, size in batch:
+        try:
+            frame, decompressor = _frame(directory, file, offset, length)
+            page = parse_record(decompressor.decompress(frame, max_output_size=size))
+            record, parse, work = timed_extract(extract, url, page.text, category or "")
+        except Exception as e:
+            results.append((url, None, f"{type(e).__name__}: {e}", 0.0, 0.0))
+            continue
+        results.append((url, record, None, parse, work))
+    return results
+
+
+def _batches(locations, size):
+    batch = []
+    for location in locations:
+        batch.append(location)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reextract_site(archive, site, sink, executor, workers, batch_size=64):
+    """Runs `site`'s extractor over its archived recipe pages; returns (records, skipped, failed).
+
+    Batches are handed out in archive order and their results taken back in the same
+    order, so the output (and which of two repeated titles is kept) does not depend on
+    which worker finished first. At most two batches per worker are outstanding.
+    """
+    total = archive.db.execute("SELECT COUNT(*) FROM labels WHERE site = ?", (site.name,)).fetchone()[0]
+    if not total:
+        print(f"{site.name}: no recipe pages in {archive.directory} (is it the archive of a crawl of this site?)")
+        return 0, 0, 0
+    extract = ScriptFunction(site.extract)
+    keep = first_seen(site.unique_field) if site.unique_field else None
+    progress = Progress(f"{site.name} (re-extracting)", total)
+    records = skipped = failed = 0
+    pending = deque()
+
+    def settle(future):
+        nonlocal records, skipped, failed
+        for url, record, error, parse, work in future.result():
+            if error is not None:
+                print(f"Error re-extracting {url}: {error}")
+                failed += 1
+                METRICS.count("pages", site=site.name, outcome="failed")
+                progress.update(failed=True)
+                continue
+            METRICS.stage("parse", parse, site=site.name)
+            METRICS.stage("extract", work, site=site.name)
+            if record is not None and keep is not None and not keep(record):
+                record = None
+            if record is not None:
+                with METRICS.timer("write", site=site.name):
+                    if sink.write(record) is False:  # a duplicate of the sink's key fields
+                        record = None
+            if record is None:
+                skipped += 1
+            else:
+                records += 1
+            METRICS.count("pages", site=site.name, outcome="done" if record is not None else "skipped")
+            progress.update()
+
+    for batch in _batches(archive.labelled(site.name), batch_size):
+        pending.append(executor.submit(_extract_batch, extract, archive.directory, batch))
+        if len(pending) >= 2 * workers:
+            settle(pending.popleft())
+    while pending:
+        settle(pending.popleft())
+    progress.report()
+    return records, skipped, failed
+
+
+def reextract_sites(sites, archive_dir, sinks, workers=None, batch_size=64, parser=None):
+    """Re-extracts every site in `sites` from the archive in `archive_dir` into sinks[site name].
+
+    Returns {site name: (records, skipped, failed)}. `workers` defaults to one process per
+    CPU core; `batch_size` pages go to a worker at a time.
+    """
+    if not os.path.exists(os.path.join(archive_dir, "index.sqlite")):
+        raise FileNotFoundError(f"No page archive in {archive_dir}")
+    workers = workers or os.cpu_count() or 1
+    archive = WarcArchive(archive_dir)
+    results = {}
+    try:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"), initializer=_start_worker,
+                                 initargs=(parser or parsing.DEFAULT_PARSER,)) as executor:
+            for site in sites:
+                start = time.perf_counter()
+                results[site.name] = reextract_site(archive, site, sinks[site.name], executor, workers, batch_size)
+                elapsed = time.perf_counter() - start
+                records, skipped, failed = results[site.name]
+                print(f"{site.name}: {records} records from {records + skipped + failed} pages in {elapsed:.1f} s, "
+                      f"{records / elapsed:.0f} records/s ({skipped} skipped, {failed} failed)")
+    finally:
+        archive.close()
+    print(f"\nTime per stage:\n{METRICS.summary()}")
+    return results
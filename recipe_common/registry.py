@@ -0,0 +1,72 @@
+import glob
+import importlib.util
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_FOLDERS = ("Type-1", "Type-2")
+
+SITES = {}
+_loaded = set()  # script paths already imported
+
+
+class Site:
+    """A scraper as its script registers it with register_site().
+
+    `discover(engine, frontier)` adds the site's recipe URLs to the frontier (when
+    `sitemap` is true it also takes discovery= and since=, as the WordPress scripts do).
+    `extract(url, html, category)` is a module-level function of the script without
+    per-run state, so it can also run in a worker process (recipe_common.pipeline); a
+    script that skips recipes whose title it has already seen declares that field as
+    `unique_field` and the caller drops them. Records are deduplicated on `key_fields`,
+    and `host` is crawled with its own in-flight window, request rate and headers.
+    """
+
+    def __init__(self, name, host, discover, extract, key_fields, unique_field=None, sitemap=False,
+                 per_host_concurrency=4, per_host_rate=1.0, headers=None):
+        self.name = name
+        self.host = host
+        self.discover = discover
+        self.extract = extract
+        self.key_fields = tuple(key_fields)
+        self.unique_field = unique_field
+        self.sitemap = sitemap
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_rate = per_host_rate
+        self.headers = dict(headers or {})
+
+    def __repr__(self):
+        return f"<Site {self.name} {self.host}>"
+
+
+def register_site(name, host, discover, extract, key_fields, **options):
+    """Adds a scraper to SITES; called at import time by each site script."""
+    SITES[name] = Site(name, host, discover, extract, key_fields, **options)
+    return SITES[name]
+
+
+def load_script(path):
+    """Imports a site script by path, as module site_<file name>."""
+    name = "site_" + os.path.splitext(os.path.basename(path))[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_scripts(root=ROOT, folders=SCRIPT_FOLDERS):
+    """Imports every site script under `folders` so they register themselves.
+
+    The scripts are files such as Type-1/15gram.py rather than modules of a package, so
+    they are loaded by path; one whose dependencies are not installed is reported and
+    skipped instead of stopping the others. Scripts already loaded are not run again.
+    """
+    for folder in folders:
+        for path in sorted(glob.glob(os.path.join(root, folder, "*.py"))):
+            if path in _loaded:
+                continue
+            _loaded.add(path)
+            try:
+                load_script(path)
+            except ImportError as e:
+                print(f"Skipping {os.path.relpath(path, root)}: {e}")
+    return SITES
@@ -0,0 +1,191 @@
+"""Thumbnail, medium and WebP renditions of the downloaded images, made in worker processes.
+
+The originals are often 2-4 MB, far more than the PIM shows. render_store() writes each
+configured Rendition of every recipe's image under `<folder>/<rendition name>/`, e.g.
+`recipe_images/thumbnail/<recipe>.jpg`. Each distinct image is decoded once, in a pool
+of processes, and all of its renditions are made from that one decode, largest first.
+A JPEG is decoded with Pillow's draft mode, which lets libjpeg scale it down by up to 8x
+while decoding (DCT scaling), so a 4000px original costs about as much to decode as the
+largest rendition; every image is then shrunk with Image.reduce() before the final
+resample. A rendition newer than its source is not made again, so a rerun after a
+download only renders the new images:
+
+    stats = render_store("recipe_images", DEFAULT_RENDITIONS, workers=8)
+
+Needs `pip install pillow`.
+"""
+import multiprocessing
+import os
+import shutil
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from recipe_common.imagestore import EXTENSIONS, ImageStore
+from recipe_common.metrics import Progress
+
+ORIENTATION = 0x0112  # EXIF tag
+
+
+class Rendition:
+    """One derived image: scaled to fit within `size` (width, height), saved as `format` at `quality`.
+
+    Images smaller than `size` are not scaled up. JPEG output is flattened onto white.
+    """
+
+    EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp", "AVIF": ".avif", "PNG": ".png"}
+
+    def __init__(self, name, size, format="JPEG", quality=85):
+        self.name = name
+        self.size = tuple(size)
+        self.format = format.upper()
+        self.quality = quality
+
+    @property
+    def extension(self):
+        return self.EXTENSIONS[self.format]
+
+    def __repr__(self):
+        return f"<Rendition {self.name} {self.size[0]}x{self.size[1]} {self.format}>"
+
+
+DEFAULT_RENDITIONS = [
+    Rendition("thumbnail", (320, 320), "JPEG", quality=80),
+    Rendition("medium", (1024, 1024), "JPEG", quality=85),
+    Rendition("webp", (1600, 1600), "WEBP", quality=80),
+]
+
+
+def render(source, outputs):
+    """Makes every (Rendition, path) of `outputs` from one decode of `source`; returns the bytes written.
+
+    Runs in a worker process. Each file is written next to its path and renamed into
+    place, so an interrupted run never leaves a truncated rendition that looks newer
+    than its source.
+    """
+    from PIL import Image, ImageOps
+
+    outputs = sorted(outputs, key=lambda output: output[0].size[0] * output[0].size[1], reverse=True)
+    largest = outputs[0][0].size
+    written = 0
+    with Image.open(source) as image:
+        # JPEG: decode at the smallest 1/2, 1/4 or 1/8 scale still at least as large as the largest
+        # rendition will be (draft() needs both sides, so the box is fitted to the image first)
+        if image.getexif().get(ORIENTATION) in (5, 6, 7, 8):
+            largest = largest[::-1]  # stored sideways; rotated after decoding
+        scale = min(1.0, largest[0] / image.width, largest[1] / image.height)
+        image.draft("RGB", (max(1, round(image.width * scale)), max(1, round(image.height * scale))))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("P", "PA", "LA"):
+            # Palette images would be resized with NEAREST, and alpha is only resampled right in RGBA
+            image = image.convert("RGBA" if image.mode != "P" or "transparency" in image.info else "RGB")
+        for rendition, path in outputs:
+            # reducing_gap: a cheap Image.reduce() box shrink first, down to 3x the target, then
+            # the Lanczos resample; each smaller rendition starts from the previous one
+            image.thumbnail(rendition.size, Image.LANCZOS, reducing_gap=3.0)
+            frame = image
+            if rendition.format == "JPEG" and frame.mode == "RGBA":
+                # JPEG has no alpha; without a background the transparent areas come out black
+                frame = Image.new("RGB", image.size, "white")
+                frame.paste(image, mask=image.getchannel("A"))
+            elif frame.mode not in ("RGB", "RGBA"):
+                frame = frame.convert("RGB")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = path + ".tmp"
+            options = {"optimize": True, "progressive": True} if rendition.format == "JPEG" else {}
+            frame.save(partial, rendition.format, quality=rendition.quality, **options)
+            os.replace(partial, path)
+            written += os.path.getsize(path)
+    return written
+
+
+def _render_task(task):
+    source, outputs = task
+    try:
+        return source, render(source, outputs), None
+    except Exception as e:  # a corrupt or unsupported image must not stop the pool
+        return source, 0, f"{type(e).__name__}: {e}"
+
+
+def is_fresh(path, source_mtime):
+    try:
+        return os.path.getmtime(path) >= source_mtime
+    except OSError:
+        return False
+
+
+def plan_renditions(images, folder, renditions):
+    """Splits (recipe filename, source path) pairs into render tasks and links.
+
+    Returns (tasks, links): a task is (source, [(Rendition, path)]) for the renditions of
+    a source that are missing or older than it, once per distinct source; a link is
+    (path of the rendered file, path of another recipe's file for the same source).
+    """
+    by_source = defaultdict(list)
+    for filename, source in images:
+        by_source[source].append(os.path.splitext(filename)[0])
+    tasks, links = [], []
+    for source, stems in by_source.items():
+        source_mtime = os.path.getmtime(source)
+        outputs = []
+        for rendition in renditions:
+            paths = [os.path.join(folder, rendition.name, stem + rendition.extension) for stem in stems]
+            if not is_fresh(paths[0], source_mtime):
+                outputs.append((rendition, paths[0]))
+            links.extend((paths[0], path) for path in paths[1:] if not is_fresh(path, source_mtime))
+        if outputs:
+            tasks.append((source, outputs))
+    return tasks, links
+
+
+def render_all(tasks, links, workers=None):
+    """Runs the render tasks in a spawn process pool, then makes the links; returns counts."""
+    stats = {"images": len(tasks), "rendered": 0, "failed": 0, "bytes": 0, "linked": 0}
+    failed = set()
+    if tasks:
+        workers = workers or os.cpu_count() or 1
+        progress = Progress("renditions", len(tasks), unit="images")
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            for source, written, error in executor.map(_render_task, tasks, chunksize=8):
+                if error:
+                    failed.add(source)
+                    print(f"Failed to render: {source} - {error}")
+                else:
+                    stats["rendered"] += 1
+                    stats["bytes"] += written
+                progress.update(failed=bool(error))
+        progress.report()
+        stats["failed"] = len(failed)
+    for rendered, path in links:
+        if os.path.exists(rendered):
+            _link(rendered, path)
+            stats["linked"] += 1
+    return stats
+
+
+def render_store(folder, renditions=DEFAULT_RENDITIONS, workers=None):
+    """Makes the renditions of every recipe in the ImageStore in `folder`, each distinct blob decoded once."""
+    from recipe_common.images import image_filename
+
+    store = ImageStore(folder)
+    try:
+        images = [(image_filename(recipe), path) for recipe, url, digest, fmt, size, path in store.manifest()]
+    finally:
+        store.close()
+    return render_all(*plan_renditions(images, folder, renditions), workers=workers)
+
+
+def render_folder(source_folder, output_folder, renditions=DEFAULT_RENDITIONS, workers=None):
+    """Makes the renditions of every image file directly in `source_folder` (e.g. one saved before the store)."""
+    extensions = set(EXTENSIONS.values()) | {".jpeg"}
+    images = [(name, os.path.join(source_folder, name)) for name in sorted(os.listdir(source_folder))
+              if os.path.splitext(name)[1].lower() in extensions and os.path.isfile(os.path.join(source_folder, name))]
+    return render_all(*plan_renditions(images, output_folder, renditions), workers=workers)
+
+
+def _link(source, path):
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        os.link(source, path)
+    except OSError:
+        shutil.copyfile(source, path)
@@ -0,0 +1,285 @@
+"""A local stand-in for the recipe sites, to load-test whole crawls without touching them.
+
+Serves the saved snapshots of each site's category listing and recipe page
+(benchmarks/fixtures by default) for every URL of the site's hosts, fanned out to as
+many recipes as asked for. Each listing a script asks for gets `per_listing` recipes of
+its own, over as many pages as the snapshot's recipe links make necessary, with a
+pagination nav to the last one. Each recipe link on those pages is a distinct URL,
+served as the recipe snapshot under its own title, so nothing is dropped as a duplicate.
+Latency, 503s and 429s are injected at the configured rates.
+
+    python -m recipe_common.replay --port 8800 --per-listing 2000 --latency 0.05 --error-rate 0.01
+    python -m recipe_common.orchestrator --replay http://127.0.0.1:8800 --output replayed.jsonl
+
+With FetchEngine(replay=...) a request for https://<host>/<path> goes to
+<replay>/<host>/<path>. benchmarks/bench_load.py runs both and reports the throughput,
+latency percentiles and peak memory of the crawl.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from aiohttp import web
+
+from recipe_common.pagination import page_pattern
+from recipe_common.urls import canonical_url, url_key
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures")
+HREF = re.compile(r"""href=(["'])(.*?)\1""", re.S)
+RECIPE_ID = re.compile(r"-r(\d+)/?$")
+LISTING_PAGE = re.compile(r"/page/(\d+)/?$")
+QUERY_PAGE = re.compile(r"(?:^|&)page=(\d+)")
+
+
+def recipe_variant(link, recipe_id):
+    """`link` with -r<recipe_id> appended to its last path segment: one more distinct recipe URL."""
+    parts = urlsplit(link)
+    path = parts.path.rstrip("/") or "/recipe"
+    slash = "/" if parts.path.endswith("/") else ""
+    return urlunsplit(parts._replace(path=f"{path}-r{recipe_id}{slash}"))
+
+
+def split_listing_url(url):
+    """(the listing's URL without the page part, page number) for /page/N/ and ?page=N URLs."""
+    parts = urlsplit(url)
+    match = LISTING_PAGE.search(parts.path)
+    if match:
+        return urlunsplit(parts._replace(path=parts.path[:match.start()] + "/")), int(match.group(1))
+    match = QUERY_PAGE.search(parts.query)
+    if match:
+        query = "&".join(param for param in parts.query.split("&") if not param.startswith("page="))
+        return urlunsplit(parts._replace(query=query)), int(match.group(1))
+    return url, 1
+
+
+def page_url(listing_url, page, style):
+    if style == "query":
+        return f"{listing_url}{'&' if '?' in listing_url else '?'}page={page}"
+    return f"{listing_url.rstrip('/')}/page/{page}/"
+
+
+class ReplaySite:
+    """One site's snapshots: a listing page, whose `recipe_links` are fanned out, and a recipe page.
+
+    The recipe's `title` is numbered on every copy of the recipe page, so each copy is a
+    recipe of its own for the scripts that skip repeated titles. A site whose discovery
+    starts from an index of its categories (Jamie Oliver) also has an `index_html`,
+    served as it is at `index_url`; every other URL that is not a recipe is a listing.
+    """
+
+    def __init__(self, name, listing_url, listing_html, recipe_links, recipe_html, title=None, index_url=None,
+                 index_html=None):
+        self.name = name
+        links = {canonical_url(link) for link in recipe_links}
+        self.hosts = {urlsplit(listing_url).netloc, *(urlsplit(link).netloc for link in recipe_links)}
+        self.index_key = url_key(index_url) if index_url else None
+        self.index_html = index_html
+        self.recipe_parts = recipe_html.split(title) if title else [recipe_html]
+        self.title = title
+        self.listings = {}  # url_key of a listing -> its index, in the order they were first asked for
+
+        # The listing as text between href values: a slot number for each recipe link
+        patterns = {style: page_pattern(page_url(listing_url, "{page}", style)) for style in ("path", "query")}
+        self.style = None
+        self.parts = []
+        self.links = []  # slot -> the recipe link it replaces
+        slots = {}
+        last = 0
+        for match in HREF.finditer(listing_html):
+            href = canonical_url(urljoin(listing_url, match.group(2)))
+            style = next((style for style, pattern in patterns.items() if pattern.fullmatch(href)), None)
+            if href not in links and style is None:
+                continue
+            self.parts.append(listing_html[last:match.start()])
+            if style is not None:
+                # The snapshot's own pagination nav; each listing gets one of its own
+                self.style = style
+                self.parts.append('href="#"')
+            else:
+                if href not in slots:
+                    slots[href] = len(self.links)
+                    self.links.append(urljoin(listing_url, match.group(2)))
+                self.parts.append(slots[href])
+            last = match.end()
+        self.parts.append(listing_html[last:])
+
+    def recipe(self, recipe_id):
+        if self.title is None:
+            return self.recipe_parts[0]
+        return f"{self.title} {recipe_id}".join(self.recipe_parts)
+
+    def is_index(self, url):
+        return self.index_key is not None and url_key(url) == self.index_key
+
+    def listing(self, listing_url, page, per_listing, max_recipes=None):
+        """Page `page` of the listing at `listing_url`, or None past its last page."""
+        index = self.listings.setdefault(url_key(listing_url), len(self.listings))
+        first = index * per_listing
+        count = per_listing if max_recipes is None else max(0, min(per_listing, max_recipes - first))
+        per_page = max(1, len(self.links))
+        pages = max(1, math.ceil(count / per_page))
+        if page > pages:
+            return None
+        offset = (page - 1) * per_page
+        # Slots past the listing's last recipe link to it again, which the scripts deduplicate
+        last = min(count - 1 - offset, len(self.links) - 1)
+        hrefs = [recipe_variant(self.links[min(slot, last)], first + offset + min(slot, last))
+                 for slot in range(len(self.links))] if count else []
+        html = "".join(part if isinstance(part, str) else f'href="{hrefs[part]}"' if hrefs else 'href="#"'
+                       for part in self.parts)
+        if pages > 1 and self.style is not None:
+            nav = f'<nav class="pagination"><a href="{page_url(listing_url, pages, self.style)}">{pages}</a></nav>'
+            html = html.replace("</body>", nav + "</body>", 1) if "</body>" in html else html + nav
+        return html
+
+
+def load_fixtures(directory=FIXTURES):
+    """ReplaySites from saved pages laid out as benchmarks/fixtures.
+
+    manifest.json gives each site's listing and recipe URL (and index URL, if any);
+    <site>/listing.html, recipe.html and index.html are the pages, and <site>/golden.json
+    the links the site's script finds on the listing (recipe_links_on_page or
+    article_links) and the recipe record, whose title or name field is numbered on each
+    copy. Of those links, the ones as deep as the recipe URL are fanned out, which leaves
+    out menu links to categories.
+    """
+    with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    sites = []
+    for name, urls in manifest.items():
+        pages = {}
+        for page in ("listing", "recipe", "index", "golden"):
+            extension = "json" if page == "golden" else "html"
+            path = os.path.join(directory, name, f"{page}.{extension}")
+            if page == "index" and "index" not in urls:
+                continue
+            with open(path, encoding="utf-8") as f:
+                pages[page] = f.read()
+        golden = json.loads(pages["golden"])
+        depth = len(urlsplit(urls["recipe"]).path.strip("/").split("/"))
+        links = [link for link in golden.get("recipe_links_on_page") or golden.get("article_links") or []
+                 if len(urlsplit(link).path.strip("/").split("/")) == depth]
+        record = next((value for value in golden.values() if isinstance(value, dict)), {})
+        title = next((value for key, value in record.items() if isinstance(value, str) and value
+                      and ("title" in key.lower() or "name" in key.lower())), None)
+        sites.append(ReplaySite(name, urls["listing"], pages["listing"], links, pages["recipe"], title,
+                                urls.get("index"), pages.get("index")))
+    return sites
+
+
+class ReplayServer:
+    """Serves `sites` at http://<host>:<port>/<site host>/<path>, with injected latency and errors.
+
+    Each response waits `latency` seconds plus an exponential delay averaging `jitter`
+    (the long tail), then `throttle_rate` of them are 429 with Retry-After and
+    `error_rate` 503. /__stats gives the counts of what was served.
+    """
+
+    def __init__(self, sites, per_listing=500, max_recipes=None, latency=0.0, jitter=0.0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=1, seed=0):
+        self.by_host = {host: site for site in sites for host in site.hosts}
+        self.per_listing = per_listing
+        self.max_recipes = max_recipes
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "recipes": 0, "listings": 0, "throttled": 0, "errors": 0, "not_found": 0}
+        self.runner = None
+        self.port = None
+
+    async def handle(self, request):
+        if request.path == "/__stats":
+            return web.json_response(self.stats)
+        self.stats["requests"] += 1
+        host, _, path = request.path_qs[1:].partition("/")
+        site = self.by_host.get(host)
+        if site is None:
+            self.stats["not_found"] += 1
+            return web.Response(status=404, text=f"No snapshot of {host}")
+        if path == "robots.txt":
+            return web.Response(text="User-agent: *\nDisallow: /wp-admin/\n")
+
+        delay = self.latency + (self.random.expovariate(1 / self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            self.stats["throttled"] += 1
+            return web.Response(status=429, headers={"Retry-After": str(self.retry_after)})
+        if roll < self.throttle_rate + self.error_rate:
+            self.stats["errors"] += 1
+            return web.Response(status=503)
+
+        url = f"https://{host}/{path}"
+        recipe_id = RECIPE_ID.search(urlsplit(url).path)
+        if recipe_id:
+            self.stats["recipes"] += 1
+            return web.Response(text=site.recipe(int(recipe_id.group(1))), content_type="text/html")
+        if site.is_index(url):
+            self.stats["listings"] += 1
+            return web.Response(text=site.index_html, content_type="text/html")
+        html = site.listing(*split_listing_url(url), self.per_listing, self.max_recipes)
+        if html is None:
+            self.stats["not_found"] += 1
+            return web.Response(status=404)
+        self.stats["listings"] += 1
+        return web.Response(text=html, content_type="text/html")
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Starts serving; returns the base URL to pass as FetchEngine(replay=...)."""
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800, help="0 picks a free port")
+    parser.add_argument("--fixtures", default=FIXTURES, help="directory of saved pages (as benchmarks/fixtures)")
+    parser.add_argument("--per-listing", type=int, default=500, help="recipes in each category listing")
+    parser.add_argument("--max-recipes", type=int, help="recipes per site at most, over all its listings")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="mean of a further exponential delay, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of responses that are 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of responses that are 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After of the 429s, in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = ReplayServer(load_fixtures(args.fixtures), per_listing=args.per_listing, max_recipes=args.max_recipes,
+                          latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          throttle_rate=args.throttle_rate, retry_after=args.retry_after, seed=args.seed)
+
+    async def serve():
+        url = await server.start(args.host, args.port)
+        print(f"Replaying {len(set(server.by_host.values()))} sites at {url}", flush=True)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
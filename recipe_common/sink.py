@@ -0,0 +1,146 @@
+import csv
+import json
+import os
+import time
+
+
+class RecordSink:
+    """Appends scraped records to an output file in batches as they arrive.
+
+    Records whose `key_fields` values were already written are dropped, and the buffer
+    is flushed every `batch_size` records or `flush_interval` seconds, so memory stays
+    flat however long the crawl runs. Subclasses implement _write_batch() and _close().
+    """
+
+    def __init__(self, path, key_fields=None, batch_size=500, flush_interval=30.0):
+        self.path = path
+        self.key_fields = tuple(key_fields or ())
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.count = 0
+        self.duplicates = 0
+        self._seen = set()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def write(self, record):
+        """Buffers one record; returns False if it was a duplicate."""
+        if self.key_fields:
+            key = hash(tuple(str(record.get(field)) for field in self.key_fields))
+            if key in self._seen:
+                self.duplicates += 1
+                return False
+            self._seen.add(key)
+        self._buffer.append(record)
+        self.count += 1
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return True
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_batch(self, records):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+class CsvSink(RecordSink):
+    """CSV output; the columns are taken from the first record (later extra keys are ignored)."""
+
+    def __init__(self, path, **options):
+        super().__init__(path, **options)
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = None
+
+    def _write_batch(self, records):
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, fieldnames=list(records[0]), extrasaction="ignore")
+            self._writer.writeheader()
+        self._writer.writerows(records)
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class JsonLinesSink(RecordSink):
+    """One JSON object per line; nested values (lists, dicts) are kept as JSON."""
+
+    def __init__(self, path, **options):
+        super().__init__(path, **options)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def _write_batch(self, records):
+        self._file.writelines(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class ParquetSink(RecordSink):
+    """Parquet output with one row group per flushed batch (requires pyarrow).
+
+    Scrapers mix ints, "N/A" strings, lists and dicts in the same column, so every value
+    is stored as a string (lists and dicts as JSON); the columns come from the first record.
+    """
+
+    def __init__(self, path, **options):
+        import pyarrow  # optional dependency, only needed for .parquet output
+        import pyarrow.parquet
+
+        super().__init__(path, **options)
+        self._pa = pyarrow
+        self._writer_cls = pyarrow.parquet.ParquetWriter
+        self._writer = None
+        self._schema = None
+
+    def _write_batch(self, records):
+        if self._writer is None:
+            self._schema = self._pa.schema([(name, self._pa.string()) for name in records[0]])
+            self._writer = self._writer_cls(self.path, self._schema)
+        columns = {name: [_as_text(record.get(name)) for record in records] for name in self._schema.names}
+        self._writer.write_table(self._pa.table(columns, schema=self._schema))
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _as_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return str(value)
+
+
+SINKS = {".csv": CsvSink, ".jsonl": JsonLinesSink, ".parquet": ParquetSink}
+
+
+def open_sink(path, **options):
+    """Opens the sink matching the file extension (.csv, .jsonl or .parquet)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS:
+        raise ValueError(f"Unsupported output format {extension!r}; use one of {', '.join(SINKS)}")
+    return SINKS[extension](path, **options)
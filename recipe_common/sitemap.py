@@ -0,0 +1,126 @@
+import asyncio
+import re
+import zlib
+from datetime import datetime, timezone
+from urllib.parse import urljoin
+from xml.etree.ElementTree import ParseError, XMLPullParser
+
+import aiohttp
+
+from recipe_common.fetch import CircuitOpenError
+
+# Sitemap files WordPress sites commonly publish (core, Yoast / Rank Math)
+INDEX_CANDIDATES = ("wp-sitemap.xml", "sitemap_index.xml", "sitemap.xml")
+
+# Child sitemaps that list posts (recipes); pages, categories, tags and authors are skipped
+POST_SITEMAP = re.compile(r"(wp-sitemap-posts-post-\d+|post-sitemap\d*)\.xml(\.gz)?$")
+
+
+def is_post_sitemap(url):
+    return bool(POST_SITEMAP.search(url.split("?", 1)[0]))
+
+
+def parse_lastmod(value):
+    """Parses a W3C datetime (`2024-05-01`, `2024-05-01T10:00:00+00:00`) into an aware datetime."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+async def iter_sitemap(engine, sitemap_url, child_filter=is_post_sitemap):
+    """Streams one sitemap, yielding ("url" | "sitemap", loc, lastmod) entries as they are parsed.
+
+    The body is fed chunk by chunk into an incremental XML parser and every finished
+    element is cleared, so memory stays flat however large the sitemap is.
+    """
+    parser = XMLPullParser(events=("end",))
+    inflate = None
+    first = True
+    loc = lastmod = None
+
+    async for chunk in engine.stream(sitemap_url):
+        # .xml.gz files arrive gzipped unless the server also set Content-Encoding
+        if first and chunk[:2] == b"\x1f\x8b":
+            inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        first = False
+        if inflate is not None:
+            chunk = inflate.decompress(chunk)
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            name = _local_name(element.tag)
+            # Only the first <loc>/<lastmod> of an entry counts; image:loc children come later
+            if name == "loc" and loc is None:
+                loc = (element.text or "").strip()
+            elif name == "lastmod" and lastmod is None:
+                lastmod = (element.text or "").strip()
+            elif name in ("url", "sitemap"):
+                if loc and (name == "url" or child_filter is None or child_filter(loc)):
+                    yield name, loc, lastmod
+                loc = lastmod = None
+                element.clear()
+    parser.close()
+
+
+async def iter_sitemap_urls(engine, sitemap_url, child_filter=is_post_sitemap, since=None):
+    """Yields (url, lastmod) for every page in a sitemap, following index files into child sitemaps.
+
+    With `since` (a datetime), pages whose lastmod is older are skipped, so a rerun only
+    sees recipes that changed since the previous crawl.
+    """
+    pending = [sitemap_url]
+    while pending:
+        current = pending.pop(0)
+        async for kind, loc, lastmod in iter_sitemap(engine, current, child_filter):
+            if kind == "sitemap":
+                pending.append(urljoin(current, loc))
+                continue
+            modified = parse_lastmod(lastmod)
+            if since is not None and modified is not None and modified < since:
+                continue
+            yield loc, modified
+
+
+async def find_sitemap(engine, site_url):
+    """Returns the site's sitemap URL, from robots.txt `Sitemap:` lines or the usual WordPress paths."""
+    robots = await engine.fetch_or_error(urljoin(site_url, "/robots.txt"))
+    if robots.status == 200:
+        for line in robots.text.splitlines():
+            if line.lower().startswith("sitemap:"):
+                return line.split(":", 1)[1].strip()
+
+    for candidate in INDEX_CANDIDATES:
+        url = urljoin(site_url, "/" + candidate)
+        response = await engine.fetch_or_error(url)
+        if response.status == 200 and b"<" in response.body[:512]:
+            return url
+    return None
+
+
+async def discover_sitemap_urls(engine, site_url, child_filter=is_post_sitemap, since=None):
+    """Returns ([(url, lastmod)], complete) for the posts listed in the site's sitemaps.
+
+    `complete` is False if no sitemap was found or reading one failed partway; the
+    entries read until then are still returned, but the sitemap should not be recorded
+    as discovered, so that a rerun reads it again.
+    """
+    sitemap_url = await find_sitemap(engine, site_url)
+    if sitemap_url is None:
+        print(f"No sitemap found for {site_url}")
+        return [], False
+    print(f"Reading sitemap: {sitemap_url}")
+    entries = []
+    try:
+        async for entry in iter_sitemap_urls(engine, sitemap_url, child_filter, since):
+            entries.append(entry)
+    except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError, ParseError, zlib.error) as e:
+        print(f"Failed to read sitemap {sitemap_url} after {len(entries)} posts: {str(e) or type(e).__name__}")
+        return entries, False
+    return entries, True
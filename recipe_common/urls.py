@@ -0,0 +1,74 @@
+import hashlib
+import math
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from; the page is the same without them
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga", "igshid"}
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+
+def canonical_url(url):
+    """The form of `url` that is fetched and stored.
+
+    https instead of http, lower-case host without the default port, no fragment, no
+    utm_* or other tracking parameters and the remaining ones sorted. The path is kept as
+    it is, trailing slash included, since some sites (15gram.be) have none and others
+    redirect when it is missing.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme == "http":
+        scheme = "https"
+    host = (parts.hostname or "").lower()
+    if parts.port is not None and str(parts.port) not in DEFAULT_PORTS.values():
+        host = f"{host}:{parts.port}"
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not name.lower().startswith("utm_") and name.lower() not in TRACKING_PARAMS)
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+def url_key(url):
+    """What two URLs must share to be the same page: canonical_url() without a trailing slash."""
+    url = canonical_url(url)
+    parts = urlsplit(url)
+    if parts.path != "/" and parts.path.endswith("/"):
+        return urlunsplit(parts._replace(path=parts.path.rstrip("/")))
+    return url
+
+
+class BloomFilter:
+    """A seen-set in a fixed bit array, for crawls too large to keep every URL in memory.
+
+    Sized for `capacity` items at a false-positive rate of `error_rate` (about 1.8 bytes
+    per item at 0.1%). There are no false negatives, so nothing is ever fetched twice; a
+    false positive makes a new item look seen, so about `error_rate` of the new URLs are
+    skipped. Supports `in`, add() and len() like the set it replaces.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Two 64-bit halves of one digest give all the hash functions (Kirsch-Mitzenmacher)
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def add(self, item):
+        new = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                new = True
+        self.count += new
+        return new
+
+    def __len__(self):
+        return self.count